@@ -1,26 +1,64 @@
+import hashlib
 import os
+import threading
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import httpx
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain_community.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from django.conf import settings
 import chromadb
 from chromadb.config import Settings as ChromaSettings
+from embedding_engine import get_embedding_engine
+from chain_cache import ChainCache
+from langchain_core.messages import SystemMessage
+from sessions import (
+    SessionStore, SqlSessionSpill, pack_history, llm_summarizer, session_key,
+    SESSION_HISTORY_TOKENS, SESSION_SPILL, SESSION_SUMMARIZE,
+)
+from token_count import count_tokens
+from metering import get_usage_meter
+from db import SessionLocal
+from llm_backends import LLMBackend, SamplingParams, create_backend
+from prompt_assembler import AssembledRetriever, PromptAssembler, get_reranker, model_window, retrieval_k
+
+AI_CHAIN_CACHE_SIZE = int(os.getenv("AI_CHAIN_CACHE_SIZE", "500"))
+# One connection pool for every bot's LLM calls, so TLS sessions are reused
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL", "gpt-4o-mini")
+DEFAULT_CHAT_MODEL = os.getenv("DEFAULT_CHAT_MODEL", "gpt-3.5-turbo")
+# openai, or fake for load tests without API calls; the local backends (hf, onnx, ...) also work
+AI_LLM_BACKEND = os.getenv("AI_LLM_BACKEND", "openai")
+# Chunks retrieved per question before the assembler dedupes and budgets them
+AI_RETRIEVAL_K = int(os.getenv("AI_RETRIEVAL_K", "4"))
+# Tokens held back for the visitor's question when sizing the context
+QUESTION_TOKENS = 256
+
+CHAT_TEMPLATE = """You are {bot_name}, a helpful AI assistant for {website_url}.
+Use the following context to answer the user's question. If you don't know the answer based on the context, say so politely.
+
+Context: {context}
+
+Chat History: {chat_history}
+
+User: {question}
+Assistant:"""
+
+
+def chain_config_version(chatbot) -> str:
+    """Changes whenever a setting baked into the compiled chain changes"""
+    config = (chatbot.model_name, chatbot.temperature, chatbot.max_tokens, chatbot.bot_name, chatbot.website_url)
+    return hashlib.sha256(repr(config).encode("utf-8")).hexdigest()[:16]
 
 
 class AIService:
     """Service for handling AI operations including embeddings and chat"""
     
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
-        )
+        self.embeddings = get_embedding_engine()
         
         self.chroma_client = chromadb.Client(ChromaSettings(
             persist_directory=str(settings.CHROMA_PERSIST_DIRECTORY),
@@ -32,6 +70,27 @@ class AIService:
             chunk_overlap=200,
             length_function=len,
         )
+        
+        # Compiled chains by chatbot id; values are (config version, chain)
+        self.chains = ChainCache(max_entries=AI_CHAIN_CACHE_SIZE, sizeof=lambda entry: 0)
+        self._http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+            timeout=OPENAI_TIMEOUT,
+        )
+        self._llms: Dict[Tuple, LLMBackend] = {}
+        self._llm_lock = threading.Lock()
+        
+        summarizer = None
+        if SESSION_SUMMARIZE:
+            summary_llm = self.get_llm(SESSION_SUMMARY_MODEL, 0, 200)
+            summarizer = llm_summarizer(
+                summary_llm.generate,
+                count=lambda text: count_tokens(text, SESSION_SUMMARY_MODEL)
+            )
+        self.sessions = SessionStore(
+            spill=SqlSessionSpill(SessionLocal) if SESSION_SPILL else None,
+            summarizer=summarizer
+        )
     
     def get_collection_name(self, chatbot_id: str) -> str:
         """Generate collection name for chatbot"""
@@ -66,6 +125,8 @@ class AIService:
                 name=collection_name,
                 metadata={"chatbot_id": str(chatbot_id)}
             )
+            # Cached chains hold the deleted collection
+            self.chains.invalidate(str(chatbot_id))
             
             # Add documents to collection
             if all_chunks:
@@ -84,6 +145,38 @@ class AIService:
             print(f"Error creating embeddings: {str(e)}")
             return False
     
+    def refresh_embeddings(self, chatbot_id: str, texts: List[str], metadatas: List[Dict] = None) -> Dict[str, int]:
+        """Update a collection in place: embed only new chunks and delete ones no longer present"""
+        collection = self.chroma_client.get_or_create_collection(
+            name=self.get_collection_name(chatbot_id),
+            metadata={"chatbot_id": str(chatbot_id)}
+        )
+        
+        # Content-addressed ids make unchanged chunks match across refreshes
+        wanted = {}
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            for chunk in self.text_splitter.split_text(text):
+                doc_id = "doc_" + hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+                wanted.setdefault(doc_id, (chunk, metadata))
+        
+        existing = set(collection.get(include=[])["ids"])
+        stale = [doc_id for doc_id in existing if doc_id not in wanted]
+        added = [doc_id for doc_id in wanted if doc_id not in existing]
+        
+        if stale:
+            collection.delete(ids=stale)
+        if added:
+            chunks = [wanted[doc_id][0] for doc_id in added]
+            collection.add(
+                embeddings=self.embeddings.embed_documents(chunks),
+                documents=chunks,
+                metadatas=[wanted[doc_id][1] for doc_id in added],
+                ids=added
+            )
+        
+        return {"added": len(added), "removed": len(stale), "kept": len(wanted) - len(added)}
+    
     def get_vectorstore(self, chatbot_id: str):
         """Get vectorstore for chatbot"""
         collection_name = self.get_collection_name(chatbot_id)
@@ -96,33 +189,40 @@ class AIService:
         
         return vectorstore
     
+    def get_llm(self, model_name: str, temperature: float, max_tokens: int) -> LLMBackend:
+        """LLM backend per model setting; OpenAI clients share one HTTP connection pool"""
+        key = (model_name, temperature, max_tokens)
+        with self._llm_lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = self._llms[key] = create_backend(
+                    AI_LLM_BACKEND,
+                    model_name,
+                    SamplingParams(max_new_tokens=max_tokens, temperature=temperature),
+                    http_client=self._http_client,
+                    api_key=settings.OPENAI_API_KEY
+                )
+            return llm
+    
+    def context_budget(self, chatbot) -> int:
+        """Tokens the retrieved context may use: the window minus answer, template, history and question"""
+        model = chatbot.model_name
+        template = CHAT_TEMPLATE.format(
+            bot_name=chatbot.bot_name, website_url=chatbot.website_url, context="", chat_history="", question=""
+        )
+        return (model_window(model) - chatbot.max_tokens - count_tokens(template, model)
+                - SESSION_HISTORY_TOKENS - QUESTION_TOKENS)
+    
     def create_chat_chain(self, chatbot):
-        """Create conversational chain for chatbot"""
+        """Create conversational chain for chatbot; history is passed per call, not stored in the chain"""
         
         # Get vectorstore
         vectorstore = self.get_vectorstore(str(chatbot.id))
         
-        # Create LLM
-        llm = ChatOpenAI(
-            model_name=chatbot.model_name,
-            temperature=chatbot.temperature,
-            max_tokens=chatbot.max_tokens,
-            openai_api_key=settings.OPENAI_API_KEY
-        )
-        
-        # Custom prompt template
-        template = """You are {bot_name}, a helpful AI assistant for {website_url}.
-Use the following context to answer the user's question. If you don't know the answer based on the context, say so politely.
-
-Context: {context}
-
-Chat History: {chat_history}
-
-User: {question}
-Assistant:"""
+        llm = self.get_llm(chatbot.model_name, chatbot.temperature, chatbot.max_tokens).as_langchain()
         
         prompt = PromptTemplate(
-            template=template,
+            template=CHAT_TEMPLATE,
             input_variables=["context", "chat_history", "question"],
             partial_variables={
                 "bot_name": chatbot.bot_name,
@@ -130,18 +230,21 @@ Assistant:"""
             }
         )
         
-        # Create memory
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="answer"
+        # The 1000/200 splitter repeats text between neighbouring chunks; the assembler drops it
+        retriever = AssembledRetriever(
+            retriever=vectorstore.as_retriever(search_kwargs={"k": retrieval_k(AI_RETRIEVAL_K)}),
+            assembler=PromptAssembler(
+                count=lambda text: count_tokens(text, chatbot.model_name),
+                reranker=get_reranker(),
+                max_chunks=AI_RETRIEVAL_K
+            ),
+            budget=self.context_budget(chatbot)
         )
         
         # Create conversational chain
         chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 4}),
-            memory=memory,
+            retriever=retriever,
             combine_docs_chain_kwargs={"prompt": prompt},
             return_source_documents=True,
             verbose=False
@@ -149,17 +252,50 @@ Assistant:"""
         
         return chain
     
-    def get_response(self, chatbot, message: str, chat_history: List[tuple] = None) -> Dict[str, Any]:
-        """Get AI response for user message"""
+    def get_chat_chain(self, chatbot):
+        """Cached chain for a chatbot, rebuilt when its model or prompt settings change"""
+        key = str(chatbot.id)
+        version = chain_config_version(chatbot)
+        entry = self.chains.get(key)
+        if entry is None or entry[0] != version:
+            entry = (version, self.create_chat_chain(chatbot))
+            self.chains.put(key, entry)
+        return entry[1]
+    
+    def get_response(self, chatbot, message: str, chat_history: List[tuple] = None,
+                     session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get AI response for user message.
+        
+        History comes from chat_history when given, otherwise from the session store
+        under session_id; answers are appended to that session.
+        """
         start_time = time.time()
+        tier = getattr(getattr(chatbot, "user", None), "subscription_tier", None) or "free"
+        meter = get_usage_meter()
+        if not meter.allow(str(chatbot.id), tier):
+            return {
+                "response": "This chatbot has reached its daily usage limit. Please try again tomorrow.",
+                "source_documents": [],
+                "response_time": time.time() - start_time,
+                "success": False,
+                "error": "quota_exceeded"
+            }
         
         try:
-            # Create chat chain
-            chain = self.create_chat_chain(chatbot)
+            chain = self.get_chat_chain(chatbot)
             
-            # Prepare chat history
+            # Prepare chat history: stored sessions are packed under the token budget
+            key = session_key(str(chatbot.id), session_id) if session_id else None
             if chat_history is None:
                 chat_history = []
+                if key:
+                    summary, turns = pack_history(
+                        *self.sessions.get(key),
+                        count=lambda text: self.estimate_tokens(text, chatbot.model_name)
+                    )
+                    chat_history = list(turns)
+                    if summary:
+                        chat_history.insert(0, SystemMessage(content=f"Summary of earlier conversation: {summary}"))
             
             # Get response
             result = chain({
@@ -167,6 +303,12 @@ Assistant:"""
                 "chat_history": chat_history
             })
             
+            if key:
+                self.sessions.append(key, message, result["answer"])
+            
+            # Counts the answer prompt; the follow-up question rewrite call is not metered
+            self.record_usage(chatbot, tier, message, chat_history, result)
+            
             response_time = time.time() - start_time
             
             return {
@@ -186,10 +328,30 @@ Assistant:"""
                 "error": str(e)
             }
     
-    def estimate_tokens(self, text: str) -> int:
-        """Estimate token count for text"""
-        # Rough estimation: ~4 characters per token
-        return len(text) // 4
+    def record_usage(self, chatbot, tier: str, message: str, chat_history: List, result: Dict[str, Any]) -> None:
+        """Meter one answer with the bot model's tokenizer"""
+        model = chatbot.model_name
+        history_text = "\n".join(
+            f"{t[0]}\n{t[1]}" if isinstance(t, tuple) else t.content for t in chat_history
+        )
+        context = "\n\n".join(d.page_content for d in result.get("source_documents", []))
+        prompt = CHAT_TEMPLATE.format(
+            bot_name=chatbot.bot_name,
+            website_url=chatbot.website_url,
+            context=context,
+            chat_history=history_text,
+            question=message
+        )
+        get_usage_meter().record(
+            str(chatbot.id), tier,
+            prompt_tokens=count_tokens(prompt, model),
+            completion_tokens=count_tokens(result["answer"], model),
+            context_tokens=count_tokens(context, model)
+        )
+    
+    def estimate_tokens(self, text: str, model_name: Optional[str] = None) -> int:
+        """Token count for text with the model's own tokenizer (tiktoken for OpenAI models)"""
+        return count_tokens(text, model_name or DEFAULT_CHAT_MODEL)
 
 
 # Global instance
@@ -0,0 +1,165 @@
+# backend/answer_cache.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_PER_BOT = int(os.getenv("ANSWER_CACHE_MAX_PER_BOT", "256"))
+ANSWER_CACHE_MAX_BOTS = int(os.getenv("ANSWER_CACHE_MAX_BOTS", "1000"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _SPACE.sub(" ", _PUNCT.sub(" ", text.lower())).strip()
+
+
+class _BotAnswers:
+    """Answers for one chatbot: an exact-text tier and a matrix of unit query vectors"""
+
+    def __init__(self, version: Any = None):
+        self.version = version
+        self.exact: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (answer, created)
+        self.keys: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+
+    def rebuild_matrix(self, vectors: Dict[str, np.ndarray]) -> None:
+        self.keys = [k for k in self.exact if k in vectors]
+        self.matrix = np.vstack([vectors[k] for k in self.keys]) if self.keys else None
+
+
+class AnswerCache:
+    """Per-chatbot answer cache with exact and semantic (cosine similarity) tiers.
+
+    Each chatbot's answers are tagged with the index version they were generated from;
+    a lookup with another version forgets them, which is how syncs in other processes
+    reach this one.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_per_bot: int = ANSWER_CACHE_MAX_PER_BOT,
+        max_bots: int = ANSWER_CACHE_MAX_BOTS,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ):
+        self.ttl = ttl
+        self.max_per_bot = max_per_bot
+        self.max_bots = max_bots
+        self.threshold = threshold
+        self._bots: "OrderedDict[str, _BotAnswers]" = OrderedDict()
+        self._vectors: Dict[str, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fresh(self, created: float) -> bool:
+        return time.time() - created < self.ttl
+
+    def _current(self, bot_key: str, version: Any) -> Optional[_BotAnswers]:
+        """The bot's answers if they match version; called with the lock held"""
+        bot = self._bots.get(bot_key)
+        if bot is not None and bot.version != version:
+            del self._bots[bot_key]
+            self._vectors.pop(bot_key, None)
+            self.invalidations += 1
+            return None
+        return bot
+
+    def get_exact(self, bot_key: str, question: str, version: Any = None) -> Optional[str]:
+        key = normalize_question(question)
+        with self._lock:
+            bot = self._current(bot_key, version)
+            item = bot.exact.get(key) if bot else None
+            if item and self._fresh(item[1]):
+                bot.exact.move_to_end(key)
+                self._bots.move_to_end(bot_key)
+                self.exact_hits += 1
+                return item[0]
+            return None
+
+    def get_semantic(self, bot_key: str, vector: Sequence[float], version: Any = None) -> Optional[str]:
+        """Closest cached question above the similarity threshold; counts a miss otherwise"""
+        query = _unit(vector)
+        with self._lock:
+            bot = self._current(bot_key, version)
+            if bot and bot.matrix is not None:
+                scores = bot.matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    item = bot.exact.get(bot.keys[best])
+                    if item and self._fresh(item[1]):
+                        self.semantic_hits += 1
+                        return item[0]
+            self.misses += 1
+            return None
+
+    def put(self, bot_key: str, question: str, vector: Optional[Sequence[float]], answer: str,
+            version: Any = None) -> None:
+        """Store an answer generated from the index at version; answers from an older index are dropped"""
+        key = normalize_question(question)
+        with self._lock:
+            bot = self._bots.get(bot_key)
+            if bot is not None and bot.version != version:
+                return
+            if bot is None:
+                bot = self._bots[bot_key] = _BotAnswers(version)
+                self._vectors[bot_key] = {}
+                while len(self._bots) > self.max_bots:
+                    old_key, _ = self._bots.popitem(last=False)
+                    self._vectors.pop(old_key, None)
+            self._bots.move_to_end(bot_key)
+
+            vectors = self._vectors[bot_key]
+            bot.exact[key] = (answer, time.time())
+            bot.exact.move_to_end(key)
+            if vector is not None:
+                vectors[key] = _unit(vector)
+
+            # Drop expired entries first, then least recently used ones
+            for k in [k for k, (_, created) in bot.exact.items() if not self._fresh(created)]:
+                del bot.exact[k]
+                vectors.pop(k, None)
+            while len(bot.exact) > self.max_per_bot:
+                k, _ = bot.exact.popitem(last=False)
+                vectors.pop(k, None)
+            bot.rebuild_matrix(vectors)
+
+    def invalidate(self, bot_key: str) -> None:
+        """Forget every answer for a chatbot, e.g. after its training data is rebuilt"""
+        with self._lock:
+            if self._bots.pop(bot_key, None) is not None:
+                self.invalidations += 1
+            self._vectors.pop(bot_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "bots": len(self._bots),
+                "entries": sum(len(b.exact) for b in self._bots.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+            }
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
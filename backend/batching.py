@@ -0,0 +1,129 @@
+# backend/batching.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.llms import LLM
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "10"))
+
+
+class GenerationBatcher:
+    """Collects prompts from concurrent requests and runs them through an LLM backend as one padded batch"""
+
+    def __init__(self, backend, max_batch: int = BATCH_MAX_SIZE, window_ms: float = BATCH_WINDOW_MS):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.batches = 0
+        self.prompts = 0
+        self.max_seen = 0
+        self.restart()
+
+    def restart(self) -> None:
+        """Fresh queue, lock and worker thread, e.g. in a forked child where the parent's thread doesn't exist"""
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, prefixes: Sequence[str] = ()) -> Future:
+        future: Future = Future()
+        self._queue.put((prompt, prefixes, future))
+        return future
+
+    def generate(self, prompt: str, prefixes: Sequence[str] = ()) -> str:
+        """Blocking helper for callers already running off the event loop"""
+        return self.submit(prompt, prefixes).result()
+
+    def _collect(self) -> List[tuple]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            prompts = [p for p, _, _ in batch]
+            try:
+                outputs = self.backend.batch(prompts, [prefixes for _, prefixes, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][2].set_exception(e)
+                else:
+                    # Rerun one at a time so only the prompt that broke the batch fails
+                    self._run_each(batch)
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.prompts += len(prompts)
+                self.max_seen = max(self.max_seen, len(prompts))
+            for (_, _, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def _run_each(self, batch: List[tuple]) -> None:
+        for prompt, prefixes, future in batch:
+            try:
+                output = self.backend.batch([prompt], [prefixes])[0]
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            with self._lock:
+                self.batches += 1
+                self.prompts += 1
+            future.set_result(output)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "window_ms": self.window * 1000,
+                "batches": self.batches,
+                "prompts": self.prompts,
+                "avg_batch_size": self.prompts / self.batches if self.batches else 0.0,
+                "max_batch_seen": self.max_seen,
+                "queued": self._queue.qsize(),
+            }
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+class BatchedLLM(LLM):
+    """LangChain LLM that routes generation through a shared GenerationBatcher"""
+
+    batcher: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"batched_{self.batcher.backend.name}"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        text = self.batcher.generate(prompt)
+        if stop:
+            for token in stop:
+                text = text.split(token)[0]
+        return text
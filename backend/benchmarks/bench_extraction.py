@@ -0,0 +1,113 @@
+# backend/benchmarks/bench_extraction.py
+"""Compare HTML extractors on a corpus of saved pages.
+
+Usage: python benchmarks/bench_extraction.py CORPUS_DIR [--repeat N]
+
+CORPUS_DIR holds *.html files. A page.txt next to page.html is treated as the
+hand-cleaned main content and used for token precision/recall. Without it, quality
+is reported as boilerplate leakage: the share of nav/header/footer/aside lines
+from the raw page that show up in the extracted text (lower is better).
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractor import EXTRACTORS, get_extractor  # noqa: E402
+
+_TOKEN = re.compile(r"\w+")
+
+
+def load_corpus(path):
+    pages = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith((".html", ".htm")):
+            continue
+        with open(os.path.join(path, name), encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        gold = None
+        gold_path = os.path.join(path, os.path.splitext(name)[0] + ".txt")
+        if os.path.exists(gold_path):
+            with open(gold_path, encoding="utf-8") as f:
+                gold = f.read()
+        pages.append((name, html, gold))
+    return pages
+
+
+def boilerplate_lines(html):
+    """Text lines inside page chrome, found with lxml on the untouched page"""
+    from lxml import html as lxml_html
+
+    try:
+        root = lxml_html.document_fromstring(html.encode("utf-8"))
+    except Exception:
+        return []
+    lines = []
+    for el in root.xpath("//nav | //header | //footer | //aside"):
+        for line in el.text_content().splitlines():
+            line = " ".join(line.split())
+            if len(line) >= 15:
+                lines.append(line)
+    return lines
+
+
+def token_prf(extracted, gold):
+    got, want = Counter(_TOKEN.findall(extracted.lower())), Counter(_TOKEN.findall(gold.lower()))
+    overlap = sum((got & want).values())
+    precision = overlap / sum(got.values()) if got else 0.0
+    recall = overlap / sum(want.values()) if want else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def run(corpus, repeat):
+    chrome = {name: boilerplate_lines(html) for name, html, _ in corpus}
+    print(f"{len(corpus)} pages, {sum(len(h) for _, h, _ in corpus) / 1e6:.1f} MB, repeat={repeat}\n")
+    print(f"{'extractor':<10} {'pages/s':>9} {'avg chars':>10} {'leakage':>8} {'P':>6} {'R':>6} {'F1':>6}")
+
+    for name in EXTRACTORS:
+        extractor = get_extractor(name)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs = [extractor.extract(html).text for _, html, _ in corpus]
+        elapsed = time.perf_counter() - start
+        pages_per_sec = len(corpus) * repeat / elapsed if elapsed else float("inf")
+
+        leaked = total = 0
+        prf = []
+        for (page, _, gold), text in zip(corpus, outputs):
+            flat = " ".join(text.split())
+            lines = chrome[page]
+            total += len(lines)
+            leaked += sum(1 for line in lines if line in flat)
+            if gold is not None:
+                prf.append(token_prf(text, gold))
+
+        leakage = leaked / total if total else 0.0
+        avg_chars = sum(len(t) for t in outputs) / len(outputs) if outputs else 0
+        if prf:
+            p, r, f = (sum(x[i] for x in prf) / len(prf) for i in range(3))
+            quality = f"{p:>6.2f} {r:>6.2f} {f:>6.2f}"
+        else:
+            quality = f"{'-':>6} {'-':>6} {'-':>6}"
+        print(f"{name:<10} {pages_per_sec:>9.1f} {avg_chars:>10.0f} {leakage:>8.2%} {quality}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No .html files found in {args.corpus}")
+    run(corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# backend/benchmarks/bench_llm_backends.py
+"""Tokens/sec and latency of the local LLM backends against the old transformers pipeline.
+
+Usage: python benchmarks/bench_llm_backends.py [--backends pipeline,hf,hf-int8,onnx,onnx-int8]
+                                               [--requests 30] [--batch 8] [--threads N]
+
+Prompts follow the /api/chat template with ~400 tokens of context. For each backend:
+  p50/p99     - latency of a single generate() call
+  tok/s       - generated tokens per second over those calls
+  ttft        - time to the first streamed delta
+  ttft prefix - the same, passing the template and context prefixes; contexts repeat
+                across prompts, so backends with a prefix KV cache only prefill the question
+  batch tok/s - throughput of batch() with --batch prompts at once
+Greedy decoding is used, so every backend produces comparable lengths.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_backends import LLM_MODEL, HFBackend, SamplingParams, create_backend  # noqa: E402
+
+TEMPLATE = """Use the following context to answer the question. If you don't know the answer, just say you don't know.
+
+Context: {context}
+
+Question: {question}
+
+Answer:"""
+
+WORDS = ("shipping order refund warranty product store support account price delivery "
+         "return policy customer service payment card address email days business").split()
+
+
+def make_prompts(n, contexts=5, seed=0):
+    """(prompt, prefixes) pairs drawing on a few shared contexts"""
+    rng = random.Random(seed)
+    pool = [" ".join(rng.choice(WORDS) for _ in range(300)) for _ in range(contexts)]
+    prefix = TEMPLATE.split("{context}")[0]
+    prompts = []
+    for _ in range(n):
+        context = rng.choice(pool)
+        question = "What is the " + " ".join(rng.sample(WORDS, 3)) + "?"
+        prompts.append((TEMPLATE.format(context=context, question=question), (prefix, prefix + context + "\n\n")))
+    return prompts
+
+
+class PipelineBackend(HFBackend):
+    """The pre-backend setup: a float32 transformers text-generation pipeline"""
+
+    name = "pipeline"
+
+    def __init__(self, model_id, sampling, threads=0):
+        super().__init__(model_id, sampling, threads)
+        from transformers import pipeline
+
+        self.pipe = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, **self._generate_kwargs())
+
+    def batch(self, prompts, prefixes=None):
+        start = time.time()
+        outputs = self.pipe(prompts, batch_size=len(prompts), return_full_text=False)
+        texts = [(o[0] if isinstance(o, list) else o)["generated_text"] for o in outputs]
+        self._record(len(prompts), sum(self.count_tokens(t) for t in texts), time.time() - start)
+        return texts
+
+    def stream(self, prompt, prefixes=()):
+        # What /api/chat/stream used to do: generate() on a thread feeding a TextStreamer
+        import threading
+        from transformers import TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        thread = threading.Thread(target=self.model.generate,
+                                  kwargs=dict(**inputs, streamer=streamer, **self._generate_kwargs()))
+        thread.start()
+        try:
+            yield from streamer
+        finally:
+            thread.join()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def time_to_first_token(backend, prompts, use_prefixes):
+    ttfts = []
+    for prompt, prefixes in prompts:
+        start = time.perf_counter()
+        stream = backend.stream(prompt, prefixes if use_prefixes else ())
+        next(stream, None)
+        ttfts.append(time.perf_counter() - start)
+        stream.close()
+    return percentile(ttfts, 0.5) * 1e3
+
+
+def run(backend, prompts, batch_size):
+    backend.generate(prompts[0][0])  # warm up
+
+    latencies, tokens = [], 0
+    for prompt, _ in prompts:
+        start = time.perf_counter()
+        text = backend.generate(prompt)
+        latencies.append(time.perf_counter() - start)
+        tokens += backend.count_tokens(text)
+
+    ttft = time_to_first_token(backend, prompts[:10], use_prefixes=False)
+    time_to_first_token(backend, prompts[:10], use_prefixes=True)  # fills the prefix cache
+    ttft_prefix = time_to_first_token(backend, prompts[:10], use_prefixes=True)
+
+    batch = [prompt for prompt, _ in prompts[:batch_size]]
+    start = time.perf_counter()
+    texts = backend.batch(batch)
+    batch_time = time.perf_counter() - start
+    batch_tokens = sum(backend.count_tokens(t) for t in texts)
+
+    return {
+        "p50": percentile(latencies, 0.5) * 1e3,
+        "p99": percentile(latencies, 0.99) * 1e3,
+        "tok_s": tokens / sum(latencies),
+        "ttft": ttft,
+        "ttft_prefix": ttft_prefix,
+        "batch_tok_s": batch_tokens / batch_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="pipeline,hf,hf-int8,onnx,onnx-int8")
+    parser.add_argument("--model", default=LLM_MODEL)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    prompts = make_prompts(args.requests)
+    sampling = SamplingParams(max_new_tokens=args.max_new_tokens, temperature=0)
+    print(f"{'backend':<10} {'p50 ms':>8} {'p99 ms':>8} {'tok/s':>7} {'ttft ms':>8} {'prefix ms':>9} {'batch tok/s':>12}")
+    for name in args.backends.split(","):
+        try:
+            if name == "pipeline":
+                backend = PipelineBackend(args.model, sampling, threads=args.threads)
+            else:
+                backend = create_backend(name, args.model, sampling, threads=args.threads)
+        except ImportError as e:
+            print(f"{name:<10} skipped ({e})")
+            continue
+        r = run(backend, prompts, args.batch)
+        print(f"{name:<10} {r['p50']:>8.1f} {r['p99']:>8.1f} {r['tok_s']:>7.1f} "
+              f"{r['ttft']:>8.1f} {r['ttft_prefix']:>9.1f} {r['batch_tok_s']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
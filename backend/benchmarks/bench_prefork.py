@@ -0,0 +1,130 @@
+# backend/benchmarks/bench_prefork.py
+"""Per-worker memory of `uvicorn --workers N` versus prefork.py.
+
+Usage: python benchmarks/bench_prefork.py [--workers 1,4,8] [--api-key KEY] [--requests 20]
+
+Each server is started with every model loaded (MODEL_WARMUP=background for uvicorn,
+always for prefork). Measurement starts once the process tree's RSS stops growing. With
+--api-key, a few chats run first so that the workers have actually run inference.
+
+Per worker, RSS counts every shared page in full and PSS splits shared pages between
+the processes that map them. "total PSS" is the whole tree, master included. It is the
+number to compare against the host's memory.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_startup import BACKEND, free_port, wait_for  # noqa: E402
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm may contain spaces; fields after the closing paren are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory_kb(pid):
+    """{'Rss': kB, 'Pss': kB, ...} from smaps_rollup"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    values[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        pass
+    return values
+
+
+def tree_rss(root):
+    return sum(memory_kb(p).get("Rss", 0) for p in [root] + children(root))
+
+
+def wait_settled(root, deadline, interval=1.0, tolerance=0.01, stable=3):
+    """Wait until the tree's RSS has changed by less than tolerance for `stable` intervals"""
+    last, calm = tree_rss(root), 0
+    while time.perf_counter() < deadline and calm < stable:
+        time.sleep(interval)
+        current = tree_rss(root)
+        calm = calm + 1 if abs(current - last) <= tolerance * max(last, 1) else 0
+        last = current
+
+
+def measure(mode, workers, api_key, requests, timeout):
+    port = free_port()
+    env = dict(os.environ, MODEL_WARMUP="background")
+    if mode == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "prefork.py", "--port", str(port), "--workers", str(workers)]
+        env["LOG_LEVEL"] = "warning"
+    server = subprocess.Popen(cmd, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.perf_counter() + timeout
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            if not wait_for(client, "GET", f"http://127.0.0.1:{port}/readyz", deadline):
+                raise RuntimeError(f"{mode} with {workers} workers never became ready")
+            wait_settled(server.pid, deadline)
+            for i in range(requests if api_key else 0):
+                client.post(f"http://127.0.0.1:{port}/api/chat",
+                            json={"chatbot_api_key": api_key, "message": f"question {i}"})
+        wait_settled(server.pid, deadline)
+        # uvicorn's multiprocessing helpers (resource tracker) are not workers
+        workers_mem = [m for m in (memory_kb(p) for p in children(server.pid)) if m.get("Rss", 0) > 50 * 1024]
+        master = memory_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    n = max(len(workers_mem), 1)
+    mb = lambda kb: kb / 1024
+    return {
+        "workers": len(workers_mem),
+        "rss": mb(sum(m.get("Rss", 0) for m in workers_mem) / n),
+        "pss": mb(sum(m.get("Pss", 0) for m in workers_mem) / n),
+        "private": mb(sum(m.get("Private_Clean", 0) + m.get("Private_Dirty", 0) for m in workers_mem) / n),
+        "total_pss": mb(master.get("Pss", 0) + sum(m.get("Pss", 0) for m in workers_mem)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,4,8")
+    parser.add_argument("--modes", default="uvicorn,prefork")
+    parser.add_argument("--api-key", help="run some chats through the workers before measuring")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("Needs Linux /proc/<pid>/smaps_rollup")
+
+    print(f"{'mode':<8} {'N':>3} {'RSS/wkr':>8} {'PSS/wkr':>8} {'priv/wkr':>8} {'total PSS':>10}  (MB)")
+    for workers in (int(n) for n in args.workers.split(",")):
+        for mode in args.modes.split(","):
+            r = measure(mode, workers, args.api_key, args.requests, args.timeout)
+            print(f"{mode:<8} {r['workers']:>3} {r['rss']:>8.0f} {r['pss']:>8.0f} "
+                  f"{r['private']:>8.0f} {r['total_pss']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# backend/benchmarks/bench_prompt_assembly.py
+"""Context size, answer coverage and latency of prompt assembly against plain top-k stuffing.
+
+Usage: python benchmarks/bench_prompt_assembly.py (--corpus DIR | --api-key KEY) [--budget 700]
+                                                  [--rerank-model cross-encoder/ms-marco-MiniLM-L-6-v2]
+
+Queries are short word spans of a random chunk, as in bench_retrieval. For each setup:
+  tokens    - mean / p95 GPT-2 tokens of the context put in the prompt
+  over      - share of prompts whose context exceeds --budget
+  coverage  - share of prompts whose context still contains the query span
+  overlap   - mean characters of repeated splitter overlap removed per prompt
+  p50/p95   - assembly latency (retrieval excluded; includes the rerank)
+"stuff" joins the top k chunks as /api/chat used to; "assembled" runs the same
+candidates through PromptAssembler; "rerank" fetches --fetch-k and lets the
+cross-encoder pick.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_quantization import load_chunks  # noqa: E402
+from bench_retrieval import build_store  # noqa: E402
+from embedding_engine import EmbeddingEngine  # noqa: E402
+from prompt_assembler import SEPARATOR, CrossEncoderReranker, PromptAssembler  # noqa: E402
+from token_count import count_tokens  # noqa: E402
+
+
+def count(text):
+    return count_tokens(text, "gpt2")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def stuff(query, docs, budget):
+    return SEPARATOR.join(d.page_content for d in docs), 0
+
+
+def assembled(assembler):
+    def run(query, docs, budget):
+        before = assembler.overlap_chars
+        context = assembler.assemble(query, docs, budget)
+        return context.text, assembler.overlap_chars - before
+    return run
+
+
+def run(name, build, candidates, queries, budget):
+    tokens, timings, over, covered, removed = [], [], 0, 0, 0
+    for (query, _), docs in zip(queries, candidates):
+        start = time.perf_counter()
+        text, stripped = build(query, docs, budget)
+        timings.append(time.perf_counter() - start)
+        n = count(text)
+        tokens.append(n)
+        over += n > budget
+        covered += query in " ".join(text.split())
+        removed += stripped
+    n = len(queries)
+    print(f"{name:<16} {sum(tokens) / n:>7.0f} {percentile(tokens, 0.95):>7d} {over / n:>6.1%} "
+          f"{covered / n:>9.1%} {removed / n:>8.0f} {percentile(timings, 0.5) * 1e3:>7.2f} "
+          f"{percentile(timings, 0.95) * 1e3:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="directory of .txt / .html files")
+    source.add_argument("--api-key", help="use the stored chunks of this chatbot")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=700, help="context tokens, e.g. GPT-2's 1024 minus answer and template")
+    parser.add_argument("-k", type=int, default=2)
+    parser.add_argument("--fetch-k", type=int, default=8)
+    parser.add_argument("--rerank-model", default="")
+    args = parser.parse_args()
+
+    chunks = list(dict.fromkeys(load_chunks(args)))
+    if len(chunks) < 2:
+        sys.exit("Need at least two chunks to benchmark")
+
+    rng = random.Random(0)
+    queries = []
+    for chunk in rng.sample(chunks, min(args.num_queries, len(chunks))):
+        words = chunk.split()
+        start = rng.randrange(max(1, len(words) - 10))
+        queries.append((" ".join(words[start:start + 10]), chunk))
+
+    engine = EmbeddingEngine()
+    store = build_store(chunks, engine)
+    fetch_k = max(args.k, args.fetch_k)
+    candidates = [store.similarity_search(q, k=fetch_k) for q, _ in queries]
+    top_k = [docs[:args.k] for docs in candidates]
+    print(f"{len(chunks)} chunks, {len(queries)} queries, budget {args.budget} tokens\n")
+
+    print(f"{'setup':<16} {'tokens':>7} {'p95':>7} {'over':>6} {'coverage':>9} {'overlap':>8} "
+          f"{'p50 ms':>7} {'p95 ms':>7}")
+    run(f"stuff k={args.k}", stuff, top_k, queries, args.budget)
+    run(f"stuff k={fetch_k}", stuff, candidates, queries, args.budget)
+    run(f"assembled k={args.k}", assembled(PromptAssembler(count)), top_k, queries, args.budget)
+    run(f"assembled k={fetch_k}", assembled(PromptAssembler(count)), candidates, queries, args.budget)
+    if args.rerank_model:
+        reranker = CrossEncoderReranker(args.rerank_model)
+        reranker.rerank("warm up", candidates[0])
+        run(f"rerank k={fetch_k}", assembled(PromptAssembler(count, reranker)), candidates, queries, args.budget)
+
+
+if __name__ == "__main__":
+    main()
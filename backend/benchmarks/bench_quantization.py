@@ -0,0 +1,127 @@
+# backend/benchmarks/bench_quantization.py
+"""Recall vs memory of the exact, int8 and PQ index modes on one bot's corpus.
+
+Usage: python benchmarks/bench_quantization.py (--corpus DIR | --api-key KEY) [--queries FILE] [-k K]
+
+--corpus chunks the *.txt / *.html files in DIR the way ingestion does; --api-key
+reuses the chunks of an already indexed bot. Queries come from FILE (one per line)
+or are sampled as short spans of random chunks. Recall@k is measured against the
+exact IndexFlatL2 top-k, before and after the exact rerank step.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss  # noqa: E402
+
+from embedding_engine import EmbeddingEngine  # noqa: E402
+from index_store import INDEX_RERANK_FACTOR, IndexStore, build_quantized_index, search_reranked  # noqa: E402
+
+
+def load_chunks(args):
+    if args.api_key:
+        return [c["text"] for c in IndexStore().load_chunks(args.api_key)]
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from extractor import get_extractor
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = []
+    for name in sorted(os.listdir(args.corpus)):
+        path = os.path.join(args.corpus, name)
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        if name.endswith((".html", ".htm")):
+            text = get_extractor().extract(text).text
+        elif not name.endswith(".txt"):
+            continue
+        chunks.extend(splitter.split_text(text))
+    return chunks
+
+
+def sample_queries(chunks, n, seed=0):
+    """Short word spans from random chunks, roughly the length of a visitor question"""
+    rng = random.Random(seed)
+    queries = []
+    for chunk in rng.sample(chunks, min(n, len(chunks))):
+        words = chunk.split()
+        start = rng.randrange(max(1, len(words) - 10))
+        queries.append(" ".join(words[start:start + 10]))
+    return queries
+
+
+def recall(found, truth):
+    return sum(len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)) / len(truth)
+
+
+def run(vectors, queries, k, factor):
+    ids = np.arange(len(vectors), dtype=np.int64)
+    rows = {i: i for i in range(len(vectors))}
+    exact = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    exact.add_with_ids(vectors, ids)
+    _, truth = exact.search(queries, k)
+    truth = [[int(i) for i in r if i >= 0] for r in truth]
+    flat_bytes = len(faiss.serialize_index(exact))
+
+    print(f"{len(vectors)} chunks, dim={vectors.shape[1]}, {len(queries)} queries, k={k}, rerank x{factor}\n")
+    print(f"{'mode':<12} {'index MB':>9} {'B/vector':>9} {'ratio':>6} {'recall':>7} {'p50 us':>8}")
+
+    modes = [("flat", exact, False)]
+    for mode in ("int8", "pq"):
+        index = build_quantized_index(vectors, ids, mode)
+        modes += [(mode, index, False), (mode + "+rerank", index, True)]
+
+    for name, index, rerank in modes:
+        size = len(faiss.serialize_index(index))
+        found, timings = [], []
+        for q in queries:
+            start = time.perf_counter()
+            if rerank:
+                hit_ids, _ = search_reranked(index, vectors, rows, q, k, factor)
+            else:
+                _, hits = index.search(q[None, :], k)
+                hit_ids = [int(i) for i in hits[0] if i >= 0]
+            timings.append(time.perf_counter() - start)
+            found.append(hit_ids)
+        p50 = sorted(timings)[len(timings) // 2] * 1e6
+        print(
+            f"{name:<12} {size / 1e6:>9.2f} {size / len(vectors):>9.0f} {flat_bytes / size:>5.1f}x "
+            f"{recall(found, truth):>7.3f} {p50:>8.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="directory of .txt / .html files")
+    source.add_argument("--api-key", help="use the stored chunks of this chatbot")
+    parser.add_argument("--queries", help="file with one query per line")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--rerank-factor", type=int, default=INDEX_RERANK_FACTOR)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args)
+    if len(chunks) < 2:
+        sys.exit("Need at least two chunks to benchmark")
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(chunks, args.num_queries)
+
+    # No cache: the benchmark should not fill the shared embedding cache
+    engine = EmbeddingEngine()
+    vectors = np.asarray(engine.embed_documents(chunks), dtype=np.float32)
+    query_vectors = np.asarray(engine.embed_documents(queries), dtype=np.float32)
+    run(vectors, query_vectors, args.k, args.rerank_factor)
+
+
+if __name__ == "__main__":
+    main()
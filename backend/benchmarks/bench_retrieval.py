@@ -0,0 +1,100 @@
+# backend/benchmarks/bench_retrieval.py
+"""Latency and recall of dense, BM25 and hybrid retrieval on one bot's corpus.
+
+Usage: python benchmarks/bench_retrieval.py (--corpus DIR | --api-key KEY) [-k K]
+
+Two query sets are generated from the chunks themselves:
+  paraphrase  - short word spans of a random chunk; relevant = that chunk
+  identifier  - "what about <token>" for tokens with digits or separators (SKUs,
+                model numbers, prices); relevant = every chunk containing the token
+Latency includes query embedding, which the lexical fast path skips.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_quantization import load_chunks  # noqa: E402
+from embedding_engine import EmbeddingEngine  # noqa: E402
+from index_store import chunk_id  # noqa: E402
+from lexical_index import LexicalIndex, hybrid_search, is_identifier, tokenize  # noqa: E402
+
+
+def identifier_queries(chunks, n, seed=0):
+    owners = {}
+    for c in chunks:
+        for token in set(tokenize(c)):
+            if is_identifier(token) and len(token) >= 3:
+                owners.setdefault(token, set()).add(chunk_id(c))
+    # Tokens on every page (years, phone numbers) say nothing about relevance
+    tokens = sorted(t for t, ids in owners.items() if len(ids) <= 3)
+    picked = random.Random(seed).sample(tokens, min(n, len(tokens)))
+    return [(f"what about {t}", owners[t]) for t in picked]
+
+
+def build_store(chunks, engine):
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS.from_texts(chunks, engine)
+
+
+def run(store, lexical, engine, queries, k):
+    retrievers = {
+        "dense": lambda q: store.similarity_search_by_vector(engine.embed_query(q), k=k),
+        "bm25": lambda q: [lexical.document(i) for i, _ in lexical.search(q, k)],
+        "hybrid": lambda q: hybrid_search(store, lexical, q, engine.embed_query(q), k),
+        "hybrid+fast": lambda q: lexical.fast_path(q, k) or hybrid_search(store, lexical, q, engine.embed_query(q), k),
+    }
+    print(f"{'retriever':<12} {'set':<11} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for name, retrieve in retrievers.items():
+        for set_name, items in queries.items():
+            if not items:
+                continue
+            hits, timings = 0.0, []
+            for query, relevant in items:
+                start = time.perf_counter()
+                docs = retrieve(query)
+                timings.append(time.perf_counter() - start)
+                found = {chunk_id(d.page_content) for d in docs}
+                hits += len(found & relevant) / min(len(relevant), k)
+            timings.sort()
+            p50 = timings[len(timings) // 2] * 1e3
+            p95 = timings[int(len(timings) * 0.95)] * 1e3
+            print(f"{name:<12} {set_name:<11} {hits / len(items):>7.3f} {p50:>7.2f} {p95:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="directory of .txt / .html files")
+    source.add_argument("--api-key", help="use the stored chunks of this chatbot")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=2)
+    args = parser.parse_args()
+
+    chunks = list(dict.fromkeys(load_chunks(args)))
+    if len(chunks) < 2:
+        sys.exit("Need at least two chunks to benchmark")
+
+    rng = random.Random(0)
+    paraphrase = []
+    for chunk in rng.sample(chunks, min(args.num_queries, len(chunks))):
+        words = chunk.split()
+        start = rng.randrange(max(1, len(words) - 10))
+        paraphrase.append((" ".join(words[start:start + 10]), {chunk_id(chunk)}))
+    queries = {"paraphrase": paraphrase, "identifier": identifier_queries(chunks, args.num_queries)}
+
+    engine = EmbeddingEngine()
+    store = build_store(chunks, engine)
+    lexical = LexicalIndex.build([{"text": c} for c in chunks])
+    engine.embed_query("warm up")
+    print(f"{len(chunks)} chunks, k={args.k}, "
+          f"{len(queries['paraphrase'])} paraphrase / {len(queries['identifier'])} identifier queries\n")
+    run(store, lexical, engine, queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# backend/benchmarks/bench_startup.py
+"""Import-to-first-request time of the API server under each MODEL_WARMUP mode.
+
+Usage: python benchmarks/bench_startup.py [--modes background,lazy] [--runs 3] [--api-key KEY]
+
+For each mode a fresh uvicorn process is started and polled. Reported, in seconds
+from process start:
+  import   - `import main` alone, measured in a separate interpreter
+  healthz  - first 200 from /healthz (server accepting requests)
+  listing  - first 200 from GET / (auth/listing paths, no model needed)
+  readyz   - first 200 from /readyz (all models loaded)
+  chat     - first answered /api/chat, when --api-key is given
+plus the server's RSS once ready.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def import_time(env) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def wait_for(client, method, url, deadline, **kwargs):
+    while time.perf_counter() < deadline:
+        try:
+            if client.request(method, url, **kwargs).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def run_once(mode: str, api_key, timeout: float):
+    env = dict(os.environ, MODEL_WARMUP=mode)
+    result = {"import": import_time(env)}
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = start + timeout
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            steps = [("healthz", "GET", "/healthz", {}), ("listing", "GET", "/", {})]
+            if api_key:
+                # In lazy mode this request is the one that pays for loading the models
+                steps.append(("chat", "POST", "/api/chat",
+                              {"json": {"chatbot_api_key": api_key, "message": "hello"}}))
+            steps.append(("readyz", "GET", "/readyz", {}))
+            for name, method, path, kwargs in steps:
+                ok = wait_for(client, method, base + path, deadline, **kwargs)
+                result[name] = time.perf_counter() - start if ok else float("nan")
+        result["rss_mb"] = rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(10)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="background,lazy")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--api-key", help="also time the first /api/chat for this chatbot")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    columns = ["import", "healthz", "listing"] + (["chat"] if args.api_key else []) + ["readyz", "rss_mb"]
+    print(f"{'mode':<11} " + " ".join(f"{c:>8}" for c in columns))
+    for mode in args.modes.split(","):
+        runs = [run_once(mode, args.api_key, args.timeout) for _ in range(args.runs)]
+        # Median across runs; the first run also pays for a cold page cache
+        row = [sorted(r[c] for r in runs)[len(runs) // 2] for c in columns]
+        print(f"{mode:<11} " + " ".join(f"{v:>8.2f}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
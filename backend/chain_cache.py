@@ -0,0 +1,178 @@
+# backend/chain_cache.py
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+QA_CACHE_MAX_ENTRIES = int(os.getenv("QA_CACHE_MAX_ENTRIES", "1000"))
+QA_CACHE_MAX_BYTES = int(os.getenv("QA_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+QA_CACHE_POLICY = os.getenv("QA_CACHE_POLICY", "lru")  # lru or lfu
+
+
+class CachedChain(NamedTuple):
+    vector_store: Any
+    lexical: Any = None
+
+
+def estimate_vector_store_bytes(vector_store) -> int:
+    """Approximate footprint of a FAISS vector store: float32 vectors plus chunk text"""
+    if hasattr(vector_store, "nbytes"):
+        return vector_store.nbytes
+    index = vector_store.index
+    size = index.ntotal * index.d * 4
+    for doc in getattr(vector_store.docstore, "_dict", {}).values():
+        size += len(doc.page_content.encode("utf-8"))
+    return size
+
+
+def estimate_entry_bytes(entry: CachedChain) -> int:
+    size = estimate_vector_store_bytes(entry.vector_store)
+    if entry.lexical is not None:
+        size += entry.lexical.nbytes
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "hits", "version")
+
+    def __init__(self, value: Any, size: int, version: Any = None):
+        self.value = value
+        self.size = size
+        self.hits = 0
+        self.version = version
+
+
+class ChainCache:
+    """Bounded LRU/LFU cache with single-flight loading, keyed by chatbot api_key.
+
+    Entries carry the index version they were loaded from; a lookup with a different
+    version drops the entry, so a sync in another process is picked up on the next request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QA_CACHE_MAX_ENTRIES,
+        max_bytes: int = QA_CACHE_MAX_BYTES,
+        policy: str = QA_CACHE_POLICY,
+        sizeof: Callable[[Any], int] = estimate_entry_bytes,
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str, version: Any = None) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version != version:
+                self._entries.pop(key)
+                self.total_bytes -= entry.size
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def put(self, key: str, value: Any, version: Any = None) -> None:
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.size
+            self._entries[key] = _Entry(value, size, version)
+            self.total_bytes += size
+            self._evict(keep=key)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[Any]], version: Any = None) -> Optional[Any]:
+        """Return the cached value or run loader once, even if many callers miss at the same time.
+
+        version should be read before loading, so a load racing a newer sync is only
+        ever tagged older than what it holds and gets reloaded, never kept stale.
+        """
+        value = self.get(key, version)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            self.loads += 1
+            value = loader()
+            if value is not None:
+                self.put(key, value, version)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _evict(self, keep: str) -> None:
+        """Drop entries until both bounds hold; the entry just inserted is never evicted"""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            victim = self._pick_victim(keep)
+            entry = self._entries.pop(victim)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+
+    def _pick_victim(self, keep: str) -> str:
+        if self.policy == "lfu":
+            return min((k for k in self._entries if k != keep), key=lambda k: self._entries[k].hits)
+        return next(k for k in self._entries if k != keep)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "stale": self.stale,
+                "loads": self.loads,
+            }
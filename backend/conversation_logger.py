@@ -0,0 +1,173 @@
+# backend/conversation_logger.py
+import asyncio
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from models import Conversation
+
+CONVERSATION_LOG_QUEUE_SIZE = int(os.getenv("CONVERSATION_LOG_QUEUE_SIZE", "10000"))
+CONVERSATION_LOG_BATCH_SIZE = int(os.getenv("CONVERSATION_LOG_BATCH_SIZE", "200"))
+CONVERSATION_LOG_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_LOG_FLUSH_INTERVAL", "1.0"))
+# "drop" loses turns when the queue is full; "block" waits up to the timeout first
+CONVERSATION_LOG_POLICY = os.getenv("CONVERSATION_LOG_POLICY", "drop")
+CONVERSATION_LOG_BLOCK_TIMEOUT = float(os.getenv("CONVERSATION_LOG_BLOCK_TIMEOUT", "0.05"))
+
+_STOP = object()
+
+
+class ConversationLogger:
+    """Write-behind logger: chat turns are queued in memory and bulk-inserted by a background thread"""
+
+    def __init__(
+        self,
+        session_factory,
+        max_queue: int = CONVERSATION_LOG_QUEUE_SIZE,
+        batch_size: int = CONVERSATION_LOG_BATCH_SIZE,
+        flush_interval: float = CONVERSATION_LOG_FLUSH_INTERVAL,
+        policy: str = CONVERSATION_LOG_POLICY,
+        block_timeout: float = CONVERSATION_LOG_BLOCK_TIMEOUT,
+    ):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown queue-full policy: {policy}")
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="conversation-logger", daemon=True)
+            self._thread.start()
+
+    def log(self, chatbot_id: str, user_message: str, bot_response: str) -> bool:
+        """Queue one turn; returns False if it was dropped because the queue is full"""
+        timeout = self.block_timeout if self.policy == "block" else None
+        return self._put(self._row(chatbot_id, user_message, bot_response), timeout)
+
+    async def log_async(self, chatbot_id: str, user_message: str, bot_response: str) -> bool:
+        """log() for async handlers: a full queue under the block policy is waited on in a worker thread"""
+        row = self._row(chatbot_id, user_message, bot_response)
+        if self.policy == "drop":
+            return self._put(row, None)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            return await asyncio.get_running_loop().run_in_executor(None, self._put, row, self.block_timeout)
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    @staticmethod
+    def _row(chatbot_id: str, user_message: str, bot_response: str) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid4()),
+            "chatbot_id": chatbot_id,
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "created_at": datetime.utcnow(),
+        }
+
+    def _put(self, row: Dict[str, Any], timeout: Optional[float]) -> bool:
+        """Enqueue without waiting when timeout is None"""
+        try:
+            if timeout is None:
+                self._queue.put_nowait(row)
+            else:
+                self._queue.put(row, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Dict[str, Any]] = []
+            stopping = False
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._flush(batch)
+            if stopping:
+                # Drain whatever arrived before the stop marker was seen
+                rest = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        rest.append(item)
+                for i in range(0, len(rest), self.batch_size):
+                    self._flush(rest[i:i + self.batch_size])
+                return
+
+    def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        """One executemany INSERT per batch"""
+        db = self.session_factory()
+        try:
+            db.execute(insert(Conversation), rows)
+            db.commit()
+            with self._lock:
+                self.written += len(rows)
+                self.flushes += 1
+        except Exception as e:
+            db.rollback()
+            print(f"Error flushing {len(rows)} conversations: {str(e)}")
+            with self._lock:
+                self.failed += len(rows)
+        finally:
+            db.close()
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Flush everything queued so far and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "policy": self.policy,
+            }
@@ -0,0 +1,277 @@
+# backend/crawler.py
+import asyncio
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+from bs4 import BeautifulSoup, SoupStrainer
+
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "3"))
+CRAWL_MAX_BYTES = int(os.getenv("CRAWL_MAX_BYTES", str(10 * 1024 * 1024)))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "10"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "ChatbotBuilderCrawler/1.0")
+CRAWL_MAX_REDIRECTS = int(os.getenv("CRAWL_MAX_REDIRECTS", "5"))
+
+_SKIP_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".pdf", ".zip", ".gz",
+    ".mp3", ".mp4", ".avi", ".mov", ".css", ".js", ".json", ".xml", ".woff", ".woff2",
+)
+_TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "mc_")
+
+
+@dataclass
+class Page:
+    url: str
+    html: str
+    content_hash: str
+    depth: int
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings dedupe to one entry"""
+    parts = urlparse(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    ))
+    return urlunparse((scheme, host, path, "", query, ""))
+
+
+def _site_host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class SiteCrawler:
+    """Same-domain asyncio crawler honouring robots.txt and sitemap.xml, with page/depth/byte budgets"""
+
+    def __init__(
+        self,
+        max_pages: int = CRAWL_MAX_PAGES,
+        max_depth: int = CRAWL_MAX_DEPTH,
+        max_bytes: int = CRAWL_MAX_BYTES,
+        per_host_concurrency: int = CRAWL_PER_HOST_CONCURRENCY,
+        timeout: float = CRAWL_TIMEOUT,
+        user_agent: str = CRAWL_USER_AGENT,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self._client = client
+
+    async def crawl(self, start_url: str) -> List[Page]:
+        """Crawl from start_url; errors fetching start_url itself are raised so callers can retry"""
+        if self._client is not None:
+            return await self._crawl(self._client, start_url)
+        limits = httpx.Limits(max_connections=self.per_host_concurrency * 2,
+                              max_keepalive_connections=self.per_host_concurrency)
+        async with httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=limits,
+            # Each hop is checked before it is requested, see _fetch
+            follow_redirects=False,
+            headers={"User-Agent": self.user_agent},
+        ) as client:
+            return await self._crawl(client, start_url)
+
+    async def _crawl(self, client: httpx.AsyncClient, start_url: str) -> List[Page]:
+        start = canonicalize_url(start_url)
+        site = _site_host(start)
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+        # robots.txt and sitemaps count against the byte budget too
+        state = {"bytes": 0, "claimed": 0}
+        robots = await self._load_robots(client, start, site, state)
+
+        seen_urls: Set[str] = {start}
+        seen_hashes: Set[str] = set()
+        pages: List[Page] = []
+        queue: "asyncio.Queue[Tuple[str, int]]" = asyncio.Queue()
+        queue.put_nowait((start, 0))
+
+        for url in await self._sitemap_urls(client, start, robots, site, state):
+            url = canonicalize_url(url)
+            if url not in seen_urls and _site_host(url) == site:
+                seen_urls.add(url)
+                queue.put_nowait((url, 1))
+
+        start_error: List[BaseException] = []
+
+        def budget_left() -> bool:
+            return state["claimed"] < self.max_pages and state["bytes"] < self.max_bytes
+
+        async def fetch(url: str) -> Optional[Tuple[httpx.Response, bytes]]:
+            host = urlparse(url).netloc
+            sem = host_limits.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+            async with sem:
+                return await self._fetch(client, url, site, state, robots, content_type="html")
+
+        async def worker():
+            while True:
+                url, depth = await queue.get()
+                try:
+                    if not budget_left():
+                        continue
+                    state["claimed"] += 1
+                    try:
+                        fetched = await fetch(url)
+                    except (httpx.HTTPError, httpx.InvalidURL) as e:
+                        state["claimed"] -= 1
+                        if url == start:
+                            start_error.append(e)
+                        else:
+                            print(f"Error crawling {url}: {e}")
+                        continue
+
+                    if fetched is None:
+                        state["claimed"] -= 1
+                        continue
+                    res, body = fetched
+                    final_url = canonicalize_url(str(res.url))
+                    digest = content_hash(body)
+                    if not body or digest in seen_hashes:
+                        state["claimed"] -= 1
+                        continue
+                    seen_hashes.add(digest)
+
+                    html = body.decode(res.encoding or "utf-8", errors="replace")
+                    pages.append(Page(url=final_url, html=html, content_hash=digest, depth=depth))
+
+                    if depth < self.max_depth:
+                        for link in self._links(html, final_url):
+                            if link not in seen_urls and _site_host(link) == site:
+                                seen_urls.add(link)
+                                queue.put_nowait((link, depth + 1))
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.per_host_concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if start_error and not pages:
+            raise start_error[0]
+        return pages[:self.max_pages]
+
+    def _links(self, html: str, base_url: str) -> List[str]:
+        links = []
+        for a in BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("a", href=True)).find_all("a"):
+            href = a["href"].strip()
+            if not href or href.startswith(("mailto:", "tel:", "javascript:", "#")):
+                continue
+            url = urljoin(base_url, href)
+            if urlparse(url).scheme not in ("http", "https"):
+                continue
+            if urlparse(url).path.lower().endswith(_SKIP_EXTENSIONS):
+                continue
+            links.append(canonicalize_url(url))
+        return links
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, site: str, state: Dict[str, int],
+                     robots: Optional[RobotFileParser] = None,
+                     content_type: Optional[str] = None) -> Optional[Tuple[httpx.Response, bytes]]:
+        """Response and body, following redirects one hop at a time; None for off-site,
+        disallowed or wrong-type targets, which are never requested. Reads only while the
+        byte budget in state lasts.
+        """
+        for _ in range(CRAWL_MAX_REDIRECTS + 1):
+            if _site_host(url) != site:
+                return None
+            if robots is not None and not robots.can_fetch(self.user_agent, url):
+                return None
+            async with client.stream("GET", url, follow_redirects=False) as res:
+                if res.is_redirect:
+                    url = urljoin(url, res.headers["location"])
+                    continue
+                res.raise_for_status()
+                if content_type and content_type not in res.headers.get("content-type", content_type):
+                    return None
+                chunks = []
+                async for chunk in res.aiter_bytes():
+                    # Counted as it arrives, so concurrent fetches can't each spend the whole budget
+                    chunk = chunk[:max(0, self.max_bytes - state["bytes"])]
+                    state["bytes"] += len(chunk)
+                    chunks.append(chunk)
+                    if state["bytes"] >= self.max_bytes:
+                        break
+                return res, b"".join(chunks)
+        return None
+
+    async def _load_robots(self, client: httpx.AsyncClient, start: str, site: str,
+                           state: Dict[str, int]) -> Optional[RobotFileParser]:
+        parts = urlparse(start)
+        robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+        try:
+            fetched = await self._fetch(client, robots_url, site, state)
+        except httpx.HTTPError:
+            return None
+        if fetched is None:
+            return None
+        parser = RobotFileParser(robots_url)
+        parser.parse(fetched[1].decode("utf-8", errors="replace").splitlines())
+        return parser
+
+    async def _sitemap_urls(self, client: httpx.AsyncClient, start: str,
+                            robots: Optional[RobotFileParser], site: str, state: Dict[str, int]) -> List[str]:
+        parts = urlparse(start)
+        # robots.txt may list sitemaps on any host; only this site's are fetched
+        sitemaps = [u for u in (robots.site_maps() if robots else None) or [] if _site_host(u) == site]
+        if not sitemaps:
+            sitemaps = [f"{parts.scheme}://{parts.netloc}/sitemap.xml"]
+
+        urls: List[str] = []
+        pending = sitemaps[:]
+        visited: Set[str] = set()
+        while pending and len(urls) < self.max_pages:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in visited or _site_host(sitemap_url) != site:
+                continue
+            visited.add(sitemap_url)
+            try:
+                fetched = await self._fetch(client, sitemap_url, site, state)
+                if fetched is None:
+                    continue
+                # A sitemap cut off by the byte budget fails to parse and is skipped
+                root = ET.fromstring(fetched[1])
+            except (httpx.HTTPError, httpx.InvalidURL, ET.ParseError):
+                continue
+            for loc in root.iter():
+                if not loc.tag.endswith("loc") or not loc.text:
+                    continue
+                # <sitemapindex> entries point at more sitemaps
+                if root.tag.endswith("sitemapindex"):
+                    pending.append(loc.text.strip())
+                else:
+                    urls.append(loc.text.strip())
+        return urls[:self.max_pages]
+
+
+def crawl_site(url: str, **kwargs) -> List[Page]:
+    """Blocking entry point for worker threads"""
+    return asyncio.run(SiteCrawler(**kwargs).crawl(url))
@@ -0,0 +1,132 @@
+# backend/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes", "embedding_cache.sqlite3"),
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+
+# SQLite caps bound parameters per statement; stay well under it
+_QUERY_BATCH = 500
+
+
+def normalize_chunk(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_chunk(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed float32 vectors in SQLite, shared by every bot and worker on the host"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        # Row count shared by every process using the file, updated in the same transaction as each insert
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embedding_counts (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO embedding_counts SELECT 'entries', COUNT(*) FROM embeddings"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _QUERY_BATCH):
+                batch = list(keys[i:i + _QUERY_BATCH])
+                marks = ",".join("?" * len(batch))
+                for key, dim, blob in self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({marks})", batch
+                ):
+                    found[key] = np.frombuffer(blob, dtype=np.float32, count=dim)
+                if found:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now] + batch
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            v = np.asarray(vector, dtype=np.float32)
+            rows.append((key, v.shape[0], v.tobytes(), now))
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            # The inserts hold SQLite's write lock, so no other process changes the count until commit
+            count = self._add_count(self._conn.total_changes - before)
+            if count > self.max_entries:
+                self._evict(count)
+            self._conn.commit()
+
+    def _add_count(self, delta: int) -> int:
+        if delta:
+            self._conn.execute("UPDATE embedding_counts SET value = value + ? WHERE name = 'entries'", (delta,))
+        return self._conn.execute("SELECT value FROM embedding_counts WHERE name = 'entries'").fetchone()[0]
+
+    def _evict(self, count: int) -> None:
+        """Drop least recently used rows down to 90% of capacity"""
+        excess = count - int(self.max_entries * 0.9)
+        before = self._conn.total_changes
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        deleted = self._conn.total_changes - before
+        self._add_count(-deleted)
+        self.evictions += deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": self._add_count(0),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_embedding_cache() -> Optional[EmbeddingCache]:
+    """Cache at EMBEDDING_CACHE_PATH, or None when the path is set empty"""
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    return EmbeddingCache()
@@ -0,0 +1,167 @@
+# backend/embedding_engine.py
+import os
+import threading
+import time
+from typing import Callable, List, Dict, Any, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EmbeddingCache, cache_key, open_embedding_cache
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = leave torch default
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class EmbeddingEngine(Embeddings):
+    """Sentence-transformer embeddings loaded once per process and shared by every chatbot"""
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        num_threads: int = EMBEDDING_THREADS,
+        device: str = EMBEDDING_DEVICE,
+        cache: Optional[EmbeddingCache] = None,
+        cache_factory: Optional[Callable[[], Optional[EmbeddingCache]]] = None,
+    ):
+        self.model_name = model_name
+        self._cache = cache
+        self._cache_factory = cache_factory
+        self._cache_opened = cache is not None or cache_factory is None
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_time: Optional[float] = None
+        self.model_bytes: Optional[int] = None
+        self.rss_delta_bytes: Optional[int] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def _load(self) -> None:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+
+        print(f"Loading embedding model {self.model_name}...")
+        rss_before = _rss_bytes()
+        start = time.time()
+        model = SentenceTransformer(self.model_name, device=self.device)
+        model.eval()
+        self.load_time = time.time() - start
+
+        self.model_bytes = sum(p.numel() * p.element_size() for p in model.parameters()) + sum(
+            b.numel() * b.element_size() for b in model.buffers()
+        )
+        rss_after = _rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            self.rss_delta_bytes = rss_after - rss_before
+
+        self._model = model
+        print(
+            f"Embedding model loaded in {self.load_time:.2f}s "
+            f"({self.model_bytes / 1e6:.1f} MB weights, dim={self.dimension})"
+        )
+
+    @property
+    def cache(self) -> Optional[EmbeddingCache]:
+        """Opened on first use, so a prefork master that only loads the model never holds the SQLite handle"""
+        if not self._cache_opened:
+            with self._lock:
+                if not self._cache_opened:
+                    self._cache = self._cache_factory()
+                    self._cache_opened = True
+        return self._cache
+
+    def close_cache(self) -> None:
+        """Close the cache connection; it is reopened on next use"""
+        with self._lock:
+            cache, self._cache = self._cache, None
+            self._cache_opened = self._cache_factory is None
+        if cache is not None:
+            cache.close()
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches of batch_size, reusing cached vectors for chunks seen before"""
+        if not texts:
+            return []
+        texts = list(texts)
+        if self.cache is None:
+            return self._encode(texts).tolist()
+
+        keys = [cache_key(self.model_name, t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[k].tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries rarely repeat verbatim; the answer cache handles the ones that do
+        return self._encode([text])[0].tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "loaded": self._model is not None,
+            "batch_size": self.batch_size,
+            "num_threads": self.num_threads,
+            "device": self.device,
+            "load_time_s": self.load_time,
+            "model_bytes": self.model_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "cache": self._cache.stats() if self._cache else None,
+        }
+
+
+_engine: Optional[EmbeddingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """Return the process-wide embedding engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EmbeddingEngine(cache_factory=open_embedding_cache)
+    return _engine
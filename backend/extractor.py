@@ -0,0 +1,225 @@
+# backend/extractor.py
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Type
+
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "lxml")
+
+# Dropped while parsing, before any text is read
+BOILERPLATE_TAGS = (
+    "script", "style", "noscript", "template", "svg", "iframe", "form",
+    "nav", "header", "footer", "aside", "button", "select",
+)
+# class/id words that mark navigation, banners and other chrome
+BOILERPLATE_HINTS = (
+    "nav", "navbar", "menu", "footer", "header", "sidebar", "cookie", "cookies", "banner",
+    "breadcrumb", "breadcrumbs", "social", "share", "subscribe", "newsletter", "popup",
+    "modal", "advert", "ads", "promo", "skip-link", "comments",
+)
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+TEXT_TAGS = ("p", "li", "pre", "blockquote", "td", "th", "dd", "dt", "figcaption")
+BLOCK_TAGS = HEADING_TAGS + TEXT_TAGS
+
+_WS = re.compile(r"\s+")
+
+
+def _clean(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+
+@dataclass
+class Section:
+    heading: Optional[str]
+    text: str
+
+
+@dataclass
+class Extraction:
+    title: Optional[str] = None
+    sections: List[Section] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        parts = []
+        for s in self.sections:
+            parts.append(f"{s.heading}\n{s.text}" if s.heading else s.text)
+        return "\n\n".join(p for p in parts if p)
+
+
+class Extractor:
+    """Turns raw HTML into main-content sections"""
+
+    name = "base"
+
+    def extract(self, html: str) -> Extraction:
+        raise NotImplementedError
+
+
+class LxmlExtractor(Extractor):
+    """libxml2-backed extractor with readability-style main-content detection"""
+
+    name = "lxml"
+
+    def __init__(self, min_paragraph_chars: int = 25, max_link_density: float = 0.5):
+        from lxml import etree, html as lxml_html
+
+        self._etree = etree
+        self._html = lxml_html
+        # Text is handed over as UTF-8 bytes so <meta charset> declarations can't conflict
+        self._parser = lxml_html.HTMLParser(
+            encoding="utf-8", remove_comments=True, remove_pis=True, no_network=True
+        )
+        words = "|".join(re.escape(w) for w in BOILERPLATE_HINTS)
+        pattern = rf"(^|[\s_-])({words})([\s_-]|$)"
+        self._hints = etree.XPath(
+            "//*[not(self::html or self::body or self::main or self::article)]"
+            "[re:test(@class, $p, 'i') or re:test(@id, $p, 'i') or @role='navigation' or @aria-hidden='true']",
+            namespaces={"re": "http://exslt.org/regular-expressions"},
+        )
+        self._pattern = pattern
+        self.min_paragraph_chars = min_paragraph_chars
+        self.max_link_density = max_link_density
+
+    def extract(self, html: str) -> Extraction:
+        if not html or not html.strip():
+            return Extraction()
+        try:
+            root = self._html.document_fromstring(html.encode("utf-8"), parser=self._parser)
+        except (self._etree.ParserError, ValueError):
+            return Extraction()
+
+        title = root.findtext(".//title")
+        # C-level removal of scripts, styles and page chrome
+        self._etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+        for el in self._hints(root, p=self._pattern):
+            if el.getparent() is not None:
+                el.drop_tree()
+
+        main = self._main_node(root)
+        return Extraction(title=_clean(title) if title else None, sections=self._sections(main))
+
+    def _link_density(self, el, text_len: Optional[int] = None) -> float:
+        if text_len is None:
+            text_len = len(_clean(el.text_content()))
+        if not text_len:
+            return 0.0
+        link_len = sum(len(_clean(a.text_content())) for a in el.iter("a"))
+        return min(link_len / text_len, 1.0)
+
+    def _main_node(self, root):
+        """Prefer explicit landmarks, otherwise the container whose paragraphs score highest"""
+        for path in ("//article", "//main", "//*[@role='main']"):
+            nodes = root.xpath(path)
+            if nodes:
+                best = max(nodes, key=lambda n: len(n.text_content()))
+                if len(_clean(best.text_content())) >= 200:
+                    return best
+
+        scores: Dict[object, float] = {}
+        for p in root.iter("p", "pre", "td", "blockquote"):
+            text = _clean(p.text_content())
+            if len(text) < self.min_paragraph_chars:
+                continue
+            score = 1 + text.count(",") + min(len(text) // 100, 3)
+            parent = p.getparent()
+            if parent is not None:
+                scores[parent] = scores.get(parent, 0) + score
+                grandparent = parent.getparent()
+                if grandparent is not None:
+                    scores[grandparent] = scores.get(grandparent, 0) + score / 2
+
+        if scores:
+            best = max(scores, key=lambda n: scores[n] * (1 - self._link_density(n)))
+            return best
+        body = root.find("body")
+        return body if body is not None else root
+
+    def _sections(self, main) -> List[Section]:
+        sections: List[Section] = []
+        heading: Optional[str] = None
+        parts: List[str] = []
+
+        def flush():
+            if parts:
+                sections.append(Section(heading=heading, text=" ".join(parts)))
+
+        block_set = set(BLOCK_TAGS)
+        for el in main.iter(*BLOCK_TAGS):
+            # Text of nested blocks (a <p> inside an <li>) is already in the outer one
+            ancestor = el.getparent()
+            nested = False
+            while ancestor is not None and ancestor is not main:
+                if ancestor.tag in block_set:
+                    nested = True
+                    break
+                ancestor = ancestor.getparent()
+            if nested:
+                continue
+
+            text = _clean(el.text_content())
+            if not text:
+                continue
+            if el.tag in HEADING_TAGS:
+                flush()
+                heading, parts = text, []
+                continue
+            if len(text) < 200 and self._link_density(el, len(text)) > self.max_link_density:
+                continue
+            parts.append(text)
+        flush()
+
+        if not sections:
+            text = _clean(main.text_content())
+            if text:
+                sections.append(Section(heading=None, text=text))
+        return sections
+
+
+class SoupTextExtractor(Extractor):
+    """Baseline: html.parser + stripped_strings, as the old scrape_website_text helper did"""
+
+    name = "bs4-text"
+
+    def extract(self, html: str) -> Extraction:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in soup(["script", "style"]):
+            tag.decompose()
+        title = soup.title.get_text(strip=True) if soup.title else None
+        text = " ".join(soup.stripped_strings)
+        return Extraction(title=title, sections=[Section(None, text)] if text else [])
+
+
+class SoupTagExtractor(Extractor):
+    """Baseline: html.parser + p/h1-h3/li tags, as the old scrape_main_content helper did"""
+
+    name = "bs4-tags"
+
+    def extract(self, html: str) -> Extraction:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        title = soup.title.get_text(strip=True) if soup.title else None
+        content = [t.get_text(strip=True) for t in soup.find_all(["p", "h1", "h2", "h3", "li"])]
+        text = " ".join(c for c in content if c)
+        return Extraction(title=title, sections=[Section(None, text)] if text else [])
+
+
+EXTRACTORS: Dict[str, Type[Extractor]] = {
+    LxmlExtractor.name: LxmlExtractor,
+    SoupTextExtractor.name: SoupTextExtractor,
+    SoupTagExtractor.name: SoupTagExtractor,
+}
+
+_instances: Dict[str, Extractor] = {}
+
+
+def get_extractor(name: str = HTML_EXTRACTOR) -> Extractor:
+    """Shared extractor instance by name (HTML_EXTRACTOR picks the default)"""
+    if name not in _instances:
+        if name not in EXTRACTORS:
+            raise ValueError(f"Unknown HTML extractor: {name}")
+        _instances[name] = EXTRACTORS[name]()
+    return _instances[name]
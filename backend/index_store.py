@@ -0,0 +1,338 @@
+# backend/index_store.py
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes"))
+# "faiss" keeps one index per chatbot; "sharded" packs many bots into shared shards (see sharded_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")
+
+# "none" keeps exact float32 vectors; "int8" (4x smaller) and "pq" (16x at the default
+# m) compress the searched index and rerank its candidates against vectors.npy
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none")
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "96"))
+INDEX_RERANK_FACTOR = int(os.getenv("INDEX_RERANK_FACTOR", "10"))
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.json"
+VECTORS_FILE = "vectors.npy"
+# Names the version directory readers should use
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+
+# IO_FLAG_MMAP maps IVF inverted lists; IO_FLAG_MMAP_IFC (faiss >= 1.10) does the
+# same for the flat storage inside our IndexIDMap2 indexes.
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def chunk_id(text: str) -> int:
+    """Stable non-negative int64 id derived from chunk content"""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def is_flat(index) -> bool:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    return isinstance(inner, faiss.IndexFlat)
+
+
+def build_quantized_index(vectors: np.ndarray, ids: np.ndarray, mode: str = INDEX_QUANTIZATION, pq_m: int = INDEX_PQ_M):
+    """Train a compressed IndexIDMap2 over vectors; tiny corpora fall back from pq to int8"""
+    n, d = vectors.shape
+    # PQ needs at least 2**nbits training points per sub-quantizer
+    nbits = min(8, int(np.log2(n))) if n > 1 else 0
+    if mode == "pq" and nbits >= 4:
+        m = max(i for i in range(1, min(pq_m, d) + 1) if d % i == 0)
+        inner = faiss.IndexPQ(d, m, nbits)
+    elif mode in ("int8", "pq"):
+        inner = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit)
+    else:
+        raise ValueError(f"Unknown INDEX_QUANTIZATION: {mode}")
+    inner.train(vectors)
+    index = faiss.IndexIDMap2(inner)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def search_reranked(index, vectors: np.ndarray, rows: Dict[int, int], query: np.ndarray, k: int,
+                    factor: int = INDEX_RERANK_FACTOR) -> Tuple[List[int], List[float]]:
+    """Fetch k * factor candidates from a compressed index, then rank them by exact L2"""
+    query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+    _, candidates = index.search(query, k * factor)
+    ids = [int(i) for i in candidates[0] if i >= 0]
+    if not ids:
+        return [], []
+    exact = ((vectors[[rows[i] for i in ids]] - query) ** 2).sum(axis=1)
+    order = np.argsort(exact, kind="stable")[:k]
+    return [ids[j] for j in order], [float(exact[j]) for j in order]
+
+
+class RerankedFAISS(FAISS):
+    """FAISS store over a quantized index whose hits are re-scored against the float vectors"""
+
+    def __init__(self, *args, vectors: np.ndarray, rows: Dict[int, int], rerank_factor: int = INDEX_RERANK_FACTOR, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vectors = vectors
+        self.rows = rows
+        self.rerank_factor = rerank_factor
+
+    @property
+    def nbytes(self) -> int:
+        # vectors.npy is mmap'd and only touched for rerank candidates
+        inner = faiss.downcast_index(self.index.index)
+        size = self.index.ntotal * inner.code_size
+        for doc in self.docstore._dict.values():
+            size += len(doc.page_content.encode("utf-8"))
+        return size
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        if filter is not None:
+            return super().similarity_search_with_score_by_vector(embedding, k, filter=filter, **kwargs)
+        ids, scores = search_reranked(self.index, self.vectors, self.rows, embedding, k, self.rerank_factor)
+        return [
+            (self.docstore.search(self.index_to_docstore_id[i]), score)
+            for i, score in zip(ids, scores)
+        ]
+
+
+class IndexStore:
+    """Persists each chatbot's FAISS index and chunk texts under one directory per api_key.
+
+    Each sync writes a new version directory and then points CURRENT at it, so readers
+    always see an index and chunks.json from the same write. Indexes from before
+    versioning live directly in the bot directory and are read from there until the
+    next sync.
+    """
+
+    def __init__(self, root: str = INDEX_DIR, quantization: str = INDEX_QUANTIZATION):
+        self.root = root
+        self.quantization = quantization
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, api_key: str) -> str:
+        """Directory holding the index versions for a chatbot"""
+        return os.path.join(self.root, api_key)
+
+    def version(self, api_key: str) -> Optional[str]:
+        """Name of the published version, None for a missing or unversioned index; changes on every sync"""
+        try:
+            with open(os.path.join(self.path(api_key), CURRENT_FILE), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def current(self, api_key: str, version: Optional[str] = None) -> str:
+        """Directory of a version, by default the published one; resolve once per read so every file comes from it"""
+        version = version or self.version(api_key)
+        return os.path.join(self.path(api_key), version) if version else self.path(api_key)
+
+    def exists(self, api_key: str) -> bool:
+        version = self.current(api_key)
+        return os.path.exists(os.path.join(version, INDEX_FILE)) and os.path.exists(os.path.join(version, CHUNKS_FILE))
+
+    @contextmanager
+    def locked(self, api_key: str):
+        """Exclusive per-bot lock across threads and processes, held for a whole sync"""
+        path = self.path(api_key)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, api_key: str, index, chunks: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None) -> None:
+        """Write a new version holding index, chunks, their BM25 index and (for quantized
+        indexes) vectors, then switch CURRENT to it. Called with the bot's lock held.
+        """
+        from lexical_index import LEXICAL_FILE, LexicalIndex
+
+        path = self.path(api_key)
+        previous = self.current(api_key)
+        name = f"v{time.time_ns():x}-{uuid.uuid4().hex[:8]}"
+        version = os.path.join(path, name)
+        os.makedirs(version)
+        with open(os.path.join(version, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        faiss.write_index(index, os.path.join(version, INDEX_FILE))
+        with open(os.path.join(version, LEXICAL_FILE), "w", encoding="utf-8") as f:
+            json.dump(LexicalIndex.build(chunks).to_dict(), f)
+        if vectors is not None:
+            with open(os.path.join(version, VECTORS_FILE), "wb") as f:
+                np.save(f, vectors)
+
+        tmp = os.path.join(path, f"{CURRENT_FILE}.{name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(path, CURRENT_FILE))
+        self._prune(path, keep={version, previous})
+
+    def _prune(self, path: str, keep) -> None:
+        """Drop versions older than the previous one; a reader that just resolved it can still open its files"""
+        for entry in os.listdir(path):
+            full = os.path.join(path, entry)
+            if entry.startswith("v") and os.path.isdir(full) and full not in keep:
+                shutil.rmtree(full, ignore_errors=True)
+        if path not in keep:
+            # Unversioned files from before CURRENT existed
+            for name in (INDEX_FILE, CHUNKS_FILE, VECTORS_FILE, "bm25.json"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+
+    def sync(self, api_key: str, chunks: List[Dict[str, Any]], embeddings) -> Dict[str, int]:
+        """Make the stored index hold exactly these chunks, embedding only the ones it doesn't have yet.
+
+        chunks are {"text", "metadata"} dicts. Vectors are keyed by chunk_id(text) in an
+        IndexIDMap2, so stale chunks are dropped with remove_ids instead of a rebuild.
+        Concurrent syncs of one bot run one after the other.
+        """
+        wanted: Dict[int, Dict[str, Any]] = {}
+        for c in chunks:
+            wanted.setdefault(chunk_id(c["text"]), c)
+        if not wanted:
+            raise ValueError("No chunks to index")
+        with self.locked(api_key):
+            if self.quantization != "none":
+                return self._sync_quantized(api_key, wanted, embeddings)
+            return self._sync_flat(api_key, wanted, embeddings)
+
+    def _sync_flat(self, api_key: str, wanted: Dict[int, Dict[str, Any]], embeddings) -> Dict[str, int]:
+        index = None
+        old_ids = set()
+        version = self.current(api_key)
+        if self.exists(api_key):
+            existing = self._read_index(version, mmap=False)
+            # Indexes written before chunk ids existed (or while quantized) can't be patched in place
+            if isinstance(existing, faiss.IndexIDMap2) and is_flat(existing):
+                index = existing
+                old_ids = {c["id"] for c in self._read_chunks(version)}
+
+        stale = sorted(old_ids - wanted.keys())
+        added = [i for i in wanted if i not in old_ids]
+
+        if stale:
+            index.remove_ids(np.array(stale, dtype=np.int64))
+        if added:
+            vectors = np.asarray(embeddings.embed_documents([wanted[i]["text"] for i in added]), dtype=np.float32)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            index.add_with_ids(vectors, np.array(added, dtype=np.int64))
+
+        self.publish(api_key, index, self._records(wanted))
+        return {"added": len(added), "removed": len(stale), "kept": len(wanted) - len(added)}
+
+    def _sync_quantized(self, api_key: str, wanted: Dict[int, Dict[str, Any]], embeddings) -> Dict[str, int]:
+        """Keep float vectors in vectors.npy and retrain the compressed index from them"""
+        stored = self._stored_vectors(api_key)
+        added = [i for i in wanted if i not in stored]
+        if added:
+            computed = embeddings.embed_documents([wanted[i]["text"] for i in added])
+            stored.update(zip(added, np.asarray(computed, dtype=np.float32)))
+
+        ids = np.array(list(wanted), dtype=np.int64)
+        vectors = np.vstack([stored[i] for i in wanted]).astype(np.float32)
+        index = build_quantized_index(vectors, ids, self.quantization)
+
+        self.publish(api_key, index, self._records(wanted), vectors)
+        removed = len(stored) - len(wanted)
+        return {"added": len(added), "removed": removed, "kept": len(wanted) - len(added)}
+
+    def _stored_vectors(self, api_key: str) -> Dict[int, np.ndarray]:
+        """Float vectors already on disk by chunk id, from vectors.npy or a flat index"""
+        if not self.exists(api_key):
+            return {}
+        version = self.current(api_key)
+        ids = [c.get("id") for c in self._read_chunks(version)]
+        if None in ids:
+            return {}
+        vectors_path = os.path.join(version, VECTORS_FILE)
+        if os.path.exists(vectors_path):
+            vectors = np.load(vectors_path)
+            return dict(zip(ids, vectors))
+        index = self._read_index(version, mmap=False)
+        if isinstance(index, faiss.IndexIDMap2) and is_flat(index):
+            vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+            return dict(zip(faiss.vector_to_array(index.id_map).tolist(), vectors))
+        return {}
+
+    @staticmethod
+    def _records(wanted: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {"id": i, "text": c["text"], "metadata": c.get("metadata") or {}}
+            for i, c in wanted.items()
+        ]
+
+    @staticmethod
+    def _read_chunks(version: str) -> List[Dict[str, Any]]:
+        with open(os.path.join(version, CHUNKS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _read_index(version: str, mmap: bool = True):
+        """Memory-mapped by default so workers share the page cache"""
+        flags = MMAP_FLAGS if mmap else 0
+        return faiss.read_index(os.path.join(version, INDEX_FILE), flags)
+
+    def load_chunks(self, api_key: str) -> List[Dict[str, Any]]:
+        return self._read_chunks(self.current(api_key))
+
+    def load_index(self, api_key: str, mmap: bool = True):
+        """Read the raw faiss index, memory-mapped by default so workers share the page cache"""
+        return self._read_index(self.current(api_key), mmap)
+
+    def load(self, api_key: str, embeddings, mmap: bool = True, version: Optional[str] = None) -> FAISS:
+        """Load a persisted index (by default the published version) as a LangChain FAISS vector store"""
+        version = self.current(api_key, version)
+        index = self._read_index(version, mmap=mmap)
+        chunks = self._read_chunks(version)
+        if index.ntotal != len(chunks):
+            raise ValueError(f"Index for {api_key} has {index.ntotal} vectors but {len(chunks)} chunks")
+
+        # Search returns chunk ids for IndexIDMap2 indexes, positions for older flat ones
+        ids = [c.get("id", i) for i, c in enumerate(chunks)]
+        docs = {
+            str(i): Document(page_content=c["text"], metadata=c.get("metadata") or {})
+            for i, c in zip(ids, chunks)
+        }
+        kwargs = dict(
+            embedding_function=embeddings,
+            index=index,
+            docstore=InMemoryDocstore(docs),
+            index_to_docstore_id={i: str(i) for i in ids},
+        )
+        vectors_path = os.path.join(version, VECTORS_FILE)
+        if not is_flat(index) and os.path.exists(vectors_path):
+            vectors = np.load(vectors_path, mmap_mode="r" if mmap else None)
+            return RerankedFAISS(**kwargs, vectors=vectors, rows={i: row for row, i in enumerate(ids)})
+        return FAISS(**kwargs)
+
+    def delete(self, api_key: str) -> None:
+        shutil.rmtree(self.path(api_key), ignore_errors=True)
+
+
+def open_index_store():
+    """Index store for the configured VECTOR_BACKEND"""
+    if VECTOR_BACKEND == "sharded":
+        from sharded_index import ShardedIndex
+
+        return ShardedIndex()
+    if VECTOR_BACKEND != "faiss":
+        raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+    return IndexStore()
+
+
+# Global instance
+index_store = open_index_store()
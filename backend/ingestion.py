@@ -0,0 +1,253 @@
+# backend/ingestion.py
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+import httpx
+import requests
+from sqlalchemy import and_, or_
+
+from models import IngestionJob
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+INGESTION_RETRY_BACKOFF = float(os.getenv("INGESTION_RETRY_BACKOFF", "2.0"))
+# A running job whose owner hasn't sent a heartbeat for this long is presumed dead and reclaimed
+INGESTION_LEASE_SECONDS = float(os.getenv("INGESTION_LEASE_SECONDS", "300"))
+
+
+class TransientIngestionError(Exception):
+    """A failure worth retrying (network hiccup, 5xx, timeout)"""
+
+
+class PermanentIngestionError(Exception):
+    """A failure retrying won't fix (bad URL, empty site)"""
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, TransientIngestionError):
+        return True
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)) and exc.response is not None:
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return False
+
+
+class JobContext:
+    """Handed to the ingestion pipeline so it can report progress on its job row"""
+
+    def __init__(self, queue: "IngestionQueue", job_id: str, chatbot_id: str, kind: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.chatbot_id = chatbot_id
+        self.kind = kind
+
+    def report(self, stage: str, progress: int) -> None:
+        self.queue._update_owned(self.job_id, stage=stage, progress=progress)
+
+
+class IngestionQueue:
+    """Runs scrape -> chunk -> embed -> index jobs on a worker pool, tracking state in the ingestion_jobs table"""
+
+    def __init__(
+        self,
+        session_factory,
+        pipeline: Callable[[JobContext], None],
+        workers: int = INGESTION_WORKERS,
+        max_attempts: int = INGESTION_MAX_ATTEMPTS,
+        backoff: float = INGESTION_RETRY_BACKOFF,
+        lease: float = INGESTION_LEASE_SECONDS,
+        resume: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.pipeline = pipeline
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        # Whether this process looks for queued and abandoned jobs; the prefork server sets it in one worker
+        self.resume = resume
+        self.owner: Optional[str] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._heartbeat: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._pending: Set[str] = set()  # submitted to this process's pool and not finished yet
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start workers, then pick up queued jobs and running ones whose owner stopped heartbeating.
+
+        A job only runs where its claim succeeds, so a second resuming process wastes queries, not work.
+        """
+        with self._lock:
+            if self._pool is not None:
+                return
+            # Set here rather than in __init__ so forked workers get their own identity
+            self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingestion")
+            self._stopping.clear()
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="ingestion-heartbeat", daemon=True)
+            self._heartbeat.start()
+        if self.resume:
+            self._sweep()
+
+    def _claimable(self, now: datetime):
+        """Queued jobs, and running jobs with an expired (or pre-lease, NULL) heartbeat"""
+        expired = now - timedelta(seconds=self.lease)
+        return or_(
+            IngestionJob.status == "queued",
+            and_(
+                IngestionJob.status == "running",
+                or_(IngestionJob.heartbeat.is_(None), IngestionJob.heartbeat < expired),
+            ),
+        )
+
+    def _sweep(self) -> None:
+        """Submit every claimable job this process isn't already holding"""
+        db = self.session_factory()
+        try:
+            pending = db.query(IngestionJob.id).filter(self._claimable(datetime.utcnow())).all()
+        finally:
+            db.close()
+        for (job_id,) in pending:
+            with self._lock:
+                if job_id in self._pending:
+                    continue
+            print(f"Resuming ingestion job {job_id}")
+            self.submit(job_id)
+
+    def _heartbeat_loop(self) -> None:
+        """Renew the lease on this process's running jobs and reclaim jobs of dead owners"""
+        while not self._stopping.wait(self.lease / 3):
+            try:
+                db = self.session_factory()
+                try:
+                    db.query(IngestionJob).filter(
+                        IngestionJob.owner == self.owner, IngestionJob.status == "running"
+                    ).update({"heartbeat": datetime.utcnow()}, synchronize_session=False)
+                    db.commit()
+                finally:
+                    db.close()
+                if self.resume:
+                    self._sweep()
+            except Exception as e:
+                print(f"Ingestion heartbeat failed: {e}")
+
+    def create(self, db, chatbot_id: str, kind: str = "create") -> IngestionJob:
+        """Add a queued job row to the caller's session; submit() it after commit"""
+        job = IngestionJob(chatbot_id=chatbot_id, kind=kind, status="queued", stage="queued", progress=0, attempts=0)
+        db.add(job)
+        return job
+
+    def active_job(self, db, chatbot_id: str) -> Optional[IngestionJob]:
+        """A queued or running job of this chatbot, if any"""
+        return db.query(IngestionJob).filter(
+            IngestionJob.chatbot_id == chatbot_id, IngestionJob.status.in_(["queued", "running"])
+        ).first()
+
+    def submit(self, job_id: str) -> None:
+        if self._pool is None:
+            self.start()
+        with self._lock:
+            self._pending.add(job_id)
+        self._pool.submit(self._process, job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if not job:
+                return None
+            return {
+                "job_id": job.id,
+                "chatbot_id": job.chatbot_id,
+                "kind": job.kind,
+                "status": job.status,
+                "stage": job.stage,
+                "progress": job.progress,
+                "attempts": job.attempts,
+                "error": job.error,
+                "created_at": job.created_at,
+                "updated_at": job.updated_at,
+            }
+        finally:
+            db.close()
+
+    def _claim(self, job_id: str) -> Optional[Tuple[JobContext, int]]:
+        """Take a job for this process; None when another process holds it or it has finished"""
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            # One conditional UPDATE, so of several processes racing for a job exactly one wins
+            claimed = db.query(IngestionJob).filter(IngestionJob.id == job_id, self._claimable(now)).update(
+                {"status": "running", "owner": self.owner, "heartbeat": now}, synchronize_session=False
+            )
+            db.commit()
+            if claimed != 1:
+                return None
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            return JobContext(self, job.id, job.chatbot_id, job.kind), job.attempts or 0
+        finally:
+            db.close()
+
+    def _process(self, job_id: str) -> None:
+        try:
+            claim = self._claim(job_id)
+            if claim is None:
+                return
+            self._run(job_id, *claim)
+        finally:
+            with self._lock:
+                self._pending.discard(job_id)
+
+    def _run(self, job_id: str, ctx: JobContext, attempts: int) -> None:
+        while True:
+            attempts += 1
+            if not self._update_owned(job_id, stage="starting", attempts=attempts, error=None):
+                print(f"Ingestion job {job_id} was reclaimed by another worker")
+                return
+            try:
+                self.pipeline(ctx)
+                self._update_owned(job_id, status="succeeded", stage="done", progress=100)
+                print(f"Ingestion job {job_id} succeeded")
+                return
+            except Exception as e:
+                if is_transient(e) and attempts < self.max_attempts:
+                    delay = self.backoff * (2 ** (attempts - 1))
+                    print(f"Ingestion job {job_id} attempt {attempts} failed ({e}); retrying in {delay:.1f}s")
+                    # Stays "running" under this owner so no other worker picks it up during the backoff
+                    self._update_owned(job_id, stage="retrying", error=str(e))
+                    time.sleep(delay)
+                    continue
+                print(f"Ingestion job {job_id} failed: {e}")
+                self._update_owned(job_id, status="failed", stage="failed", error=str(e))
+                return
+
+    def _update_owned(self, job_id: str, **fields: Any) -> bool:
+        """Update a job this process still owns; False once its lease was lost to another worker"""
+        fields["heartbeat"] = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            updated = db.query(IngestionJob).filter(
+                IngestionJob.id == job_id, IngestionJob.owner == self.owner, IngestionJob.status == "running"
+            ).update(fields, synchronize_session=False)
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._pending.clear()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
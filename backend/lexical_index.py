@@ -0,0 +1,233 @@
+# backend/lexical_index.py
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_store import VECTOR_BACKEND, chunk_id
+
+LEXICAL_FILE = "bm25.json"
+
+# rrf, weighted, or dense (vector search only)
+HYBRID_MODE = os.getenv("HYBRID_MODE", "rrf")
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))  # dense weight in weighted mode
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "10"))
+RRF_K = 60
+# Answer identifier-style queries (SKUs, model numbers, prices) from BM25 alone
+LEXICAL_FASTPATH = os.getenv("LEXICAL_FASTPATH", "1") == "1"
+# Only short queries made up mostly of identifiers take the fast path
+LEXICAL_FASTPATH_MAX_TERMS = int(os.getenv("LEXICAL_FASTPATH_MAX_TERMS", "4"))
+LEXICAL_FASTPATH_MIN_SHARE = float(os.getenv("LEXICAL_FASTPATH_MIN_SHARE", "0.5"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps "ab-123", "v2.1" and "19.99" as single tokens
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+# Counts, times, ordinals and years: "2", "9am", "3rd", "2024"
+_QUANTITY = re.compile(r"\d{1,4}(?:st|nd|rd|th|am|pm|s)?")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or our s t "
+    "that the this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound tokens also yield their parts"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(p for p in re.split(r"[-_./]", token) if p and p not in _STOPWORDS)
+    return tokens
+
+
+def is_identifier(token: str) -> bool:
+    """Codes a visitor types verbatim: anything with a digit or an inner separator, except plain quantities"""
+    if _QUANTITY.fullmatch(token):
+        return False
+    return any(ch.isdigit() for ch in token) or not token.isalnum()
+
+
+class LexicalIndex:
+    """BM25 inverted index over one chatbot's chunks"""
+
+    def __init__(self, docs: List[Dict[str, Any]], doc_lens: np.ndarray,
+                 postings: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.docs = docs
+        self.doc_lens = doc_lens
+        self.postings = postings
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        n = len(docs)
+        self.idf = {
+            term: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in postings.items()
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate footprint: chunk text plus postings arrays"""
+        size = sum(len(d["text"].encode("utf-8")) for d in self.docs) + self.doc_lens.nbytes
+        for term, (ids, tfs) in self.postings.items():
+            size += len(term) + ids.nbytes + tfs.nbytes
+        return size
+
+    @classmethod
+    def build(cls, chunks: Sequence[Dict[str, Any]]) -> "LexicalIndex":
+        docs, lens = [], []
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        seen = set()
+        for c in chunks:
+            cid = chunk_id(c["text"])
+            if cid in seen:
+                continue
+            seen.add(cid)
+            doc = len(docs)
+            docs.append({"id": cid, "text": c["text"], "metadata": c.get("metadata") or {}})
+            tokens = tokenize(c["text"])
+            lens.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for t in tokens:
+                counts[t] = counts.get(t, 0) + 1
+            for t, tf in counts.items():
+                ids, tfs = postings.setdefault(t, ([], []))
+                ids.append(doc)
+                tfs.append(tf)
+        return cls(
+            docs,
+            np.asarray(lens, dtype=np.float32),
+            {t: (np.asarray(i, dtype=np.int32), np.asarray(f, dtype=np.float32)) for t, (i, f) in postings.items()},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "docs": self.docs,
+            "doc_lens": self.doc_lens.astype(int).tolist(),
+            "postings": {t: [ids.tolist(), tfs.astype(int).tolist()] for t, (ids, tfs) in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LexicalIndex":
+        return cls(
+            data["docs"],
+            np.asarray(data["doc_lens"], dtype=np.float32),
+            {
+                t: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+                for t, (ids, tfs) in data["postings"].items()
+            },
+        )
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k (doc position, BM25 score) pairs"""
+        if not self.docs:
+            return []
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens / (self.avgdl or 1.0))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            scores[ids] += self.idf[term] * tfs * (BM25_K1 + 1) / (tfs + norm[ids])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def document(self, position: int) -> Document:
+        doc = self.docs[position]
+        return Document(page_content=doc["text"], metadata=doc["metadata"])
+
+    def fast_path(self, query: str, k: int) -> Optional[List[Document]]:
+        """BM25-only results when the query is essentially an identifier this bot's pages contain.
+
+        "AB-123" or "price of ab-123" qualify; "how much is the 2 bedroom apartment?" goes
+        through dense retrieval and the semantic answer cache like any other question.
+        """
+        # Whole tokens only: tokenize() also emits the parts of "ab-123"
+        terms = [t for t in _TOKEN.findall(query.lower()) if t not in _STOPWORDS]
+        if not terms or len(terms) > LEXICAL_FASTPATH_MAX_TERMS:
+            return None
+        codes = [t for t in terms if is_identifier(t)]
+        if len(codes) < LEXICAL_FASTPATH_MIN_SHARE * len(terms) or not any(t in self.postings for t in codes):
+            return None
+        hits = self.search(query, k)
+        return [self.document(i) for i, _ in hits] or None
+
+
+def hybrid_search(vector_store, lexical: Optional[LexicalIndex], query: str, query_vector,
+                  k: int, mode: str = HYBRID_MODE, fetch_k: int = HYBRID_FETCH_K) -> List[Document]:
+    """Fuse dense and BM25 rankings; plain vector search without a lexical index"""
+    if lexical is None or mode == "dense":
+        return vector_store.similarity_search_by_vector(query_vector, k=k)
+
+    fetch_k = max(fetch_k, k)
+    dense = vector_store.similarity_search_with_score_by_vector(query_vector, k=fetch_k)
+    sparse = lexical.search(query, fetch_k)
+
+    docs: Dict[int, Document] = {}
+    scores: Dict[int, float] = {}
+    if mode == "rrf":
+        for rank, (doc, _) in enumerate(dense):
+            key = chunk_id(doc.page_content)
+            docs[key] = doc
+            scores[key] = scores.get(key, 0.0) + 1 / (RRF_K + rank + 1)
+        for rank, (position, _) in enumerate(sparse):
+            key = lexical.docs[position]["id"]
+            docs.setdefault(key, lexical.document(position))
+            scores[key] = scores.get(key, 0.0) + 1 / (RRF_K + rank + 1)
+    elif mode == "weighted":
+        # Min-max normalize each side; dense scores are L2 distances, so lower is better
+        if dense:
+            distances = [d for _, d in dense]
+            lo, hi = min(distances), max(distances)
+            for doc, d in dense:
+                key = chunk_id(doc.page_content)
+                docs[key] = doc
+                scores[key] = HYBRID_ALPHA * ((hi - d) / (hi - lo) if hi > lo else 1.0)
+        if sparse:
+            top = sparse[0][1]
+            for position, s in sparse:
+                key = lexical.docs[position]["id"]
+                docs.setdefault(key, lexical.document(position))
+                scores[key] = scores.get(key, 0.0) + (1 - HYBRID_ALPHA) * s / top
+    else:
+        raise ValueError(f"Unknown HYBRID_MODE: {mode}")
+
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)[:k]
+    return [docs[key] for key in ranked]
+
+
+class LexicalStore:
+    """Loads each chatbot's BM25 index from the same version as its vector index.
+
+    IndexStore.publish writes bm25.json into each version directory. The sharded backend
+    has no per-bot directories, so with persist off the index is rebuilt from the chunks
+    the vector store holds. That happens once per chain cache load, next to the vector
+    store it is cached with, and costs a read and tokenizing pass over all of the bot's
+    chunk text (bounded by its page budget, CRAWL_MAX_PAGES), paid by the request that
+    misses the cache.
+    """
+
+    def __init__(self, persist: bool = VECTOR_BACKEND != "sharded"):
+        self.persist = persist
+
+    def load(self, api_key: str, index_store, version: Optional[str] = None) -> Optional[LexicalIndex]:
+        """BM25 index of a version (by default the published one), or None for bots indexed before lexical search existed"""
+        if not self.persist:
+            return LexicalIndex.build(index_store.load_chunks(api_key))
+        path = os.path.join(index_store.current(api_key, version), LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return LexicalIndex.from_dict(json.load(f))
+
+
+# Global instance
+lexical_store = LexicalStore()
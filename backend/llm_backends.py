@@ -0,0 +1,470 @@
+# backend/llm_backends.py
+import fcntl
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from prefix_cache import PREFIX_CACHE_BYTES, PrefixCache, PrefixKV, as_model_cache, to_legacy
+from token_count import count_tokens, is_openai_model
+
+# hf | hf-int8 | onnx | onnx-int8 | fake | openai
+LLM_BACKEND = os.getenv("LLM_BACKEND", "hf")
+# Local backends serve this model; chatbot rows that name an OpenAI model fall back to it
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt2")
+# Intra-op threads for local inference; 0 keeps the runtime's default
+LLM_THREADS = int(os.getenv("LLM_THREADS", "0"))
+ONNX_DIR = os.getenv(
+    "ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes", "onnx")
+)
+# Simulated decode speed of the fake backend; 0 answers instantly
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "0"))
+
+
+class SamplingParams(NamedTuple):
+    max_new_tokens: int = 100
+    temperature: float = 0.7
+    top_p: float = 0.9
+    repetition_penalty: float = 1.2
+
+    @property
+    def do_sample(self) -> bool:
+        return self.temperature > 0
+
+
+class LLMBackend:
+    """One model behind generate / stream / batch, independent of the runtime that serves it.
+
+    prefixes are leading pieces of the prompt that many requests share (the template
+    text, a bot's retrieved context); backends that can cache their prefill use them.
+    """
+
+    name = "base"
+    # Hugging Face tokenizer when the backend has one, for exact token counts
+    tokenizer: Any = None
+
+    def __init__(self, model_id: str, sampling: SamplingParams = SamplingParams()):
+        self.model_id = model_id
+        self.sampling = sampling
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.generated_tokens = 0
+        self.busy_time = 0.0
+
+    def batch(self, prompts: List[str], prefixes: Optional[List[Sequence[str]]] = None) -> List[str]:
+        raise NotImplementedError
+
+    def generate(self, prompt: str, prefixes: Sequence[str] = ()) -> str:
+        return self.batch([prompt], [prefixes])[0]
+
+    def stream(self, prompt: str, prefixes: Sequence[str] = ()) -> Iterator[str]:
+        """Text deltas as they are decoded; closing the iterator stops generation"""
+        yield self.generate(prompt, prefixes)
+
+    def count_tokens(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return count_tokens(text, self.model_id)
+
+    def as_langchain(self) -> LLM:
+        return BackendLLM(backend=self)
+
+    def _record(self, requests: int, tokens: int, seconds: float) -> None:
+        with self._lock:
+            self.requests += requests
+            self.generated_tokens += tokens
+            self.busy_time += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "model": self.model_id,
+                "requests": self.requests,
+                "generated_tokens": self.generated_tokens,
+                "tokens_per_sec": self.generated_tokens / self.busy_time if self.busy_time else 0.0,
+            }
+
+
+class BackendLLM(LLM):
+    """LangChain adapter over any LLMBackend"""
+
+    backend: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"backend_{self.backend.name}"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        text = self.backend.generate(prompt)
+        if stop:
+            for token in stop:
+                text = text.split(token)[0]
+        return text
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        for delta in self.backend.stream(prompt):
+            chunk = GenerationChunk(text=delta)
+            if run_manager:
+                run_manager.on_llm_new_token(delta, chunk=chunk)
+            yield chunk
+
+
+# Loaded (tokenizer, model) pairs by (backend, model id); backends that differ only in
+# sampling settings share weights
+_models: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+_models_lock = threading.Lock()
+
+
+def _load_tokenizer(model_id: str):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # Decoder-only models must be left-padded for batched generation
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+def _quantize_int8(model):
+    """Dynamic int8 quantization of every linear layer.
+
+    GPT-2 implements its projections as transformers' Conv1D (a transposed Linear),
+    which quantize_dynamic doesn't recognize, so those are converted to Linear first.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _shared_model(kind: str, model_id: str, loader) -> Tuple[Any, Any]:
+    key = (kind, model_id)
+    with _models_lock:
+        if key not in _models:
+            start = time.time()
+            _models[key] = loader()
+            print(f"Loaded {kind} model {model_id} in {time.time() - start:.2f}s")
+        return _models[key]
+
+
+class HFBackend(LLMBackend):
+    """transformers model on CPU with a KV-cached decode loop for streaming"""
+
+    name = "hf"
+    quantize = False
+    supports_prefix_cache = True
+
+    def __init__(self, model_id: str, sampling: SamplingParams = SamplingParams(), threads: int = LLM_THREADS):
+        super().__init__(model_id, sampling)
+        self.threads = threads
+        self.tokenizer, self.model = _shared_model(self.name, model_id, self._load)
+        self.prefix_cache = PrefixCache() if self.supports_prefix_cache and PREFIX_CACHE_BYTES > 0 else None
+
+    def _load(self):
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        model = AutoModelForCausalLM.from_pretrained(self.model_id)
+        model.eval()
+        if self.quantize:
+            model = _quantize_int8(model)
+        return _load_tokenizer(self.model_id), model
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["prefix_cache"] = self.prefix_cache.stats() if self.prefix_cache is not None else None
+        return stats
+
+    def _generate_kwargs(self) -> Dict[str, Any]:
+        s = self.sampling
+        kwargs = dict(
+            max_new_tokens=s.max_new_tokens,
+            do_sample=s.do_sample,
+            repetition_penalty=s.repetition_penalty,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+        )
+        if s.do_sample:
+            kwargs.update(temperature=s.temperature, top_p=s.top_p)
+        return kwargs
+
+    def batch(self, prompts: List[str], prefixes: Optional[List[Sequence[str]]] = None) -> List[str]:
+        import torch
+
+        if self.prefix_cache is not None and len(prompts) == 1 and prefixes and prefixes[0]:
+            # A lone prompt goes through the decode loop, which can start from a cached prefix
+            return ["".join(self.stream(prompts[0], prefixes[0]))]
+
+        start = time.time()
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            output = self.model.generate(**inputs, **self._generate_kwargs())
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        generated = int((new_tokens != self.tokenizer.pad_token_id).sum())
+        self._record(len(prompts), generated, time.time() - start)
+        return texts
+
+    def _logits_processor(self):
+        from transformers import (
+            LogitsProcessorList,
+            RepetitionPenaltyLogitsProcessor,
+            TemperatureLogitsWarper,
+            TopPLogitsWarper,
+        )
+
+        s = self.sampling
+        processors = LogitsProcessorList()
+        if s.repetition_penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(s.repetition_penalty))
+        if s.do_sample:
+            processors.append(TemperatureLogitsWarper(s.temperature))
+            processors.append(TopPLogitsWarper(s.top_p))
+        return processors
+
+    def _prefix_past(self, ids: List[int], base: Optional[PrefixKV]):
+        import torch
+
+        start = base.length if base is not None else 0
+        with torch.no_grad():
+            out = self.model(
+                input_ids=torch.tensor([ids[start:]]),
+                attention_mask=torch.ones(1, len(ids), dtype=torch.long),
+                past_key_values=as_model_cache(base.past) if base is not None else None,
+                use_cache=True,
+            )
+        return to_legacy(out.past_key_values)
+
+    def _cached_prefix(self, input_ids, prefixes: Sequence[str]):
+        """(past, length) for the longest shared prefix of the prompt, or (None, 0)"""
+        if self.prefix_cache is None or not prefixes:
+            return None, 0
+        candidates = [self.tokenizer(p)["input_ids"] for p in prefixes]
+        entry = self.prefix_cache.lookup(input_ids[0].tolist(), candidates, self._prefix_past)
+        if entry is None:
+            return None, 0
+        return as_model_cache(entry.past), entry.length
+
+    def stream(self, prompt: str, prefixes: Sequence[str] = ()) -> Iterator[str]:
+        """Prefill once (only past any cached prefix), then feed one token per step against the cached keys/values"""
+        import torch
+
+        start = time.time()
+        processor = self._logits_processor()
+        input_ids = self.tokenizer(prompt, return_tensors="pt")["input_ids"]
+        past, cached = self._cached_prefix(input_ids, prefixes)
+        step_ids = input_ids[:, cached:]
+        new_ids: List[int] = []
+        emitted = ""
+        try:
+            with torch.no_grad():
+                for _ in range(self.sampling.max_new_tokens):
+                    out = self.model(
+                        input_ids=step_ids,
+                        attention_mask=torch.ones_like(input_ids),
+                        past_key_values=past,
+                        use_cache=True,
+                    )
+                    past = out.past_key_values
+                    scores = processor(input_ids, out.logits[:, -1, :])
+                    if self.sampling.do_sample:
+                        next_id = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+                    else:
+                        next_id = scores.argmax(dim=-1, keepdim=True)
+                    if next_id.item() == self.tokenizer.eos_token_id:
+                        break
+                    new_ids.append(next_id.item())
+                    input_ids = torch.cat([input_ids, next_id], dim=-1)
+                    step_ids = next_id
+
+                    text = self.tokenizer.decode(new_ids, skip_special_tokens=True)
+                    # Wait for the rest of a multi-byte character
+                    if text.endswith("\ufffd"):
+                        continue
+                    delta, emitted = text[len(emitted):], text
+                    if delta:
+                        yield delta
+        finally:
+            self._record(1, len(new_ids), time.time() - start)
+
+
+class HFInt8Backend(HFBackend):
+    """HFBackend with dynamically quantized int8 linear layers"""
+
+    name = "hf-int8"
+    quantize = True
+
+
+class OnnxBackend(HFBackend):
+    """ONNX Runtime export of the model (via optimum), optionally int8-quantized.
+
+    The export is written once under ONNX_DIR and reused by later processes.
+    """
+
+    name = "onnx"
+    # optimum manages the ONNX graph's past inputs itself
+    supports_prefix_cache = False
+
+    def _export(self, path: str) -> str:
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        fp32_dir = os.path.join(ONNX_DIR, self.model_id.replace("/", "--"))
+        if not os.path.exists(os.path.join(fp32_dir, "model.onnx")):
+            print(f"Exporting {self.model_id} to ONNX...")
+            ORTModelForCausalLM.from_pretrained(self.model_id, export=True, use_cache=True).save_pretrained(fp32_dir)
+        if not self.quantize:
+            return "model.onnx"
+
+        file_name = "model_quantized.onnx"
+        if not os.path.exists(os.path.join(path, file_name)):
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            print(f"Quantizing ONNX export of {self.model_id} to int8...")
+            quantizer = ORTQuantizer.from_pretrained(fp32_dir, file_name="model.onnx")
+            quantizer.quantize(save_dir=path, quantization_config=AutoQuantizationConfig.avx2(is_static=False))
+        return file_name
+
+    def _load(self):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        path = os.path.join(ONNX_DIR, self.model_id.replace("/", "--") + ("-int8" if self.quantize else ""))
+        os.makedirs(ONNX_DIR, exist_ok=True)
+        # Workers starting together export once
+        with open(os.path.join(ONNX_DIR, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                file_name = self._export(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        # Requests already run concurrently on the inference executor
+        options.inter_op_num_threads = 1
+        model = ORTModelForCausalLM.from_pretrained(
+            path, file_name=file_name, use_cache=True, session_options=options, provider="CPUExecutionProvider"
+        )
+        return _load_tokenizer(self.model_id), model
+
+
+class OnnxInt8Backend(OnnxBackend):
+    name = "onnx-int8"
+    quantize = True
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic stand-in for load tests and offline development; no model or network"""
+
+    name = "fake"
+
+    def __init__(self, model_id: str = "fake", sampling: SamplingParams = SamplingParams(),
+                 tokens_per_sec: float = FAKE_LLM_TOKENS_PER_SEC):
+        super().__init__(model_id, sampling)
+        self.tokens_per_sec = tokens_per_sec
+
+    def _answer(self, prompt: str) -> List[str]:
+        lines = [line for line in prompt.strip().splitlines() if line.strip()]
+        question = next((line for line in reversed(lines) if line.startswith(("Question:", "User:"))), "")
+        words = f"This is a placeholder answer to: {question.split(':', 1)[-1].strip()}".split()
+        return words[: self.sampling.max_new_tokens]
+
+    def batch(self, prompts: List[str], prefixes: Optional[List[Sequence[str]]] = None) -> List[str]:
+        return ["".join(self.stream(p)) for p in prompts]
+
+    def stream(self, prompt: str, prefixes: Sequence[str] = ()) -> Iterator[str]:
+        start = time.time()
+        words = self._answer(prompt)
+        try:
+            for i, word in enumerate(words):
+                if self.tokens_per_sec > 0:
+                    time.sleep(1 / self.tokens_per_sec)
+                yield word if i == 0 else " " + word
+        finally:
+            self._record(1, len(words), time.time() - start)
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat model through LangChain's ChatOpenAI"""
+
+    name = "openai"
+
+    def __init__(self, model_id: str, sampling: SamplingParams = SamplingParams(),
+                 http_client=None, api_key: Optional[str] = None):
+        from langchain_community.chat_models import ChatOpenAI
+
+        super().__init__(model_id, sampling)
+        self.client = ChatOpenAI(
+            model_name=model_id,
+            temperature=sampling.temperature,
+            max_tokens=sampling.max_new_tokens,
+            openai_api_key=api_key,
+            http_client=http_client
+        )
+
+    def batch(self, prompts: List[str], prefixes: Optional[List[Sequence[str]]] = None) -> List[str]:
+        start = time.time()
+        texts = [m.content for m in self.client.batch(prompts)]
+        self._record(len(prompts), sum(self.count_tokens(t) for t in texts), time.time() - start)
+        return texts
+
+    def stream(self, prompt: str, prefixes: Sequence[str] = ()) -> Iterator[str]:
+        start = time.time()
+        text = ""
+        try:
+            for chunk in self.client.stream(prompt):
+                text += chunk.content
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            self._record(1, self.count_tokens(text), time.time() - start)
+
+    def as_langchain(self):
+        # Chains get the native chat model, with message roles intact
+        return self.client
+
+
+BACKENDS: Dict[str, Type[LLMBackend]] = {
+    HFBackend.name: HFBackend,
+    HFInt8Backend.name: HFInt8Backend,
+    OnnxBackend.name: OnnxBackend,
+    OnnxInt8Backend.name: OnnxInt8Backend,
+    FakeBackend.name: FakeBackend,
+    OpenAIBackend.name: OpenAIBackend,
+}
+
+
+def create_backend(name: str = LLM_BACKEND, model_id: str = LLM_MODEL,
+                   sampling: SamplingParams = SamplingParams(), **kwargs: Any) -> LLMBackend:
+    """Backend by name; extra kwargs (http_client, api_key, threads) go to backends that take them"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    cls = BACKENDS[name]
+    if cls is OpenAIBackend:
+        return cls(model_id, sampling, http_client=kwargs.get("http_client"), api_key=kwargs.get("api_key"))
+    if issubclass(cls, HFBackend):
+        if is_openai_model(model_id):
+            model_id = LLM_MODEL
+        return cls(model_id, sampling, threads=kwargs.get("threads", LLM_THREADS))
+    return cls(model_id, sampling)
@@ -0,0 +1,77 @@
+# backend/lookup_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "300"))
+LOOKUP_CACHE_NEGATIVE_TTL = float(os.getenv("LOOKUP_CACHE_NEGATIVE_TTL", "30"))
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", "100000"))
+
+
+class ChatbotRef(NamedTuple):
+    """The handful of Chatbot columns the chat hot path needs"""
+    id: str
+    is_active: int
+    name: str
+    tier: str = "free"  # owner's User.subscription_tier
+
+
+class ChatbotLookupCache:
+    """api_key -> ChatbotRef with TTL; unknown keys are cached as None for a shorter TTL"""
+
+    def __init__(
+        self,
+        ttl: float = LOOKUP_CACHE_TTL,
+        negative_ttl: float = LOOKUP_CACHE_NEGATIVE_TTL,
+        max_entries: int = LOOKUP_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[ChatbotRef], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def lookup(self, api_key: str) -> Tuple[bool, Optional[ChatbotRef]]:
+        """Returns (found, ref); found with ref None means the key is known not to exist"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(api_key)
+            if item is not None and item[1] > now:
+                self._entries.move_to_end(api_key)
+                if item[0] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return True, item[0]
+            if item is not None:
+                del self._entries[api_key]
+            self.misses += 1
+            return False, None
+
+    def store(self, api_key: str, ref: Optional[ChatbotRef]) -> None:
+        expires = time.monotonic() + (self.ttl if ref is not None else self.negative_ttl)
+        with self._lock:
+            self._entries[api_key] = (ref, expires)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, api_key: str) -> None:
+        with self._lock:
+            self._entries.pop(api_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
@@ -1,9 +1,10 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Any, NamedTuple
 import uuid
+import hmac
 from dotenv import load_dotenv
 load_dotenv()
 from datetime import datetime
@@ -13,64 +14,78 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from passlib.context import CryptContext
 import jwt
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.llms import HuggingFacePipeline
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-import torch
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+# torch, transformers, faiss and most of langchain are imported on first use (see model_registry)
+from langchain_core.prompts import PromptTemplate
+import asyncio
 from db import SessionLocal, engine, Base
-from models import User, Chatbot, Conversation
-
-
-
-from bs4 import BeautifulSoup
-import requests
-
-def scrape_website_text(url: str) -> str:
-    try:
-        res = requests.get(url, timeout=10)
-        res.raise_for_status()
-        soup = BeautifulSoup(res.text, "html.parser")
-        # Remove scripts and styles
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = ' '.join(soup.stripped_strings)
-        return text[:5000]  # limit to 5000 chars to avoid huge embeddings
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return ""
-
-
-def scrape_main_content(url: str) -> str:
-    try:
-        res = requests.get(url, timeout=10)
-        res.raise_for_status()
-        soup = BeautifulSoup(res.text, "html.parser")
-        
-        # Grab only meaningful text
-        content = []
-        for tag in soup.find_all(["p", "h1", "h2", "h3", "li"]):
-            text = tag.get_text(strip=True)
-            if text:
-                content.append(text)
-        
-        text = ' '.join(content)
-        return text[:5000]  # limit to 5000 chars to avoid too large embeddings
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return ""
-
-
-
-
-
-Base.metadata.create_all(bind=engine)
+from models import User, Chatbot, Conversation, ChatbotUsage
+from embedding_engine import get_embedding_engine
+from chain_cache import ChainCache, CachedChain
+from inference import InferenceExecutor, ExecutorSaturated
+from answer_cache import AnswerCache
+from lookup_cache import ChatbotLookupCache, ChatbotRef
+from conversation_logger import ConversationLogger
+from ingestion import IngestionQueue, JobContext, PermanentIngestionError
+from crawler import crawl_site
+from extractor import get_extractor
+from sessions import (
+    SessionStore, SqlSessionSpill, pack_history, format_history, llm_summarizer, session_key,
+    SESSION_SPILL, SESSION_SUMMARIZE,
+)
+from token_count import count_tokens, register_tokenizer
+from metering import get_usage_meter, seconds_until_reset, utc_day
+from model_registry import model_registry, MODEL_WARMUP
+from prompt_assembler import PromptAssembler, get_reranker, model_window, retrieval_k
+
+
+MAX_TRAINING_CHARS = int(os.getenv("MAX_TRAINING_CHARS", "200000"))
+
+def get_index_store():
+    """Vector index store; importing it pulls in faiss and langchain, so it waits for first use"""
+    from index_store import index_store
+    return index_store
+
+def get_lexical_store():
+    from lexical_index import lexical_store
+    return lexical_store
+
+def chunk_pages(pages, previous_chunks=()):
+    """Split crawled pages into {"text", "metadata"} chunks, reusing stored chunks of unchanged pages.
+
+    Returns (chunks, training_data); total text is capped at MAX_TRAINING_CHARS.
+    """
+    previous = {}
+    for c in previous_chunks:
+        meta = c.get("metadata") or {}
+        if meta.get("url") and meta.get("page_hash"):
+            previous.setdefault((meta["url"], meta["page_hash"]), []).append(c)
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    extractor = get_extractor()
+    chunks, texts, total = [], [], 0
+    for page in pages:
+        extraction = extractor.extract(page.html)
+        text = extraction.text
+        if not text:
+            continue
+        total += len(text)
+        texts.append(text)
+
+        reused = previous.get((page.url, page.content_hash))
+        if reused:
+            chunks.extend({"text": c["text"], "metadata": c["metadata"]} for c in reused)
+        else:
+            # Chunks never straddle sections, and carry their heading as metadata
+            for section in extraction.sections:
+                meta = {"url": page.url, "page_hash": page.content_hash}
+                if section.heading:
+                    meta["heading"] = section.heading
+                chunks.extend({"text": t, "metadata": dict(meta)} for t in text_splitter.split_text(section.text))
+        if total >= MAX_TRAINING_CHARS:
+            break
+    return chunks, "\n\n".join(texts)[:MAX_TRAINING_CHARS]
 
 # FastAPI app
 app = FastAPI(title="AI Chatbot Builder API")
@@ -84,7 +99,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from fastapi.responses import Response
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 @app.get("/embed.js")
 def embed_js():
@@ -92,6 +108,8 @@ def embed_js():
 (function() {
     const scriptTag = document.currentScript;
     const apiKey = scriptTag.getAttribute('data-chatbot-key');
+    // Conversation memory lasts as long as the browser tab
+    const sessionStorageKey = 'chatbot_session_' + apiKey;
 
     const container = document.createElement('div');
     container.id = 'chatbot-container';
@@ -140,20 +158,55 @@ def embed_js():
         messages.scrollTop = messages.scrollHeight;
 
         try {
-            const res = await fetch('http://127.0.0.1:8000/api/chat', {
+            const res = await fetch('http://127.0.0.1:8000/api/chat/stream', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({message: msg, chatbot_api_key: apiKey})
+                body: JSON.stringify({
+                    message: msg,
+                    chatbot_api_key: apiKey,
+                    session_id: sessionStorage.getItem(sessionStorageKey)
+                })
             });
 
-            if (!res.ok) {
+            if (!res.ok || !res.body) {
                 throw new Error('Failed to get response');
             }
 
-            const data = await res.json();
-            botElem.style.fontStyle = 'normal';
-            botElem.style.color = '#000';
-            botElem.innerText = data.response || 'Sorry, I could not generate a response.';
+            // Render tokens as Server-Sent Events frames arrive
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            let started = false;
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const frames = buffer.split('\\n\\n');
+                buffer = frames.pop();
+                for (const frame of frames) {
+                    const isDone = frame.startsWith('event: done');
+                    const dataLine = frame.split('\\n').find(l => l.startsWith('data: '));
+                    if (!dataLine) continue;
+                    const data = JSON.parse(dataLine.slice(6));
+                    if (!started) {
+                        started = true;
+                        botElem.style.fontStyle = 'normal';
+                        botElem.style.color = '#000';
+                    }
+                    if (isDone && data.session_id) {
+                        sessionStorage.setItem(sessionStorageKey, data.session_id);
+                    }
+                    text = isDone ? data.response : text + data.token;
+                    botElem.innerText = text;
+                    messages.scrollTop = messages.scrollHeight;
+                }
+            }
+            if (!text) {
+                botElem.style.fontStyle = 'normal';
+                botElem.style.color = '#000';
+                botElem.innerText = 'Sorry, I could not generate a response.';
+            }
         } catch (error) {
             botElem.style.fontStyle = 'normal';
             botElem.style.color = 'red';
@@ -183,6 +236,8 @@ def embed_js():
 # Password hashing
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+# Bearer token for operator endpoints such as /api/stats/cache; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -201,6 +256,8 @@ class ChatbotCreate(BaseModel):
 class ChatMessage(BaseModel):
     message: str
     chatbot_api_key: str
+    # Issued by the server on the first reply; the widget sends it back on later turns
+    session_id: Optional[str] = None
 
 # Dependencies
 def get_db():
@@ -220,37 +277,168 @@ def verify_token(authorization: str = Header(None)):
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-# Store for vector stores and QA chains
-vector_stores = {}
-qa_chains = {}
-
-# Global LLM setup with better configuration
-print("Loading LLM model... This may take a moment...")
-model_id = "gpt2"  # Using base GPT-2 for faster responses
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-
-# Set padding token
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
-
-model = AutoModelForCausalLM.from_pretrained(model_id)
-
-# Optimized pipeline configuration
-pipe = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    max_new_tokens=100,
-    temperature=0.7,
-    do_sample=True,
-    top_p=0.9,
-    repetition_penalty=1.2,
-    pad_token_id=tokenizer.eos_token_id,
-    eos_token_id=tokenizer.eos_token_id
+def verify_admin(authorization: str = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    token = (authorization or "").replace("Bearer ", "")
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+# Bounded cache of vector stores and lexical indexes, keyed by api_key
+qa_cache = ChainCache()
+
+# api_key -> (id, is_active, name) so the chat hot path skips the database
+chatbot_lookup = ChatbotLookupCache()
+
+# Chat turns are written to the database in batches off the request path
+conversation_logger = ConversationLogger(SessionLocal)
+
+# Repeat questions are answered without retrieval or generation
+answer_cache = AnswerCache()
+
+# Model work runs here so it can't starve the default threadpool
+inference_executor = InferenceExecutor()
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+schema_ready = False
+
+def create_schema():
+    """Create missing tables; the prefork master does this once, before forking"""
+    global schema_ready
+    Base.metadata.create_all(bind=engine)
+    schema_ready = True
+
+@app.on_event("startup")
+def start_background_workers():
+    # Kept out of import time so tools and tests can import main without a database
+    if not schema_ready:
+        create_schema()
+    conversation_logger.start()
+    ingestion_queue.start()
+    get_usage_meter()
+    if MODEL_WARMUP == "background":
+        model_registry.warm_up()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    inference_executor.shutdown()
+    if model_registry.loaded("llm"):
+        get_llm().batcher.stop()
+    conversation_logger.stop()
+    ingestion_queue.stop()
+    chat_sessions.flush()
+    get_usage_meter().stop()
+
+# Local chat model; LLM_BACKEND picks the runtime that serves it (see llm_backends)
+model_id = os.getenv("LLM_MODEL", "gpt2")  # Using base GPT-2 for faster responses
+
+class LLMBundle(NamedTuple):
+    backend: Any
+    batcher: Any
+    llm: Any
+
+def load_llm() -> LLMBundle:
+    """Chat model backend and its batched LangChain adapter; loaded once by the registry"""
+    from llm_backends import create_backend
+    from batching import GenerationBatcher, BatchedLLM
+
+    backend = create_backend(model_id=model_id)
+    if backend.tokenizer is not None:
+        register_tokenizer(model_id, backend.tokenizer)
+
+    # Concurrent chats across all bots share batched generate calls
+    batcher = GenerationBatcher(backend)
+    return LLMBundle(backend, batcher, BatchedLLM(batcher=batcher))
+
+model_registry.register("llm", load_llm)
+model_registry.register("embeddings", lambda: get_embedding_engine().model)
+if get_reranker() is not None:
+    model_registry.register("reranker", lambda: get_reranker().model)
+
+def get_llm() -> LLMBundle:
+    """The chat model, loading it on first use if warm-up hasn't finished"""
+    return model_registry.get("llm")
+
+prompt_template = """Use the following context to answer the question. If you don't know the answer, just say you don't know.
+
+Context: {context}
+
+{history}Question: {question}
+
+Answer:"""
+
+# history is empty on a session's first turn
+PROMPT = PromptTemplate(
+    template=prompt_template,
+    input_variables=["context", "question"],
+    partial_variables={"history": ""}
+)
+
+# Chunks fetched per question; the assembler dedupes them and fits them to the model window
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "2"))
+
+prompt_assembler = PromptAssembler(count=lambda text: count_tokens(text, model_id), reranker=get_reranker())
+
+# Characters in a visitor message before it is even tokenized
+MAX_MESSAGE_CHARS = int(os.getenv("MAX_MESSAGE_CHARS", "4000"))
+
+def prompt_budget() -> int:
+    """Prompt tokens the model window leaves after the answer's tokens"""
+    backend = get_llm().backend
+    return model_window(model_id, backend.tokenizer) - backend.sampling.max_new_tokens
+
+def check_message(message: str) -> None:
+    """413 for a question that can't fit the model window on its own"""
+    if len(message) > MAX_MESSAGE_CHARS or (
+        count_tokens(PROMPT.format(context="", question=message, history=""), model_id) > prompt_budget()
+    ):
+        raise HTTPException(status_code=413, detail="Message is too long")
+
+def fit_history(message: str, history: str) -> str:
+    """The history, or none when it would push the question past the window"""
+    if history and count_tokens(PROMPT.format(context="", question=message, history=history), model_id) > prompt_budget():
+        return ""
+    return history
+
+def assemble_context(message: str, docs, history: str):
+    """Context that fits the window next to the template, history, question and the answer's tokens"""
+    backend = get_llm().backend
+    window = model_window(model_id, backend.tokenizer)
+    fixed = count_tokens(PROMPT.format(context="", question=message, history=history), model_id)
+    return prompt_assembler.assemble(message, docs, max(0, window - fixed - backend.sampling.max_new_tokens))
+
+# Text before {context} is the same for every request, so its KV cache is computed once
+TEMPLATE_PREFIX = prompt_template.split("{context}")[0]
+
+def prompt_prefixes(context: str):
+    """Shared leading pieces of a prompt, for the local model's prefix KV cache"""
+    from prefix_cache import PREFIX_CACHE_CONTEXT
+
+    if not PREFIX_CACHE_CONTEXT:
+        return (TEMPLATE_PREFIX,)
+    # Repeat questions often retrieve the same chunks; history and question come after
+    return (TEMPLATE_PREFIX, TEMPLATE_PREFIX + context + "\n\n")
+
+# Multi-turn memory for widget sessions, packed into the prompt under a token budget
+chat_sessions = SessionStore(
+    spill=SqlSessionSpill(SessionLocal) if SESSION_SPILL else None,
+    summarizer=llm_summarizer(
+        lambda prompt: get_llm().llm.invoke(prompt), count=lambda text: count_tokens(text, model_id)
+    ) if SESSION_SUMMARIZE else None,
 )
 
-llm = HuggingFacePipeline(pipeline=pipe)
-print("LLM model loaded successfully!")
+def load_history(key: str) -> str:
+    """Prompt section with the session's summary and most recent turns"""
+    summary, turns = pack_history(*chat_sessions.get(key), count=lambda text: count_tokens(text, model_id))
+    history = format_history(summary, turns)
+    return f"Conversation so far:\n{history}\n\n" if history else ""
 
 # Routes
 @app.post("/api/auth/register")
@@ -277,68 +465,105 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
     token = jwt.encode({"user_id": db_user.id}, SECRET_KEY, algorithm="HS256")
     return {"token": token, "user_id": db_user.id}
 
-@app.post("/api/chatbots")
-def create_chatbot(chatbot: ChatbotCreate, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
-    api_key = f"cb_{uuid.uuid4().hex}"
-
-    # Scrape website content automatically
-    training_data = scrape_website_text(chatbot.website_url)
-    if not training_data:
-        raise HTTPException(status_code=400, detail="Failed to scrape website content")
-
+def ingest_chatbot(job: JobContext):
+    """Scrape -> chunk -> embed -> index for one chatbot; runs on the ingestion workers"""
+    db = SessionLocal()
     try:
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = text_splitter.split_text(training_data)
-
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        vector_store = FAISS.from_texts(chunks, embeddings)
-
-        prompt_template = """Use the following context to answer the question. If you don't know the answer, just say you don't know.
-
-Context: {context}
-
-Question: {question}
+        chatbot = db.query(Chatbot.api_key, Chatbot.website_url).filter(Chatbot.id == job.chatbot_id).first()
+    finally:
+        db.close()
+    if not chatbot:
+        raise PermanentIngestionError("Chatbot no longer exists")
+    api_key = chatbot.api_key
+
+    job.report("crawling", 10)
+    pages = crawl_site(chatbot.website_url)
+    print(f"Crawled {len(pages)} pages from {chatbot.website_url}")
+
+    job.report("chunking", 30)
+    index_store = get_index_store()
+    previous = index_store.load_chunks(api_key) if index_store.exists(api_key) else []
+    chunks, training_data = chunk_pages(pages, previous)
+    if not chunks:
+        raise PermanentIngestionError("Failed to scrape website content")
+
+    # Only new or changed chunks are embedded; stale ones are removed by id
+    job.report("embedding", 40)
+    stats = index_store.sync(api_key, chunks, get_embedding_engine())
+    print(f"Index for {api_key} synced: {stats}")
+
+    job.report("indexing", 80)
+    # Read before loading, so a sync landing in between can't get this chain tagged as its own
+    version = index_store.version(api_key)
+    entry = open_chain(index_store, api_key, version)
 
-Answer:"""
+    db = SessionLocal()
+    try:
+        db.query(Chatbot).filter(Chatbot.id == job.chatbot_id).update({"training_data": training_data})
+        db.commit()
+    finally:
+        db.close()
 
-        PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
+    # Other workers notice the new version on their next request and drop their copies
+    qa_cache.put(api_key, entry, version)
+    answer_cache.invalidate(api_key)
 
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vector_store.as_retriever(search_kwargs={"k": 2}),
-            chain_type_kwargs={"prompt": PROMPT},
-            return_source_documents=False
-        )
+# Chatbot training runs in the background, tracked in the ingestion_jobs table
+ingestion_queue = IngestionQueue(SessionLocal, ingest_chatbot)
 
-        vector_stores[api_key] = vector_store
-        qa_chains[api_key] = qa_chain
+@app.post("/api/chatbots", status_code=202)
+def create_chatbot(chatbot: ChatbotCreate, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+    api_key = f"cb_{uuid.uuid4().hex}"
 
-        new_chatbot = Chatbot(
-            user_id=user_id,
-            name=chatbot.name,
-            website_url=chatbot.website_url,
-            training_data=training_data,
-            api_key=api_key
-        )
-        db.add(new_chatbot)
-        db.commit()
-        db.refresh(new_chatbot)
+    new_chatbot = Chatbot(
+        user_id=user_id,
+        name=chatbot.name,
+        website_url=chatbot.website_url,
+        api_key=api_key
+    )
+    db.add(new_chatbot)
+    db.flush()
+    job = ingestion_queue.create(db, new_chatbot.id)
+    db.commit()
 
-        domain = "http://127.0.0.1:8000"
-        return {
-            "chatbot_id": new_chatbot.id,
-            "api_key": api_key,
-            "embed_code": f'<script src="{domain}/embed.js" data-chatbot-key="{api_key}"></script>'
-        }
+    # Scraping, embedding and indexing happen on the ingestion workers
+    ingestion_queue.submit(job.id)
 
-    except Exception as e:
-        print(f"Error creating chatbot: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to create chatbot: {e}")
+    domain = "http://127.0.0.1:8000"
+    return {
+        "chatbot_id": new_chatbot.id,
+        "job_id": job.id,
+        "status": "queued",
+        "api_key": api_key,
+        "embed_code": f'<script src="{domain}/embed.js" data-chatbot-key="{api_key}"></script>'
+    }
 
+@app.post("/api/chatbots/{chatbot_id}/refresh", status_code=202)
+def refresh_chatbot(chatbot_id: str, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+    """Re-crawl the site and re-embed only chunks whose content changed"""
+    exists = db.query(Chatbot.id).filter(Chatbot.id == chatbot_id, Chatbot.user_id == user_id).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Chatbot not found")
 
+    # A queued or running job will pick up the site as it is now; don't race it
+    active = ingestion_queue.active_job(db, chatbot_id)
+    if active:
+        return {"chatbot_id": chatbot_id, "job_id": active.id, "status": active.status}
 
+    job = ingestion_queue.create(db, chatbot_id, kind="refresh")
+    db.commit()
+    ingestion_queue.submit(job.id)
+    return {"chatbot_id": chatbot_id, "job_id": job.id, "status": "queued"}
+
+@app.get("/api/ingestion/jobs/{job_id}")
+def get_ingestion_job(job_id: str, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+    status = ingestion_queue.status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    owner = db.query(Chatbot.user_id).filter(Chatbot.id == status["chatbot_id"]).scalar()
+    if owner != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
 
 @app.get("/api/chatbots")
 def get_chatbots(user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
@@ -351,134 +576,378 @@ def get_chatbots(user_id: str = Depends(verify_token), db: Session = Depends(get
         "created_at": c.created_at
     } for c in chatbots]
 
-def rebuild_qa_chain(chatbot: Chatbot, api_key: str):
-    """Rebuild QA chain from stored training data"""
+def open_chain(index_store, api_key: str, version: Optional[str]) -> CachedChain:
+    """Vector store and BM25 index read from the same version of the persisted index"""
+    vector_store = index_store.load(api_key, get_embedding_engine(), version=version)
+    try:
+        lexical = get_lexical_store().load(api_key, index_store, version)
+    except Exception as e:
+        # Cache the vector store anyway rather than redo the load on every request; search falls back to dense
+        print(f"Error loading lexical index for {api_key}: {str(e)}")
+        lexical = None
+    return CachedChain(vector_store, lexical)
+
+def load_qa_chain(api_key: str):
+    """Load a persisted index from disk (memory-mapped) with its lexical index"""
+    index_store = get_index_store()
+    if not index_store.exists(api_key):
+        return None
+    try:
+        entry = open_chain(index_store, api_key, index_store.version(api_key))
+        print(f"QA chain loaded from disk for {api_key}")
+        return entry
+
+    except Exception as e:
+        print(f"Error loading persisted index for {api_key}: {str(e)}")
+        return None
+
+def fetch_chatbot_ref(api_key: str) -> Optional[ChatbotRef]:
+    """Projection-only lookup; never loads the training_data column"""
+    db = SessionLocal()
+    try:
+        row = db.query(
+            Chatbot.id, Chatbot.is_active, Chatbot.name, User.subscription_tier
+        ).outerjoin(User, User.id == Chatbot.user_id).filter(Chatbot.api_key == api_key).first()
+        if not row:
+            return None
+        return ChatbotRef(row.id, row.is_active, row.name, row.subscription_tier or "free")
+    finally:
+        db.close()
+
+def fetch_training_data(chatbot_id: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        return db.query(Chatbot.training_data).filter(Chatbot.id == chatbot_id).scalar()
+    finally:
+        db.close()
+
+async def resolve_chatbot(api_key: str) -> ChatbotRef:
+    """Cached api_key lookup; raises 404 for unknown keys and 403 for inactive bots"""
+    found, chatbot = chatbot_lookup.lookup(api_key)
+    if not found:
+        chatbot = await run_in_threadpool(fetch_chatbot_ref, api_key)
+        chatbot_lookup.store(api_key, chatbot)
+    if chatbot is None:
+        print("Chatbot not found in database")
+        raise HTTPException(status_code=404, detail="Chatbot not found")
+    if chatbot.is_active == 0:
+        raise HTTPException(status_code=403, detail="Chatbot is inactive")
+    return chatbot
+
+def enforce_quota(chatbot: ChatbotRef) -> None:
+    """In-memory check of the bot's daily token allowance for its owner's tier"""
+    if not get_usage_meter().allow(chatbot.id, chatbot.tier):
+        raise HTTPException(
+            status_code=429,
+            detail="Daily token quota exceeded for this chatbot",
+            headers={"Retry-After": str(seconds_until_reset())}
+        )
+
+def rebuild_qa_chain(chatbot: ChatbotRef, api_key: str):
+    """Rebuild the index from stored training data and persist it"""
+    training_data = fetch_training_data(chatbot.id)
+    if not training_data:
+        # Ingestion hasn't finished (or failed) for this chatbot
+        raise HTTPException(status_code=409, detail="Chatbot is still being trained")
+
     try:
         print(f"Rebuilding QA chain for chatbot: {chatbot.name}")
         
         # Split text into chunks
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=500,
             chunk_overlap=50
         )
-        chunks = text_splitter.split_text(chatbot.training_data)
-        
-        # Create embeddings
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        vector_store = FAISS.from_texts(chunks, embeddings)
-        
-        # Create prompt template
-        prompt_template = """Use the following context to answer the question. If you don't know the answer, just say you don't know.
-
-Context: {context}
-
-Question: {question}
-
-Answer:"""
-        
-        PROMPT = PromptTemplate(
-            template=prompt_template,
-            input_variables=["context", "question"]
-        )
+        chunks = [{"text": t, "metadata": {}} for t in text_splitter.split_text(training_data)]
         
-        # Create QA chain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vector_store.as_retriever(search_kwargs={"k": 2}),
-            chain_type_kwargs={"prompt": PROMPT},
-            return_source_documents=False
-        )
-        
-        # Store both
-        vector_stores[api_key] = vector_store
-        qa_chains[api_key] = qa_chain
+        # Embed with the shared model
+        index_store = get_index_store()
+        index_store.sync(api_key, chunks, get_embedding_engine())
+        entry = open_chain(index_store, api_key, index_store.version(api_key))
         
+        answer_cache.invalidate(api_key)
         print(f"QA chain rebuilt successfully for {api_key}")
-        return qa_chain
+        return entry
         
     except Exception as e:
         print(f"Error rebuilding QA chain: {str(e)}")
         return None
 
+def index_version(api_key: str) -> Optional[str]:
+    """Version of the chatbot's persisted index; cached chains and answers are only valid for it"""
+    return get_index_store().version(api_key)
+
+def get_cached_chain(chatbot: ChatbotRef, api_key: str, version: Optional[str] = None):
+    """Cached vector store and lexical index for a chatbot; concurrent misses share one load or rebuild"""
+    def load():
+        entry = load_qa_chain(api_key)
+        # Only rebuild a missing index; one that exists but failed to load may be newer than training_data
+        if entry is None and not get_index_store().exists(api_key):
+            print("QA chain not found - rebuilding from training data...")
+            entry = rebuild_qa_chain(chatbot, api_key)
+        return entry
+
+    return qa_cache.get_or_load(api_key, load, version)
+
+NO_ANSWER_RESPONSE = "I'm not sure how to answer that based on my training data."
+FALLBACK_RESPONSE = "I'm having trouble processing that right now. Could you rephrase your question?"
+
+def retrieve(entry: CachedChain, api_key: str, message: str, use_cache: bool = True,
+             version: Optional[str] = None):
+    """Semantic answer cache, then hybrid retrieval; returns (cached answer, docs, query embedding).
+
+    Identifier-style queries the lexical index can answer skip the embedding model entirely.
+    """
+    from lexical_index import hybrid_search, LEXICAL_FASTPATH
+
+    if LEXICAL_FASTPATH and entry.lexical is not None:
+        docs = entry.lexical.fast_path(message, k=retrieval_k(RETRIEVAL_K))
+        if docs:
+            return None, docs, None
+    # The same embedding is reused for retrieval on a miss
+    query_vector = get_embedding_engine().embed_query(message)
+    cached = answer_cache.get_semantic(api_key, query_vector, version) if use_cache else None
+    if cached is not None:
+        return cached, None, query_vector
+    docs = hybrid_search(entry.vector_store, entry.lexical, message, query_vector, k=retrieval_k(RETRIEVAL_K))
+    return None, docs, query_vector
+
+def get_chain_or_fail(chatbot: ChatbotRef, api_key: str, version: Optional[str] = None) -> CachedChain:
+    # Cached indexes, falling back to the persisted index, then to a full rebuild
+    entry = get_cached_chain(chatbot, api_key, version)
+    if not entry:
+        raise HTTPException(status_code=500, detail="Failed to initialize chatbot")
+    return entry
+
+def generate_answer(chatbot: ChatbotRef, api_key: str, message: str, key: Optional[str] = None) -> str:
+    """Retrieval and generation for one message; runs on the inference executor"""
+    history = fit_history(message, load_history(key)) if key else ""
+    # Follow-up questions depend on the conversation, so only first turns use the answer cache
+    use_cache = not history
+    version = index_version(api_key)
+    cached = answer_cache.get_exact(api_key, message, version) if use_cache else None
+    if cached is None:
+        entry = get_chain_or_fail(chatbot, api_key, version)
+        cached, docs, query_vector = retrieve(entry, api_key, message, use_cache, version)
+    if cached is not None:
+        print("Answer cache hit")
+        get_usage_meter().record(chatbot.id, chatbot.tier, cached=True)
+        return cached
+
+    # Sent with its prefixes so the local model can skip prefill for the template
+    # and a recently seen context
+    print("Generating answer...")
+    context = assemble_context(message, docs, history).text
+    prompt = PROMPT.format(context=context, question=message, history=history)
+    result = get_llm().batcher.generate(prompt, prompt_prefixes(context))
+    print(f"Generation result: {result}")
+
+    get_usage_meter().record(
+        chatbot.id, chatbot.tier,
+        prompt_tokens=count_tokens(prompt, model_id),
+        completion_tokens=count_tokens(result, model_id),
+        context_tokens=count_tokens(context, model_id)
+    )
+
+    # Extract response
+    response = result.strip()
+
+    # Fallback if response is empty
+    if not response:
+        return NO_ANSWER_RESPONSE
+
+    # Clean up response - remove any prompt artifacts
+    if "Answer:" in response:
+        response = response.split("Answer:")[-1].strip()
+
+    # Limit response length, as /api/chat/stream does
+    from streaming import clip_response
+    response = clip_response(response)
+
+    if response and use_cache:
+        answer_cache.put(api_key, message, query_vector, response, version)
+    return response or NO_ANSWER_RESPONSE
+
 @app.post("/api/chat")
-def chat(msg: ChatMessage, db: Session = Depends(get_db)):
+async def chat(msg: ChatMessage, background_tasks: BackgroundTasks):
     print(f"Received chat message: {msg.message}")
     print(f"API Key: {msg.chatbot_api_key}")
     
     # Verify chatbot exists
-    chatbot = db.query(Chatbot).filter(Chatbot.api_key == msg.chatbot_api_key).first()
-    if not chatbot:
-        print("Chatbot not found in database")
-        raise HTTPException(status_code=404, detail="Chatbot not found")
-    
-    # Get QA chain or rebuild if missing
-    qa_chain = qa_chains.get(msg.chatbot_api_key)
-    if not qa_chain:
-        print("QA chain not found - rebuilding from training data...")
-        qa_chain = rebuild_qa_chain(chatbot, msg.chatbot_api_key)
-        if not qa_chain:
-            raise HTTPException(status_code=500, detail="Failed to initialize chatbot")
+    chatbot = await resolve_chatbot(msg.chatbot_api_key)
+    enforce_quota(chatbot)
+    await run_in_threadpool(check_message, msg.message)
+    session_id = msg.session_id or str(uuid.uuid4())
+    key = session_key(msg.chatbot_api_key, session_id)
     
     try:
-        print("Running QA chain...")
-        
-        # Run the chain with proper error handling
-        result = qa_chain({"query": msg.message})
-        
-        print(f"QA chain result: {result}")
-        
-        # Extract response
-        response = result.get("result", "").strip()
-        
-        # Fallback if response is empty
-        if not response:
-            response = "I'm not sure how to answer that based on my training data."
-        
-        # Clean up response - remove any prompt artifacts
-        if "Answer:" in response:
-            response = response.split("Answer:")[-1].strip()
-        
-        # Limit response length
-        if len(response) > 500:
-            response = response[:500] + "..."
-        
+        response = await inference_executor.run(generate_answer, chatbot, msg.chatbot_api_key, msg.message, key)
         print(f"Final response: {response}")
         
         # Log conversation
-        conv = Conversation(
-            chatbot_id=chatbot.id,
-            user_message=msg.message,
-            bot_response=response
-        )
-        db.add(conv)
-        db.commit()
+        await conversation_logger.log_async(chatbot.id, msg.message, response)
+        # After the reply is sent: may summarize or spill to the database
+        background_tasks.add_task(chat_sessions.append, key, msg.message, response)
         
-        return {"response": response}
+        return {"response": response, "session_id": session_id}
         
+    except (HTTPException, ExecutorSaturated):
+        raise
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         import traceback
         traceback.print_exc()
         
-        # Provide a fallback response instead of failing
-        fallback_response = "I'm having trouble processing that right now. Could you rephrase your question?"
+        # Still log the conversation, with a fallback response instead of failing
+        await conversation_logger.log_async(chatbot.id, msg.message, FALLBACK_RESPONSE)
         
-        # Still log the conversation
+        return {"response": FALLBACK_RESPONSE, "session_id": session_id}
+
+def stream_generate(docs, message: str, history: str, streamer):
+    """Generate into the streamer from retrieved context; runs on the inference executor.
+
+    Returns (prompt tokens, context tokens) for metering.
+    """
+    try:
+        if streamer.stopped:
+            # The client disconnected while this job was queued
+            return 0, 0
+        backend = get_llm().backend
+        context = assemble_context(message, docs, history).text
+        prompt = PROMPT.format(context=context, question=message, history=history)
+        deltas = backend.stream(prompt, prompt_prefixes(context))
+        try:
+            for delta in deltas:
+                streamer.push(delta)
+                if streamer.stopped:
+                    break
+        finally:
+            # Stops the decode loop when the streamer has all it will emit
+            deltas.close()
+        return backend.count_tokens(prompt), count_tokens(context, model_id)
+    finally:
+        streamer.close()
+
+@app.post("/api/chat/stream")
+async def chat_stream(msg: ChatMessage):
+    """Server-Sent Events variant of /api/chat: token frames, then a final "done" frame"""
+    from streaming import AsyncSSEStreamer, sse_event
+
+    chatbot = await resolve_chatbot(msg.chatbot_api_key)
+    enforce_quota(chatbot)
+    await run_in_threadpool(check_message, msg.message)
+    chatbot_id = chatbot.id
+    api_key = msg.chatbot_api_key
+    session_id = msg.session_id or str(uuid.uuid4())
+    key = session_key(api_key, session_id)
+
+    history = await run_in_threadpool(lambda: fit_history(msg.message, load_history(key)))
+    use_cache = not history
+    version = await run_in_threadpool(index_version, api_key)
+    cached = answer_cache.get_exact(api_key, msg.message, version) if use_cache else None
+    query_vector = streamer = job = None
+    unavailable = False
+    if cached is None:
         try:
-            conv = Conversation(
-                chatbot_id=chatbot.id,
-                user_message=msg.message,
-                bot_response=fallback_response
+            entry = await inference_executor.run(get_chain_or_fail, chatbot, api_key, version)
+            cached, docs, query_vector = await inference_executor.run(
+                retrieve, entry, api_key, msg.message, use_cache, version
             )
-            db.add(conv)
-            db.commit()
-        except:
-            pass
-        
-        return {"response": fallback_response}
+        except Exception as e:
+            # Overload and "still training" keep their status codes; anything else gets the fallback, as in /api/chat
+            if isinstance(e, ExecutorSaturated) or (isinstance(e, HTTPException) and e.status_code < 500):
+                raise
+            print(f"Error in chat stream: {str(e)}")
+            cached, unavailable = FALLBACK_RESPONSE, True
+    if cached is None:
+        # Submit before the response starts so a full queue still surfaces as a 503
+        streamer = AsyncSSEStreamer(asyncio.get_running_loop())
+        job = asyncio.wrap_future(
+            inference_executor.submit(stream_generate, docs, msg.message, history, streamer)
+        )
+
+    async def events():
+        if cached is not None:
+            response = cached
+            if not unavailable:
+                get_usage_meter().record(chatbot_id, chatbot.tier, cached=True)
+        else:
+            try:
+                async for delta in streamer:
+                    yield sse_event({"token": delta})
+            except (GeneratorExit, asyncio.CancelledError):
+                # Stop decoding so an abandoned stream doesn't hold an inference slot
+                streamer.cancel()
+                raise
+
+            response = streamer.text.strip()
+            failed = False
+            try:
+                prompt_tokens, context_tokens = await job
+                get_usage_meter().record(
+                    chatbot_id, chatbot.tier,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=count_tokens(streamer.text, model_id),
+                    context_tokens=context_tokens
+                )
+            except Exception as e:
+                print(f"Error in chat stream: {str(e)}")
+                failed = True
+            if response:
+                if streamer.truncated:
+                    response += "..."
+                if not failed and use_cache:
+                    answer_cache.put(api_key, msg.message, query_vector, response, version)
+            elif failed:
+                response = FALLBACK_RESPONSE
+            else:
+                response = NO_ANSWER_RESPONSE
+
+        yield sse_event({"response": response, "session_id": session_id}, event="done")
+
+        await conversation_logger.log_async(chatbot_id, msg.message, response)
+        if not unavailable:
+            await run_in_threadpool(chat_sessions.append, key, msg.message, response)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/chatbots/{chatbot_id}/usage")
+def get_chatbot_usage(chatbot_id: str, days: int = 30, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+    """Daily token usage for capacity planning, plus today's live total against the tier quota"""
+    row = db.query(Chatbot.id, User.subscription_tier).outerjoin(User, User.id == Chatbot.user_id).filter(
+        Chatbot.id == chatbot_id,
+        Chatbot.user_id == user_id
+    ).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Chatbot not found")
+    
+    meter = get_usage_meter()
+    tier = row.subscription_tier or "free"
+    history = db.query(ChatbotUsage).filter(
+        ChatbotUsage.chatbot_id == chatbot_id
+    ).order_by(ChatbotUsage.day.desc()).limit(days).all()
+    
+    today = next((u for u in history if u.day == utc_day()), None)
+    stored_today = (today.prompt_tokens or 0) + (today.completion_tokens or 0) if today else 0
+    
+    return {
+        "tier": tier,
+        "daily_quota": meter.quota(tier),
+        "used_today": max(meter.used(chatbot_id), stored_today),
+        "days": [{
+            "day": u.day,
+            "requests": u.requests,
+            "cached_requests": u.cached_requests,
+            "prompt_tokens": u.prompt_tokens,
+            "completion_tokens": u.completion_tokens,
+            "context_tokens": u.context_tokens
+        } for u in history]
+    }
 
 @app.get("/api/conversations/{chatbot_id}")
 def get_conversations(chatbot_id: str, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
@@ -500,6 +969,43 @@ def get_conversations(chatbot_id: str, user_id: str = Depends(verify_token), db:
         "created_at": c.created_at
     } for c in conversations]
 
+@app.get("/api/stats/cache", dependencies=[Depends(verify_admin)])
+def cache_stats():
+    return {
+        "qa_chains": qa_cache.stats(),
+        "answers": answer_cache.stats(),
+        "chatbot_lookup": chatbot_lookup.stats(),
+        "conversation_log": conversation_logger.stats(),
+        "embeddings": get_embedding_engine().stats(),
+        "inference": inference_executor.stats(),
+        "batching": get_llm().batcher.stats() if model_registry.loaded("llm") else None,
+        "llm": get_llm().backend.stats() if model_registry.loaded("llm") else None,
+        "prompt_assembly": prompt_assembler.stats(),
+        "sessions": chat_sessions.stats(),
+        "usage": get_usage_meter().stats(),
+        "models": model_registry.status(),
+    }
+
+# Models /readyz waits for; the embedding model alone is enough for ingestion-only workers
+READY_MODELS = [m for m in os.getenv("READY_MODELS", "llm,embeddings").split(",") if m]
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whether or not models are loaded"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 503 until the models in READY_MODELS have finished loading.
+
+    With MODEL_WARMUP=lazy nothing loads until a request needs it, so the server is ready at once.
+    """
+    ready = MODEL_WARMUP == "lazy" or model_registry.ready(READY_MODELS)
+    body = {"status": "ready" if ready else "warming_up", "warmup": MODEL_WARMUP, "models": model_registry.status()}
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.get("/")
 def root():
     return {"message": "AI Chatbot Builder API", "version": "1.0.1"}
@@ -0,0 +1,219 @@
+# backend/metering.py
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from models import ChatbotUsage
+
+METERING_FLUSH_INTERVAL = float(os.getenv("METERING_FLUSH_INTERVAL", "30"))
+# Daily token allowance per chatbot by subscription tier; 0 means unlimited
+TIER_DAILY_TOKENS = os.getenv("TIER_DAILY_TOKENS", "free=20000,pro=1000000,enterprise=0")
+
+FIELDS = ("requests", "cached_requests", "prompt_tokens", "completion_tokens", "context_tokens")
+
+
+def parse_quotas(spec: str) -> Dict[str, int]:
+    quotas = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tier, limit = item.split("=", 1)
+            quotas[tier.strip()] = int(limit)
+    return quotas
+
+
+def utc_day() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def seconds_until_reset() -> int:
+    now = datetime.utcnow()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+def _tokens(counts: List[int]) -> int:
+    # Retrieval context is already part of the prompt
+    return counts[2] + counts[3]
+
+
+class UsageMeter:
+    """Per-chatbot and per-tier token counters, flushed to chatbot_usage by a background thread.
+
+    allow() only reads an in-memory total, so quota checks cost a dict lookup. Each flush
+    re-reads the day's stored totals, which folds in usage recorded by other workers.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        flush_interval: float = METERING_FLUSH_INTERVAL,
+        quotas: Optional[Dict[str, int]] = None,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.quotas = parse_quotas(TIER_DAILY_TOKENS) if quotas is None else quotas
+        self._day = utc_day()
+        self._pending: Dict[str, List[int]] = {}  # chatbot_id -> counts not yet flushed
+        self._pending_tier: Dict[str, str] = {}
+        self._used: Dict[str, int] = {}  # chatbot_id -> today's tokens, all workers
+        self._tiers: Dict[str, List[int]] = {}  # tier -> counts since start
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-meter", daemon=True)
+            self._thread.start()
+
+    def _roll_day(self) -> None:
+        day = utc_day()
+        if day != self._day:
+            # Yesterday's pending counts are flushed under yesterday's date first
+            self.flush()
+            with self._lock:
+                self._day = day
+                self._used.clear()
+
+    def record(self, chatbot_id: str, tier: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               context_tokens: int = 0, cached: bool = False) -> None:
+        delta = (1, int(cached), prompt_tokens, completion_tokens, context_tokens)
+        with self._lock:
+            for counts in (
+                self._pending.setdefault(chatbot_id, [0] * len(FIELDS)),
+                self._tiers.setdefault(tier, [0] * len(FIELDS)),
+            ):
+                for i, value in enumerate(delta):
+                    counts[i] += value
+            self._pending_tier[chatbot_id] = tier
+            self._used[chatbot_id] = self._used.get(chatbot_id, 0) + prompt_tokens + completion_tokens
+
+    def quota(self, tier: str) -> int:
+        return self.quotas.get(tier, self.quotas.get("free", 0))
+
+    def allow(self, chatbot_id: str, tier: str) -> bool:
+        """Whether the chatbot still has token allowance today"""
+        limit = self.quota(tier)
+        if limit <= 0:
+            return True
+        with self._lock:
+            allowed = self._used.get(chatbot_id, 0) < limit
+            if not allowed:
+                self.rejected += 1
+            return allowed
+
+    def used(self, chatbot_id: str) -> int:
+        with self._lock:
+            return self._used.get(chatbot_id, 0)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self._roll_day()
+            self.flush()
+
+    def flush(self) -> None:
+        """Add pending counts to today's rows, then refresh totals from the table"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                tiers, self._pending_tier = self._pending_tier, {}
+                seen = list(self._used)
+                day = self._day
+            if not pending and not seen:
+                return
+
+            db = self.session_factory()
+            try:
+                for chatbot_id, counts in pending.items():
+                    self._upsert(db, chatbot_id, day, tiers[chatbot_id], counts)
+                db.commit()
+                totals = {}
+                if seen:
+                    for row in db.query(ChatbotUsage).filter(
+                        ChatbotUsage.day == day, ChatbotUsage.chatbot_id.in_(seen)
+                    ):
+                        totals[row.chatbot_id] = (row.prompt_tokens or 0) + (row.completion_tokens or 0)
+                with self._lock:
+                    self.flushes += 1
+                    if day == self._day:
+                        for chatbot_id, total in totals.items():
+                            unflushed = self._pending.get(chatbot_id)
+                            self._used[chatbot_id] = total + (_tokens(unflushed) if unflushed else 0)
+            except Exception as e:
+                db.rollback()
+                print(f"Error flushing usage for {len(pending)} chatbots: {str(e)}")
+                with self._lock:
+                    self.failed_flushes += 1
+                    # Keep the counts for the next attempt
+                    for chatbot_id, counts in pending.items():
+                        merged = self._pending.setdefault(chatbot_id, [0] * len(FIELDS))
+                        for i, value in enumerate(counts):
+                            merged[i] += value
+                        self._pending_tier.setdefault(chatbot_id, tiers[chatbot_id])
+            finally:
+                db.close()
+
+    def _upsert(self, db, chatbot_id: str, day: str, tier: str, counts: List[int]) -> None:
+        for attempt in range(2):
+            row = db.query(ChatbotUsage).filter(
+                ChatbotUsage.chatbot_id == chatbot_id, ChatbotUsage.day == day
+            ).with_for_update().first()
+            if row is None:
+                try:
+                    with db.begin_nested():
+                        db.add(ChatbotUsage(chatbot_id=chatbot_id, day=day, tier=tier,
+                                            **dict(zip(FIELDS, counts))))
+                    return
+                except IntegrityError:
+                    # Another worker created today's row first; add to it instead
+                    continue
+            row.tier = tier
+            for field, value in zip(FIELDS, counts):
+                setattr(row, field, (getattr(row, field) or 0) + value)
+            return
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Stop the flush thread and write out whatever is pending"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "day": self._day,
+                "chatbots_today": len(self._used),
+                "pending_chatbots": len(self._pending),
+                "tiers": {tier: dict(zip(FIELDS, counts)) for tier, counts in self._tiers.items()},
+                "quotas": self.quotas,
+                "rejected": self.rejected,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+            }
+
+
+_meter: Optional[UsageMeter] = None
+_meter_lock = threading.Lock()
+
+
+def get_usage_meter() -> UsageMeter:
+    """Process-wide meter, started on first use"""
+    global _meter
+    if _meter is None:
+        with _meter_lock:
+            if _meter is None:
+                from db import SessionLocal
+
+                _meter = UsageMeter(SessionLocal)
+                _meter.start()
+    return _meter
@@ -0,0 +1,104 @@
+# backend/model_registry.py
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# "background" loads every model on a thread at startup, "lazy" on first use only
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class _Slot:
+    __slots__ = ("loader", "state", "future", "load_time", "error")
+
+    def __init__(self, loader: Callable[[], Any]):
+        self.loader = loader
+        self.state = PENDING
+        self.future: Optional[Future] = None
+        self.load_time: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+class ModelRegistry:
+    """Named model loaders that run once, on first get() or during warm-up"""
+
+    def __init__(self):
+        self._slots: Dict[str, _Slot] = {}
+        self._lock = threading.Lock()
+        self._warmup: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            self._slots[name] = _Slot(loader)
+
+    def get(self, name: str) -> Any:
+        """The loaded model; concurrent first callers share one load and a failed load is retried"""
+        with self._lock:
+            slot = self._slots[name]
+            owner = slot.future is None or slot.state == FAILED
+            if owner:
+                slot.future = Future()
+                slot.state = LOADING
+                slot.error = None
+            future = slot.future
+
+        if not owner:
+            return future.result()
+
+        print(f"Loading model {name}...")
+        start = time.time()
+        try:
+            value = slot.loader()
+        except BaseException as e:
+            with self._lock:
+                slot.state = FAILED
+                slot.error = str(e)
+            print(f"Failed to load model {name}: {str(e)}")
+            future.set_exception(e)
+            raise
+        with self._lock:
+            slot.state = READY
+            slot.load_time = time.time() - start
+        print(f"Model {name} loaded in {slot.load_time:.2f}s")
+        future.set_result(value)
+        return value
+
+    def loaded(self, name: str) -> bool:
+        with self._lock:
+            slot = self._slots.get(name)
+            return slot is not None and slot.state == READY
+
+    def ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        with self._lock:
+            names = list(self._slots) if names is None else list(names)
+            return all(name in self._slots and self._slots[name].state == READY for name in names)
+
+    def warm_up(self, names: Optional[List[str]] = None) -> None:
+        """Load models on a background thread so the server accepts requests meanwhile"""
+        if self._warmup is not None:
+            return
+        names = list(self._slots) if names is None else names
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception:
+                    pass  # recorded in status(); the next get() retries
+
+        self._warmup = threading.Thread(target=run, name="model-warmup", daemon=True)
+        self._warmup.start()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {"state": slot.state, "load_time_s": slot.load_time, "error": slot.error}
+                for name, slot in self._slots.items()
+            }
+
+
+# Global instance
+model_registry = ModelRegistry()
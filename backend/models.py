@@ -1,9 +1,8 @@
 # Models
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Text, Integer
-from sqlalchemy.ext.declarative import declarative_base
-Base = declarative_base()
+from sqlalchemy import Column, String, DateTime, Text, Integer, BigInteger, UniqueConstraint
+from db import Base
 # Models
 class User(Base):
     __tablename__ = "users"
@@ -30,4 +29,40 @@ class Conversation(Base):
     chatbot_id = Column(String)
     user_message = Column(Text)
     bot_response = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    chatbot_id = Column(String, index=True)
+    kind = Column(String, default="create")
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    stage = Column(String, default="queued")
+    progress = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    owner = Column(String)  # "<host>:<pid>:<nonce>" of the process running the job
+    heartbeat = Column(DateTime)  # a running job whose heartbeat is older than the lease can be reclaimed
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+    id = Column(String, primary_key=True)  # "<api_key or chatbot id>:<session id>", see sessions.session_key
+    turns = Column(Text)  # JSON list of [question, answer]
+    summary = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class ChatbotUsage(Base):
+    __tablename__ = "chatbot_usage"
+    __table_args__ = (UniqueConstraint("chatbot_id", "day"),)
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    chatbot_id = Column(String, index=True)
+    day = Column(String, index=True)  # UTC date, YYYY-MM-DD
+    tier = Column(String)
+    requests = Column(Integer, default=0)
+    cached_requests = Column(Integer, default=0)
+    prompt_tokens = Column(BigInteger, default=0)
+    completion_tokens = Column(BigInteger, default=0)
+    context_tokens = Column(BigInteger, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
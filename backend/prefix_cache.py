@@ -0,0 +1,122 @@
+# backend/prefix_cache.py
+import hashlib
+import os
+import threading
+from array import array
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from chain_cache import ChainCache
+
+PREFIX_CACHE_BYTES = int(os.getenv("PREFIX_CACHE_BYTES", str(256 * 1024 * 1024)))
+PREFIX_CACHE_MAX_ENTRIES = int(os.getenv("PREFIX_CACHE_MAX_ENTRIES", "1000"))
+# Also cache each (bot, retrieved context) prefix, not just the shared template text
+PREFIX_CACHE_CONTEXT = os.getenv("PREFIX_CACHE_CONTEXT", "1") == "1"
+# Shorter prefixes are cheaper to recompute than to store
+PREFIX_MIN_TOKENS = int(os.getenv("PREFIX_MIN_TOKENS", "8"))
+
+
+class PrefixKV(NamedTuple):
+    length: int
+    # Legacy format: one (key, value) tensor pair per layer
+    past: Any
+    nbytes: int
+
+
+def past_nbytes(past) -> int:
+    return sum(t.numel() * t.element_size() for layer in past for t in layer)
+
+
+def to_legacy(past):
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else tuple(past)
+
+
+def as_model_cache(past):
+    """Fresh cache object over stored tensors. The model appends by concatenation, so the stored ones stay intact"""
+    try:
+        from transformers import DynamicCache
+
+        return DynamicCache.from_legacy_cache(past)
+    except (ImportError, AttributeError):
+        return past
+
+
+def common_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def prefix_key(ids: Sequence[int]) -> str:
+    return hashlib.sha1(array("q", ids).tobytes()).hexdigest()
+
+
+class PrefixCache:
+    """past_key_values of prompt prefixes, LRU by memory, so prefill only runs over the tokens after them"""
+
+    def __init__(
+        self,
+        max_bytes: int = PREFIX_CACHE_BYTES,
+        max_entries: int = PREFIX_CACHE_MAX_ENTRIES,
+        min_tokens: int = PREFIX_MIN_TOKENS,
+    ):
+        self.max_bytes = max_bytes
+        self.min_tokens = min_tokens
+        self.entries = ChainCache(max_entries=max_entries, max_bytes=max_bytes, policy="lru",
+                                  sizeof=lambda entry: entry.nbytes)
+        self._lock = threading.Lock()
+        self.reused_tokens = 0
+        self.prefill_tokens = 0
+
+    def lookup(
+        self,
+        input_ids: List[int],
+        prefixes: Sequence[List[int]],
+        compute: Callable[[List[int], Optional[PrefixKV]], Any],
+    ) -> Optional[PrefixKV]:
+        """Longest usable prefix of input_ids among the candidates, computing missing ones.
+
+        compute(ids, base) returns the legacy past for ids, continuing from base, which
+        covers ids[:base.length], when a shorter prefix is already cached.
+        """
+        best: Optional[PrefixKV] = None
+        missed = 0  # prefix tokens computed in this call
+        for prefix_ids in sorted(prefixes, key=len):
+            # BPE can merge across the boundary, so only the tokens the prompt shares count;
+            # at least one prompt token is left to produce the next-token logits
+            n = min(common_prefix(prefix_ids, input_ids), len(input_ids) - 1)
+            if n < self.min_tokens or (best is not None and n <= best.length):
+                continue
+            ids, base, computed = input_ids[:n], best, []
+
+            def load():
+                past = compute(ids, base)
+                entry = PrefixKV(n, past, past_nbytes(past))
+                computed.append(entry)
+                # Too big to keep; still used for this request
+                return entry if entry.nbytes <= self.max_bytes else None
+
+            entry = self.entries.get_or_load(prefix_key(ids), load) or (computed[0] if computed else None)
+            if computed:
+                missed += n - (base.length if base is not None else 0)
+            if entry is not None:
+                best = entry
+
+        with self._lock:
+            reused = (best.length if best is not None else 0) - missed
+            self.reused_tokens += reused
+            self.prefill_tokens += len(input_ids) - reused
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.entries.stats()
+        with self._lock:
+            total = self.reused_tokens + self.prefill_tokens
+            stats.update(
+                reused_tokens=self.reused_tokens,
+                prefill_tokens=self.prefill_tokens,
+                reuse_rate=self.reused_tokens / total if total else 0.0,
+            )
+        return stats
@@ -0,0 +1,181 @@
+# backend/prefork.py
+"""Preforking server: load the models once, then fork uvicorn workers that share them.
+
+Usage: python prefork.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+
+`uvicorn main:app --workers N` starts N fresh interpreters, and each one loads its own
+copy of GPT-2 and MiniLM. Here the master loads every registered model, freezes the
+heap and forks. Workers then read the weights from pages they share with the master.
+- Tensor storage lives in allocations separate from the Python objects, so refcount
+  updates on the module objects never dirty the weight pages. With
+  PREFORK_SHARE_MEMORY=1 the storages are also moved to shared memory, so nothing
+  can copy them.
+- gc.freeze() moves everything allocated before the fork into the permanent
+  generation. Collections in the workers then don't write to those objects' headers.
+- Persisted FAISS indexes and vectors.npy are opened with mmap (see index_store), so
+  workers share them through the page cache.
+
+The master runs no inference. It creates the database schema once and closes its
+connections, then forks. Threads, connection pools and the embedding cache's SQLite
+handle are created in the workers, which open the cache lazily on first use. Worker 0
+alone resumes queued and abandoned ingestion jobs; the others only run the jobs they
+receive.
+"""
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", "4"))
+PREFORK_HOST = os.getenv("PREFORK_HOST", "0.0.0.0")
+PREFORK_PORT = int(os.getenv("PREFORK_PORT", "8000"))
+# Move model weights to shared memory before forking
+PREFORK_SHARE_MEMORY = os.getenv("PREFORK_SHARE_MEMORY", "1") == "1"
+# torch intra-op threads per worker; 0 splits the cores evenly across workers
+PREFORK_TORCH_THREADS = int(os.getenv("PREFORK_TORCH_THREADS", "0"))
+# A worker that dies sooner than this after starting is restarted after a pause
+PREFORK_MIN_UPTIME = float(os.getenv("PREFORK_MIN_UPTIME", "5"))
+
+
+def _modules(value):
+    """torch modules held by a registry entry: the module itself or an LLMBundle's backend model"""
+    import torch
+
+    for candidate in (value, getattr(getattr(value, "backend", None), "model", None)):
+        if isinstance(candidate, torch.nn.Module):
+            yield candidate
+
+
+def preload(app_module) -> None:
+    """Load every registered model in the master"""
+    registry = app_module.model_registry
+    for name in registry.status():
+        value = registry.get(name)
+        if PREFORK_SHARE_MEMORY:
+            for module in _modules(value):
+                module.share_memory()
+    # SQLite connections must not cross a fork; each worker opens its own
+    app_module.get_embedding_engine().close_cache()
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _after_fork(app_module, workers: int, index: int) -> None:
+    """Per-worker state that must not be inherited from the master"""
+    gc.enable()
+
+    # Otherwise every worker samples the same continuation for the same prompt
+    random.seed()
+    import numpy as np
+    import torch
+
+    np.random.seed()
+    torch.seed()
+    threads = PREFORK_TORCH_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads)
+
+    # Connections opened by the master (if any) belong to it
+    app_module.engine.dispose(close=False)
+    # One worker sweeps for unclaimed ingestion jobs; the lease reclaims them if it dies
+    app_module.ingestion_queue.resume = index == 0
+    if app_module.model_registry.loaded("llm"):
+        app_module.get_llm().batcher.restart()
+
+
+def serve_worker(app_module, sock: socket.socket, workers: int, index: int) -> None:
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    _after_fork(app_module, workers, index)
+    config = uvicorn.Config(app_module.app, lifespan="on", log_level=os.getenv("LOG_LEVEL", "info"))
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run(workers: int = PREFORK_WORKERS, host: str = PREFORK_HOST, port: int = PREFORK_PORT) -> None:
+    # Per the gc docs: no collections while the shared heap is built, freeze right before forking
+    gc.disable()
+    import main
+
+    start = time.time()
+    preload(main)
+    if main.model_registry.loaded("llm"):
+        # Its thread would not survive the fork; each worker starts its own
+        main.get_llm().batcher.stop()
+    print(f"Master {os.getpid()} loaded models in {time.time() - start:.2f}s: {main.model_registry.status()}")
+    main.create_schema()
+    main.engine.dispose()
+    sock = bind_socket(host, port)
+    gc.collect()
+    gc.freeze()
+
+    children = {}  # pid -> (start time, worker index)
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                serve_worker(main, sock, workers, index)
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {str(e)}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (time.time(), index)
+        print(f"Started worker {pid}")
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+    print(f"Serving on {host}:{port} with {workers} workers")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        child = children.pop(pid, None)
+        if child is None or stopping:
+            continue
+        started, index = child
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        if time.time() - started < PREFORK_MIN_UPTIME:
+            time.sleep(1)
+        # The replacement takes the same index, so a worker 0 always exists
+        spawn(index)
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    parser.add_argument("--host", default=PREFORK_HOST)
+    parser.add_argument("--port", type=int, default=PREFORK_PORT)
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        sys.exit("prefork needs os.fork(); use uvicorn --workers on this platform")
+    run(args.workers, args.host, args.port)
@@ -0,0 +1,236 @@
+# backend/prompt_assembler.py
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Cross-encoder for a rerank stage, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty disables it
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+# Candidates retrieved for the reranker to choose from
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "8"))
+# Most chunks put in one prompt, whatever the budget allows
+PROMPT_MAX_CHUNKS = int(os.getenv("PROMPT_MAX_CHUNKS", "4"))
+# Overlaps shorter than this are coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = int(os.getenv("MIN_OVERLAP_CHARS", "20"))
+# The splitters overlap by 50 (main) and 200 (AIService) characters
+MAX_OVERLAP_CHARS = int(os.getenv("MAX_OVERLAP_CHARS", "300"))
+# A cut-down chunk shorter than this is dropped instead
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", "32"))
+
+SEPARATOR = "\n\n"
+
+# Context windows for models whose tokenizer doesn't report one
+MODEL_WINDOWS = {
+    "gpt2": 1024,
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_WINDOW = 2048
+
+
+def model_window(model_id: str, tokenizer=None) -> int:
+    """Context window in tokens for a model"""
+    # Tokenizers without a limit report a huge sentinel value
+    limit = getattr(tokenizer, "model_max_length", None)
+    if isinstance(limit, int) and 0 < limit < 1_000_000:
+        return limit
+    for name in sorted(MODEL_WINDOWS, key=len, reverse=True):
+        if model_id.startswith(name):
+            return MODEL_WINDOWS[name]
+    return DEFAULT_WINDOW
+
+
+def overlap(a: str, b: str, min_chars: int = MIN_OVERLAP_CHARS, max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of a that is also a prefix of b"""
+    if len(a) < min_chars or len(b) < min_chars:
+        return 0
+    head = b[:min_chars]
+    best = 0
+    start = a.find(head, max(0, len(a) - max_chars))
+    while start != -1:
+        size = len(a) - start
+        if b.startswith(a[start:]):
+            best = size
+            break  # earlier starts are longer, so the first match is the longest
+        start = a.find(head, start + 1)
+    return best
+
+
+def strip_overlap(text: str, kept: Sequence[str], min_chars: int = MIN_OVERLAP_CHARS) -> str:
+    """text without what it repeats of already kept chunks: full containment or an overlap at either end"""
+    for other in kept:
+        if text in other:
+            return ""
+        head = overlap(other, text, min_chars)
+        if head:
+            text = text[head:]
+        tail = overlap(text, other, min_chars)
+        if tail:
+            text = text[:-tail]
+    return text.strip()
+
+
+def truncate_to_tokens(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Longest leading part of text within budget tokens, cut at a word boundary"""
+    if count(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    return cut[:space] if space > len(cut) // 2 else cut
+
+
+class CrossEncoderReranker:
+    """Scores (query, chunk) pairs with a small cross-encoder, loaded on first use"""
+
+    def __init__(self, model_name: str = RERANK_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        if len(docs) < 2:
+            return docs
+        scores = self.model.predict([(query, d.page_content) for d in docs])
+        order = sorted(range(len(docs)), key=lambda i: float(scores[i]), reverse=True)
+        return [docs[i] for i in order]
+
+
+class AssembledContext(NamedTuple):
+    text: str
+    docs: List[Document]
+    tokens: int
+    # Candidates left out for duplication, the chunk cap or the budget
+    dropped: int
+    truncated: bool
+
+
+class PromptAssembler:
+    """Packs retrieved chunks into a token budget: rerank, drop repeated text, most relevant first"""
+
+    def __init__(
+        self,
+        count: Callable[[str], int],
+        reranker: Optional[CrossEncoderReranker] = None,
+        max_chunks: int = PROMPT_MAX_CHUNKS,
+        min_chunk_tokens: int = MIN_CHUNK_TOKENS,
+    ):
+        self.count = count
+        self.reranker = reranker
+        self.max_chunks = max_chunks
+        self.min_chunk_tokens = min_chunk_tokens
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.truncations = 0
+        self.dropped = 0
+        self.overlap_chars = 0
+        self.rerank_time = 0.0
+
+    def assemble(self, query: str, docs: List[Document], budget: int) -> AssembledContext:
+        """docs in retrieval order; budget is the tokens left for context in the prompt"""
+        rerank_time = 0.0
+        if self.reranker is not None:
+            start = time.time()
+            docs = self.reranker.rerank(query, docs)
+            rerank_time = time.time() - start
+
+        kept: List[Document] = []
+        used, truncated, removed = 0, False, 0
+        sep = self.count(SEPARATOR)
+        for doc in docs:
+            if len(kept) == self.max_chunks:
+                break
+            text = strip_overlap(doc.page_content.strip(), [d.page_content for d in kept])
+            removed += len(doc.page_content.strip()) - len(text)
+            if not text:
+                continue
+            cost = self.count(text) + (sep if kept else 0)
+            room = budget - used
+            if cost > room:
+                room -= sep if kept else 0
+                if room < self.min_chunk_tokens:
+                    break
+                text = truncate_to_tokens(text, room, self.count)
+                cost = self.count(text) + (sep if kept else 0)
+                truncated = True
+            kept.append(Document(page_content=text, metadata=doc.metadata))
+            used += cost
+            if truncated:
+                break
+
+        dropped = len(docs) - len(kept)
+        with self._lock:
+            self.calls += 1
+            self.truncations += int(truncated)
+            self.dropped += dropped
+            self.overlap_chars += removed
+            self.rerank_time += rerank_time
+        return AssembledContext(SEPARATOR.join(d.page_content for d in kept), kept, used, dropped, truncated)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "reranker": self.reranker.model_name if self.reranker else None,
+                "max_chunks": self.max_chunks,
+                "truncations": self.truncations,
+                "dropped_chunks": self.dropped,
+                "overlap_chars_removed": self.overlap_chars,
+                "avg_rerank_ms": self.rerank_time / self.calls * 1000 if self.calls else 0.0,
+            }
+
+
+class AssembledRetriever(BaseRetriever):
+    """Retriever that hands a chain the assembled chunks instead of the raw top k"""
+
+    retriever: Any
+    assembler: Any
+    budget: int
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self.retriever.invoke(query)
+        return self.assembler.assemble(query, docs, self.budget).docs
+
+
+_reranker: Optional[CrossEncoderReranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """Process-wide reranker, or None when RERANK_MODEL is unset"""
+    global _reranker
+    if not RERANK_MODEL:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker(RERANK_MODEL)
+    return _reranker
+
+
+def retrieval_k(default: int) -> int:
+    """Candidates to retrieve: more when a reranker picks among them"""
+    return max(default, RERANK_FETCH_K) if RERANK_MODEL else default
@@ -0,0 +1,254 @@
+# backend/sessions.py
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from token_count import count_tokens
+
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "10"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "256"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "96"))
+# Write sessions evicted from memory to the chat_sessions table and reload them on return
+SESSION_SPILL = os.getenv("SESSION_SPILL", "0") == "1"
+# Fold turns that fall out of the ring buffer into a running summary
+SESSION_SUMMARIZE = os.getenv("SESSION_SUMMARIZE", "0") == "1"
+
+Turn = Tuple[str, str]
+Summarizer = Callable[[str, List[Turn]], str]
+
+
+def session_key(bot: str, session_id: str) -> str:
+    """Store key for a caller's session id, scoped by bot so it can't read another bot's conversation"""
+    return f"{bot}:{session_id}"
+
+
+class _Session:
+    __slots__ = ("turns", "summary", "touched")
+
+    def __init__(self, max_turns: int, turns=(), summary: str = "", touched: Optional[float] = None):
+        self.turns: Deque[Turn] = deque(turns, maxlen=max_turns)
+        self.summary = summary
+        self.touched = touched or time.time()
+
+
+class SqlSessionSpill:
+    """chat_sessions table as the second tier behind the in-memory store"""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def save(self, items: List[Tuple[str, "_Session"]]) -> None:
+        from models import ChatSession
+
+        db = self.session_factory()
+        try:
+            for session_id, session in items:
+                db.merge(ChatSession(
+                    id=session_id,
+                    turns=json.dumps(list(session.turns)),
+                    summary=session.summary,
+                    updated_at=datetime.utcfromtimestamp(session.touched),
+                ))
+            db.commit()
+        finally:
+            db.close()
+
+    def load(self, session_id: str, ttl: float) -> Optional[Tuple[List[Turn], str, float]]:
+        from models import ChatSession
+
+        db = self.session_factory()
+        try:
+            row = db.query(ChatSession).filter(
+                ChatSession.id == session_id,
+                ChatSession.updated_at >= datetime.utcnow() - timedelta(seconds=ttl),
+            ).first()
+            if row is None:
+                return None
+            touched = (row.updated_at - datetime(1970, 1, 1)).total_seconds()
+            return [tuple(t) for t in json.loads(row.turns or "[]")], row.summary or "", touched
+        finally:
+            db.close()
+
+
+class SessionStore:
+    """Per-conversation chat history: a ring buffer of turns per session, LRU + TTL across sessions"""
+
+    def __init__(
+        self,
+        max_turns: int = SESSION_MAX_TURNS,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        ttl: float = SESSION_TTL,
+        spill: Optional[SqlSessionSpill] = None,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill = spill
+        self.summarizer = summarizer
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.spilled = 0
+        self.restored = 0
+        self.summaries = 0
+
+    def _get(self, session_id: str) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is not None and time.time() - session.touched >= self.ttl:
+            del self._sessions[session_id]
+            self.expirations += 1
+            return None
+        return session
+
+    def _restore(self, session_id: str) -> None:
+        """Bring a spilled session back into memory; database I/O happens outside the lock"""
+        if self.spill is None:
+            return
+        with self._lock:
+            if self._get(session_id) is not None:
+                return
+        stored = self.spill.load(session_id, self.ttl)
+        if stored is None:
+            return
+        turns, summary, touched = stored
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = _Session(self.max_turns, turns, summary, touched)
+                self.restored += 1
+                evicted = self._evict()
+            else:
+                evicted = []
+        self._save(evicted)
+
+    def _evict(self) -> List[Tuple[str, _Session]]:
+        evicted = []
+        while len(self._sessions) > self.max_sessions:
+            evicted.append(self._sessions.popitem(last=False))
+            self.evictions += 1
+        return evicted
+
+    def _save(self, evicted: List[Tuple[str, _Session]]) -> None:
+        if self.spill is None or not evicted:
+            return
+        try:
+            self.spill.save(evicted)
+            self.spilled += len(evicted)
+        except Exception as e:
+            print(f"Failed to spill {len(evicted)} chat sessions: {str(e)}")
+
+    def get(self, session_id: str) -> Tuple[str, List[Turn]]:
+        """(summary, turns oldest first) for a session"""
+        self._restore(session_id)
+        with self._lock:
+            session = self._get(session_id)
+            return (session.summary, list(session.turns)) if session else ("", [])
+
+    def history(self, session_id: str) -> List[Turn]:
+        """(question, answer) turns, oldest first"""
+        return self.get(session_id)[1]
+
+    def append(self, session_id: str, question: str, answer: str) -> None:
+        self._restore(session_id)
+        with self._lock:
+            session = self._get(session_id)
+            evicted = []
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_turns)
+                evicted = self._evict()
+            dropped = session.turns[0] if len(session.turns) == self.max_turns else None
+            session.turns.append((question, answer))
+            session.touched = time.time()
+            self._sessions.move_to_end(session_id)
+            summary = session.summary
+        self._save(evicted)
+
+        if dropped is not None and self.summarizer is not None:
+            # Runs outside the lock; a concurrent turn may briefly see the old summary
+            try:
+                summary = self.summarizer(summary, [dropped])
+            except Exception as e:
+                print(f"Session summarization failed: {str(e)}")
+                return
+            with self._lock:
+                session.summary = summary
+                self.summaries += 1
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def flush(self) -> None:
+        """Spill every live session, e.g. on shutdown"""
+        with self._lock:
+            items = list(self._sessions.items())
+        self._save(items)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+                "ttl": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "spill": self.spill is not None,
+                "spilled": self.spilled,
+                "restored": self.restored,
+                "summaries": self.summaries,
+            }
+
+
+def format_turn(turn: Turn) -> str:
+    return f"User: {turn[0]}\nAssistant: {turn[1]}"
+
+
+def pack_history(summary: str, turns: List[Turn], budget: int = SESSION_HISTORY_TOKENS,
+                 count: Callable[[str], int] = count_tokens) -> Tuple[str, List[Turn]]:
+    """Newest turns (and the summary, first) that fit in budget tokens"""
+    used = 0
+    if summary:
+        used = count(summary)
+        if used > budget:
+            summary, used = "", 0
+    kept: List[Turn] = []
+    for turn in reversed(turns):
+        cost = count(format_turn(turn)) + 1
+        if used + cost > budget:
+            break
+        kept.append(turn)
+        used += cost
+    kept.reverse()
+    return summary, kept
+
+
+def format_history(summary: str, turns: List[Turn]) -> str:
+    parts = [f"Summary of earlier conversation: {summary}"] if summary else []
+    parts.extend(format_turn(t) for t in turns)
+    return "\n".join(parts)
+
+
+def llm_summarizer(complete: Callable[[str], str], max_tokens: int = SESSION_SUMMARY_TOKENS,
+                   count: Callable[[str], int] = count_tokens) -> Summarizer:
+    """Rolling summarizer: asks the model to fold old turns into the running summary"""
+    def summarize(summary: str, turns: List[Turn]) -> str:
+        prompt = (
+            "Summarize this conversation in one or two sentences, keeping names, products and facts.\n\n"
+            + (f"Summary so far: {summary}\n" if summary else "")
+            + "\n".join(format_turn(t) for t in turns)
+            + "\n\nSummary:"
+        )
+        text = " ".join(complete(prompt).split())
+        # Keep the summary's share of the prompt constant
+        while text and count(text) > max_tokens:
+            text = text[: int(len(text) * 0.8)]
+        return text
+    return summarize
@@ -0,0 +1,486 @@
+# backend/sharded_index.py
+import copy
+import fcntl
+import json
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+SHARD_DIR = os.getenv("SHARD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes", "shards"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "16"))
+# Bots up to this many chunks are searched exactly over their contiguous rows
+SHARD_SMALL_BOT_CHUNKS = int(os.getenv("SHARD_SMALL_BOT_CHUNKS", "512"))
+SHARD_NLIST = int(os.getenv("SHARD_NLIST", "256"))
+SHARD_NPROBE = int(os.getenv("SHARD_NPROBE", "16"))
+# Syncs of one bot run one at a time; bots are hashed onto this many lock files per shard
+SHARD_SYNC_LOCKS = int(os.getenv("SHARD_SYNC_LOCKS", "64"))
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+IVF_FILE = "ivf.faiss"
+# The manifest's generation as 8 bytes, rewritten in place after every write, so readers
+# can check for changes with one small read instead of parsing the manifest
+GENERATION_FILE = "generation"
+
+# id = slot << 32 | chunk offset, so each bot owns one contiguous id range
+_OFFSET_BITS = 32
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+
+def _slot_range(slot: int) -> Tuple[int, int]:
+    return slot << _OFFSET_BITS, (slot + 1) << _OFFSET_BITS
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _memmap(path: str, dtype, shape) -> Optional[np.ndarray]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0 or shape[0] == 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class _Column:
+    """Append-only variable-length byte column: a data blob plus an int64 end-offset per row"""
+
+    def __init__(self, prefix: str):
+        self.data_path = prefix + ".bin"
+        self.offsets_path = prefix + ".off"
+        self._data = None
+        self._offsets = None
+
+    def remap(self, rows: int) -> None:
+        self._offsets = _memmap(self.offsets_path, np.int64, (rows,))
+        size = int(self._offsets[-1]) if self._offsets is not None else 0
+        self._data = _memmap(self.data_path, np.uint8, (size,))
+
+    def append(self, values: Iterable[bytes]) -> None:
+        end = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        offsets = []
+        with open(self.data_path, "ab") as f:
+            for value in values:
+                f.write(value)
+                end += len(value)
+                offsets.append(end)
+        with open(self.offsets_path, "ab") as f:
+            f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+
+    def get(self, row: int) -> bytes:
+        start = int(self._offsets[row - 1]) if row else 0
+        return bytes(self._data[start:int(self._offsets[row])])
+
+    def span_bytes(self, start: int, count: int) -> int:
+        if not count:
+            return 0
+        begin = int(self._offsets[start - 1]) if start else 0
+        return int(self._offsets[start + count - 1]) - begin
+
+
+class _Shard:
+    """Vectors, chunk text and metadata of many bots in flat mmap'd files, plus one IVF index over large bots"""
+
+    def __init__(self, path: str, small_bot: int = SHARD_SMALL_BOT_CHUNKS,
+                 nlist: int = SHARD_NLIST, nprobe: int = SHARD_NPROBE):
+        self.path = path
+        self.small_bot = small_bot
+        self.nlist = nlist
+        self.nprobe = nprobe
+        os.makedirs(path, exist_ok=True)
+        self.texts = _Column(os.path.join(path, "texts"))
+        self.metas = _Column(os.path.join(path, "meta"))
+        self._lock = threading.RLock()
+        self._generation: Optional[int] = None
+        self._ivf_signature = None
+        self._exclusive = False  # this thread holds LOCK_EX inside _writing()
+        self.manifest: Dict[str, Any] = {}
+        self.vectors = None
+        self.ivf = None
+        self._reload()
+
+    # -- state -----------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _disk_generation(self) -> int:
+        try:
+            with open(self._file(GENERATION_FILE), "rb") as f:
+                data = f.read(8)
+        except FileNotFoundError:
+            return 0
+        return int.from_bytes(data, "little") if len(data) == 8 else -1
+
+    def _reload(self) -> None:
+        """Pick up writes made by this or another process"""
+        if self._exclusive or (self._generation is not None and self._disk_generation() == self._generation):
+            return
+        # Writers hold LOCK_EX from their first file change to the generation bump, so
+        # under LOCK_SH the manifest and the files it describes always match
+        with self._flock(fcntl.LOCK_SH):
+            self._load()
+
+    def _load(self) -> None:
+        """Read the manifest and map its files; the caller holds the shard's file lock"""
+        manifest_path = self._file(MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"dim": None, "rows": 0, "next_slot": 0, "garbage": 0, "bots": {}, "generation": 0}
+        self._generation = self.manifest.get("generation", 0)
+
+        rows, dim = self.manifest["rows"], self.manifest["dim"]
+        self.vectors = _memmap(self._file(VECTORS_FILE), np.float32, (rows, dim)) if dim else None
+        self.texts.remap(rows)
+        self.metas.remap(rows)
+
+        ivf_path = self._file(IVF_FILE)
+        signature = _file_signature(ivf_path)
+        if signature != self._ivf_signature:
+            self.ivf = faiss.read_index(ivf_path) if signature is not None else None
+            self._ivf_signature = signature
+
+    @contextmanager
+    def _flock(self, mode: int):
+        with open(self._file(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        """Serialize writers across threads and processes"""
+        with self._lock:
+            with self._flock(fcntl.LOCK_EX):
+                self._exclusive = True
+                try:
+                    self._load()
+                    yield
+                finally:
+                    self._exclusive = False
+
+    def _save_manifest(self) -> None:
+        """Publish a write: the manifest, then the generation readers poll. Written last, under LOCK_EX"""
+        self.manifest["generation"] = self.manifest.get("generation", 0) + 1
+        tmp = self._file(MANIFEST_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._file(MANIFEST_FILE))
+        fd = os.open(self._file(GENERATION_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, self.manifest["generation"].to_bytes(8, "little"), 0)
+        finally:
+            os.close(fd)
+
+    def _save_ivf(self) -> None:
+        tmp = self._file(IVF_FILE + ".tmp")
+        faiss.write_index(self.ivf, tmp)
+        os.replace(tmp, self._file(IVF_FILE))
+
+    # -- reads -----------------------------------------------------------
+
+    def bot(self, api_key: str) -> Optional[Dict[str, int]]:
+        with self._lock:
+            self._reload()
+            return self.manifest["bots"].get(api_key)
+
+    def rows(self, api_key: str, with_vectors: bool = False) -> List[Dict[str, Any]]:
+        """Every chunk of a bot in offset order, optionally with a copy of its vector"""
+        with self._lock:
+            self._reload()
+            bot = self.manifest["bots"].get(api_key)
+            if not bot:
+                return []
+            rows = [self._row(bot, i, self.texts, self.metas) for i in range(bot["count"])]
+            if with_vectors:
+                for r in rows:
+                    r["vector"] = np.array(self.vectors[r["row"]])
+            return rows
+
+    @staticmethod
+    def _row(bot: Dict[str, int], offset: int, texts: _Column, metas: _Column) -> Dict[str, Any]:
+        row = bot["start"] + offset
+        return {
+            "id": (bot["slot"] << _OFFSET_BITS) | offset,
+            "text": texts.get(row).decode("utf-8"),
+            "metadata": json.loads(metas.get(row) or b"{}"),
+            "row": row,
+        }
+
+    def search(self, api_key: str, query: np.ndarray, k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Top-k chunks of one bot by L2 distance.
+
+        Only the snapshot is taken under the lock. Compaction replaces files rather than
+        rewriting them and writers change a copy of the IVF, so the mappings and index
+        captured here stay valid while other reads and writes go ahead.
+        """
+        with self._lock:
+            self._reload()
+            bot = self.manifest["bots"].get(api_key)
+            if not bot or not bot["count"]:
+                return []
+            vectors, ivf = self.vectors, self.ivf
+            texts, metas = copy.copy(self.texts), copy.copy(self.metas)
+
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        k = min(k, bot["count"])
+        if bot["count"] > self.small_bot and ivf is not None and ivf.is_trained:
+            lo, hi = _slot_range(bot["slot"])
+            params = faiss.SearchParametersIVF(sel=faiss.IDSelectorRange(lo, hi), nprobe=self.nprobe)
+            distances, ids = ivf.search(query[None, :], k, params=params)
+            hits = [(int(i) & _OFFSET_MASK, float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+        else:
+            # Same squared-L2 ranking as the per-bot IndexFlatL2 it replaces
+            block = vectors[bot["start"]:bot["start"] + bot["count"]]
+            distances = ((block - query) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind="stable")[:k]
+            hits = [(int(i), float(distances[i])) for i in order]
+        return [(self._row(bot, offset, texts, metas), d) for offset, d in hits]
+
+    def nbytes(self, api_key: str) -> int:
+        with self._lock:
+            bot = self.manifest["bots"].get(api_key)
+            if not bot or not self.manifest["dim"]:
+                return 0
+            return bot["count"] * self.manifest["dim"] * 4 + self.texts.span_bytes(bot["start"], bot["count"])
+
+    # -- writes ----------------------------------------------------------
+
+    def write_bot(self, api_key: str, vectors: np.ndarray, texts: List[str], metadatas: List[Dict]) -> None:
+        """Replace a bot's chunks: append new rows under a fresh slot and retire the old ones"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._writing():
+            m = self.manifest
+            if m["dim"] is None:
+                m["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != m["dim"]:
+                raise ValueError(f"Vector dim {vectors.shape[1]} does not match shard dim {m['dim']}")
+
+            start = m["rows"]
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+            self.texts.append(t.encode("utf-8") for t in texts)
+            self.metas.append(json.dumps(meta or {}).encode("utf-8") for meta in metadatas)
+
+            old = m["bots"].get(api_key)
+            slot = m["next_slot"]
+            m["next_slot"] += 1
+            m["rows"] += len(texts)
+            m["bots"][api_key] = {"slot": slot, "start": start, "count": len(texts)}
+            if old:
+                m["garbage"] += old["count"]
+
+            ivf_dirty = False
+            if self.ivf is not None and (len(texts) > self.small_bot or (old and old["count"] > self.small_bot)):
+                self._detach_ivf()
+            if old and self.ivf is not None and old["count"] > self.small_bot:
+                self.ivf.remove_ids(faiss.IDSelectorRange(*_slot_range(old["slot"])))
+                ivf_dirty = True
+            if len(texts) > self.small_bot:
+                ivf_dirty |= self._index_large_bot(slot, vectors)
+
+            if ivf_dirty:
+                self._save_ivf()
+            self._save_manifest()
+            self._load()
+            if m["garbage"] > m["rows"] // 2:
+                self._compact()
+
+    def remove_bot(self, api_key: str) -> None:
+        with self._writing():
+            old = self.manifest["bots"].pop(api_key, None)
+            if not old:
+                return
+            self.manifest["garbage"] += old["count"]
+            if self.ivf is not None and old["count"] > self.small_bot:
+                self._detach_ivf()
+                self.ivf.remove_ids(faiss.IDSelectorRange(*_slot_range(old["slot"])))
+                self._save_ivf()
+            self._save_manifest()
+            self._load()
+
+    def _detach_ivf(self) -> None:
+        """Searches use self.ivf outside the lock, so writers change a copy and swap it in"""
+        self.ivf = faiss.clone_index(self.ivf)
+
+    def _index_large_bot(self, slot: int, vectors: np.ndarray) -> bool:
+        """Add a large bot to the shard's IVF, training it first if needed"""
+        if self.ivf is None:
+            # Train on a sample of what the shard holds so far; IVF needs ~39 points per list
+            sample = vectors
+            if self.vectors is not None:
+                sample = np.vstack([self.vectors, vectors])
+            if len(sample) > self.nlist * 256:
+                picks = np.random.default_rng(0).choice(len(sample), self.nlist * 256, replace=False)
+                sample = sample[np.sort(picks)]
+            nlist = max(1, min(self.nlist, len(sample) // 39))
+            quantizer = faiss.IndexFlatL2(self.manifest["dim"])
+            self.ivf = faiss.IndexIVFFlat(quantizer, self.manifest["dim"], nlist, faiss.METRIC_L2)
+            self.ivf.train(sample)
+        lo, _ = _slot_range(slot)
+        self.ivf.add_with_ids(vectors, np.arange(lo, lo + len(vectors), dtype=np.int64))
+        return True
+
+    def _compact(self) -> None:
+        """Rewrite live rows contiguously; ids keep their slot so the IVF needs no change"""
+        m = self.manifest
+        bots = sorted(m["bots"].items(), key=lambda kv: kv[1]["start"])
+        tmp_vectors = self._file(VECTORS_FILE + ".tmp")
+        texts = _Column(os.path.join(self.path, "texts.tmp"))
+        metas = _Column(os.path.join(self.path, "meta.tmp"))
+        for path in (tmp_vectors, texts.data_path, texts.offsets_path, metas.data_path, metas.offsets_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        new_bots, row = {}, 0
+        with open(tmp_vectors, "wb") as f:
+            for api_key, bot in bots:
+                span = range(bot["start"], bot["start"] + bot["count"])
+                f.write(np.ascontiguousarray(self.vectors[bot["start"]:bot["start"] + bot["count"]]).tobytes())
+                texts.append(self.texts.get(r) for r in span)
+                metas.append(self.metas.get(r) for r in span)
+                new_bots[api_key] = {"slot": bot["slot"], "start": row, "count": bot["count"]}
+                row += bot["count"]
+
+        os.replace(tmp_vectors, self._file(VECTORS_FILE))
+        os.replace(texts.data_path, self.texts.data_path)
+        os.replace(texts.offsets_path, self.texts.offsets_path)
+        os.replace(metas.data_path, self.metas.data_path)
+        os.replace(metas.offsets_path, self.metas.offsets_path)
+        m.update(rows=row, garbage=0, bots=new_bots)
+        self._save_manifest()
+        self._load()
+
+
+class ShardedBotStore(VectorStore):
+    """LangChain view of one bot's chunks inside a shared shard"""
+
+    def __init__(self, shard: _Shard, api_key: str, embedding):
+        self.shard = shard
+        self.api_key = api_key
+        self._embedding = embedding
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    @property
+    def nbytes(self) -> int:
+        return self.shard.nbytes(self.api_key)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any):
+        return [
+            (Document(page_content=row["text"], metadata=row["metadata"]), score)
+            for row, score in self.shard.search(self.api_key, np.asarray(embedding, dtype=np.float32), k)
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("Write through ShardedIndex.sync()")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Write through ShardedIndex.sync()")
+
+
+class ShardedIndex:
+    """Tenant-sharded replacement for IndexStore: bots are hashed onto SHARD_COUNT shared shards"""
+
+    def __init__(self, root: str = SHARD_DIR, n_shards: int = SHARD_COUNT):
+        self.root = root
+        self.n_shards = n_shards
+        self._shards: Dict[int, _Shard] = {}
+        self._lock = threading.Lock()
+
+    def shard_for(self, api_key: str) -> _Shard:
+        number = zlib.crc32(api_key.encode("utf-8")) % self.n_shards
+        with self._lock:
+            if number not in self._shards:
+                self._shards[number] = _Shard(os.path.join(self.root, f"shard_{number:03d}"))
+            return self._shards[number]
+
+    def exists(self, api_key: str) -> bool:
+        return self.shard_for(api_key).bot(api_key) is not None
+
+    def version(self, api_key: str) -> Optional[str]:
+        """A bot's slot, which every write_bot replaces and compaction keeps"""
+        bot = self.shard_for(api_key).bot(api_key)
+        return str(bot["slot"]) if bot else None
+
+    def load_chunks(self, api_key: str) -> List[Dict[str, Any]]:
+        return [{"text": r["text"], "metadata": r["metadata"]} for r in self.shard_for(api_key).rows(api_key)]
+
+    @contextmanager
+    def locked(self, api_key: str):
+        """Exclusive per-bot lock across threads and processes, held for a whole sync"""
+        shard = self.shard_for(api_key)
+        bucket = zlib.crc32(api_key.encode("utf-8")) % SHARD_SYNC_LOCKS
+        path = os.path.join(shard.path, "locks")
+        os.makedirs(path, exist_ok=True)
+        # flock is per open file, so threads of one process exclude each other too
+        with open(os.path.join(path, f"{bucket:03d}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield shard
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def sync(self, api_key: str, chunks: List[Dict[str, Any]], embeddings) -> Dict[str, int]:
+        """Store exactly these chunks for a bot, reusing stored vectors of unchanged chunk texts"""
+        from index_store import chunk_id
+
+        wanted: Dict[int, Dict[str, Any]] = {}
+        for c in chunks:
+            wanted.setdefault(chunk_id(c["text"]), c)
+        if not wanted:
+            raise ValueError("No chunks to index")
+
+        with self.locked(api_key) as shard:
+            return self._sync(shard, api_key, wanted, embeddings)
+
+    def _sync(self, shard: _Shard, api_key: str, wanted: Dict[int, Dict[str, Any]], embeddings) -> Dict[str, int]:
+        from index_store import chunk_id
+
+        stored = {chunk_id(r["text"]): r["vector"] for r in shard.rows(api_key, with_vectors=True)}
+        added = [i for i in wanted if i not in stored]
+
+        if added:
+            computed = embeddings.embed_documents([wanted[i]["text"] for i in added])
+            stored.update(zip(added, np.asarray(computed, dtype=np.float32)))
+        vectors = np.vstack([stored[i] for i in wanted])
+        shard.write_bot(
+            api_key,
+            vectors,
+            [c["text"] for c in wanted.values()],
+            [c.get("metadata") or {} for c in wanted.values()],
+        )
+        removed = len(stored) - len(wanted)
+        return {"added": len(added), "removed": removed, "kept": len(wanted) - len(added)}
+
+    def load(self, api_key: str, embeddings, mmap: bool = True, version: Optional[str] = None) -> ShardedBotStore:
+        # version is accepted for IndexStore compatibility; a bot's rows are always read live
+        if not self.exists(api_key):
+            raise ValueError(f"No sharded index for {api_key}")
+        return ShardedBotStore(self.shard_for(api_key), api_key, embeddings)
+
+    def delete(self, api_key: str) -> None:
+        self.shard_for(api_key).remove_bot(api_key)
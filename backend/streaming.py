@@ -0,0 +1,78 @@
+# backend/streaming.py
+import asyncio
+import json
+from typing import Optional, Sequence
+
+MAX_RESPONSE_CHARS = 500
+# Text GPT-2 tends to produce once it starts inventing the next Q/A pair
+STOP_MARKERS = ("Answer:", "Question:", "Context:")
+
+
+class AsyncSSEStreamer:
+    """Pushes text deltas from a generation thread onto an asyncio queue, stopping at the length cap or prompt artifacts"""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        max_chars: int = MAX_RESPONSE_CHARS,
+        stop_markers: Sequence[str] = STOP_MARKERS,
+    ):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        self.max_chars = max_chars
+        self.stop_markers = stop_markers
+        self.text = ""
+        self.stopped = False
+        self.truncated = False
+        self._closed = False
+
+    def push(self, text: str) -> None:
+        """Add a delta from the backend; the producer should stop once self.stopped is set"""
+        if not self.text:
+            # The answer is stripped in the end, so leading whitespace doesn't count toward the cap
+            text = text.lstrip()
+        if not self.stopped and text:
+            candidate = self.text + text
+            for marker in self.stop_markers:
+                pos = candidate.find(marker)
+                if pos != -1:
+                    candidate = candidate[:pos]
+                    self.stopped = True
+            # Same comparison as clip_response: an answer of exactly max_chars is not truncated
+            if len(candidate) > self.max_chars:
+                candidate = candidate[:self.max_chars]
+                self.stopped = True
+                self.truncated = True
+
+            delta = candidate[len(self.text):]
+            self.text = candidate
+            if delta:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, delta)
+
+    def cancel(self) -> None:
+        """The client went away: make the producer stop at its next check"""
+        self.stopped = True
+
+    def close(self) -> None:
+        """Signal the consumer that no more text is coming; safe to call twice"""
+        if not self._closed:
+            self._closed = True
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    async def __aiter__(self):
+        while True:
+            delta = await self.queue.get()
+            if delta is None:
+                return
+            yield delta
+
+
+def clip_response(text: str, max_chars: int = MAX_RESPONSE_CHARS) -> str:
+    """Cut a finished answer to the length cap the way a truncated stream ends"""
+    return text[:max_chars].rstrip() + "..." if len(text) > max_chars else text
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
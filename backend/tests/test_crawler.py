@@ -0,0 +1,198 @@
+# backend/tests/test_crawler.py
+"""SiteCrawler against a small site served on localhost.
+
+Run: python -m pytest tests/test_crawler.py (or python -m unittest discover tests)
+
+The site is served on 127.0.0.1; redirects to "localhost" on the same port count as
+another host, which is how off-site redirects and cross-domain sitemaps are exercised.
+"""
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import crawl_site  # noqa: E402
+
+
+def page(title, *links):
+    anchors = "".join(f'<a href="{href}">{href}</a>' for href in links)
+    return f"<html><head><title>{title}</title></head><body><p>{title} page</p>{anchors}</body></html>"
+
+
+class FixtureSite:
+    """Routes path -> (status, headers, body); records every path requested per host"""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                host = self.headers.get("Host", "").split(":")[0]
+                site.requests.append((host, self.path))
+                status, headers, body = site.routes.get((host, self.path)) or site.routes.get(
+                    ("*", self.path), (404, {}, b"not found")
+                )
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path, host="127.0.0.1"):
+        return f"http://{host}:{self.port}{path}"
+
+    def html(self, path, body, host="*"):
+        self.routes[(host, path)] = (200, {"Content-Type": "text/html; charset=utf-8"}, body.encode("utf-8"))
+
+    def redirect(self, path, location, host="*"):
+        self.routes[(host, path)] = (302, {"Location": location}, b"")
+
+    def text(self, path, body, content_type="text/plain", host="*"):
+        self.routes[(host, path)] = (200, {"Content-Type": content_type}, body.encode("utf-8"))
+
+    def requested(self, path, host="127.0.0.1"):
+        return (host, path) in self.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CrawlerTest(unittest.TestCase):
+    def setUp(self):
+        self.site = FixtureSite().__enter__()
+        self.addCleanup(self.site.__exit__)
+
+    def crawl(self, **kwargs):
+        return crawl_site(self.site.url("/"), per_host_concurrency=2, timeout=5, **kwargs)
+
+    def paths(self, pages):
+        return sorted(p.url.split(str(self.site.port), 1)[1] for p in pages)
+
+    def test_follows_links_within_depth(self):
+        s = self.site
+        s.html("/", page("home", "/a", "/logo.png"))
+        s.html("/a", page("a", "/b"))
+        s.html("/b", page("b", "/c"))
+        s.html("/c", page("c"))
+
+        pages = self.crawl(max_depth=2)
+        self.assertEqual(self.paths(pages), ["/", "/a", "/b"])
+        self.assertFalse(s.requested("/c"))
+        self.assertFalse(s.requested("/logo.png"))
+
+    def test_page_budget(self):
+        s = self.site
+        s.html("/", page("home", *[f"/p{i}" for i in range(10)]))
+        for i in range(10):
+            s.html(f"/p{i}", page(f"p{i}"))
+
+        self.assertEqual(len(self.crawl(max_pages=3)), 3)
+
+    def test_byte_budget_caps_a_single_large_response(self):
+        s = self.site
+        s.html("/", page("home", "/big", "/after"))
+        s.html("/big", page("big") + "x" * 1_000_000)
+        s.html("/after", page("after"))
+
+        pages = self.crawl(max_bytes=20_000)
+        self.assertLessEqual(sum(len(p.html.encode("utf-8")) for p in pages), 20_000)
+
+    def test_robots_disallow(self):
+        s = self.site
+        s.text("/robots.txt", "User-agent: *\nDisallow: /private\n")
+        s.html("/", page("home", "/public", "/private/secret"))
+        s.html("/public", page("public"))
+        s.html("/private/secret", page("secret"))
+
+        self.assertEqual(self.paths(self.crawl()), ["/", "/public"])
+        self.assertFalse(s.requested("/private/secret"))
+
+    def test_sitemap_urls_are_crawled(self):
+        s = self.site
+        s.text("/robots.txt", f"User-agent: *\nSitemap: {s.url('/sitemap.xml')}\n")
+        s.text("/sitemap.xml", (
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f"<url><loc>{s.url('/orphan')}</loc></url></urlset>"
+        ), content_type="application/xml")
+        s.html("/", page("home"))
+        s.html("/orphan", page("orphan"))
+
+        self.assertEqual(self.paths(self.crawl()), ["/", "/orphan"])
+
+    def test_cross_domain_sitemap_is_not_fetched(self):
+        s = self.site
+        s.text("/robots.txt", f"User-agent: *\nSitemap: {s.url('/sitemap.xml', host='localhost')}\n")
+        s.html("/", page("home"))
+
+        self.crawl()
+        self.assertFalse(s.requested("/sitemap.xml", host="localhost"))
+
+    def test_same_site_redirect_is_stored_under_final_url(self):
+        s = self.site
+        s.html("/", page("home", "/moved"))
+        s.redirect("/moved", s.url("/target"))
+        s.html("/target", page("target", "/from-target"))
+        s.html("/from-target", page("from target"))
+
+        self.assertEqual(self.paths(self.crawl()), ["/", "/from-target", "/target"])
+
+    def test_off_site_redirect_is_dropped(self):
+        s = self.site
+        s.html("/", page("home", "/leave"))
+        s.redirect("/leave", s.url("/elsewhere", host="localhost"))
+        s.html("/elsewhere", page("elsewhere", "/beyond"), host="localhost")
+        s.html("/beyond", page("beyond"), host="localhost")
+
+        pages = self.crawl()
+        self.assertEqual(self.paths(pages), ["/"])
+        self.assertTrue(s.requested("/leave"))
+        self.assertFalse(s.requested("/elsewhere", host="localhost"))
+        self.assertFalse(s.requested("/beyond", host="localhost"))
+        self.assertFalse(s.requested("/beyond"))
+
+    def test_redirect_into_disallowed_path_is_not_requested(self):
+        s = self.site
+        s.text("/robots.txt", "User-agent: *\nDisallow: /private\n")
+        s.html("/", page("home", "/moved"))
+        s.redirect("/moved", s.url("/private/secret"))
+        s.html("/private/secret", page("secret"))
+
+        self.assertEqual(self.paths(self.crawl()), ["/"])
+        self.assertFalse(s.requested("/private/secret"))
+
+    def test_byte_budget_caps_sitemaps(self):
+        s = self.site
+        s.text("/robots.txt", f"User-agent: *\nSitemap: {s.url('/sitemap.xml')}\n")
+        urls = "".join(f"<url><loc>{s.url(f'/p{i}')}</loc></url>" for i in range(100_000))
+        s.text("/sitemap.xml", (
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f"<url><loc>{s.url('/orphan')}</loc></url>{urls}</urlset>"
+        ), content_type="application/xml")
+        s.html("/", page("home"))
+        s.html("/orphan", page("orphan"))
+
+        # Reading stops at the budget; the cut-off sitemap fails to parse and contributes nothing
+        self.crawl(max_bytes=20_000)
+        self.assertFalse(s.requested("/orphan"))
+
+
+if __name__ == "__main__":
+    unittest.main()
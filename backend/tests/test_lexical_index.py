@@ -0,0 +1,58 @@
+# backend/tests/test_lexical_index.py
+"""BM25 index and the identifier fast path.
+
+Run: python -m pytest tests/test_lexical_index.py (or python -m unittest discover tests)
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex, is_identifier, tokenize  # noqa: E402
+
+CHUNKS = [
+    {"text": "The 2 bedroom apartment rents for 1200 a month. We open at 9am on weekdays."},
+    {"text": "Part AB-123 replaces the X200 filter. Firmware v2.1 fixes the display."},
+    {"text": "Our 3rd floor studio was renovated in 2024."},
+]
+
+
+class LexicalIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex.build(CHUNKS)
+
+    def test_compound_tokens_keep_their_parts(self):
+        self.assertEqual(tokenize("AB-123"), ["ab-123", "ab", "123"])
+
+    def test_plain_quantities_are_not_identifiers(self):
+        for token in ("2", "9am", "3rd", "2024", "1200"):
+            self.assertFalse(is_identifier(token), token)
+        for token in ("ab-123", "x200", "v2.1", "19.99"):
+            self.assertTrue(is_identifier(token), token)
+
+    def test_fast_path_skips_questions_with_numbers(self):
+        for query in (
+            "How much is the 2 bedroom apartment?",
+            "do you open at 9am?",
+            "is the 3rd floor studio renovated?",
+            "tell me about the warranty for model x200",
+        ):
+            self.assertIsNone(self.index.fast_path(query, k=2), query)
+
+    def test_fast_path_answers_identifier_queries(self):
+        for query in ("AB-123", "price of ab-123", "what about x200", "v2.1"):
+            docs = self.index.fast_path(query, k=2)
+            self.assertTrue(docs, query)
+            self.assertIn("AB-123", docs[0].page_content)
+
+    def test_fast_path_needs_the_identifier_on_this_bots_pages(self):
+        self.assertIsNone(self.index.fast_path("zz-999", k=2))
+
+    def test_round_trip(self):
+        loaded = LexicalIndex.from_dict(self.index.to_dict())
+        self.assertEqual(loaded.search("bedroom apartment", 3), self.index.search("bedroom apartment", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# backend/tests/test_sharded_index.py
+"""ShardedIndex against the per-bot flat index it replaces.
+
+Run: python -m pytest tests/test_sharded_index.py (or python -m unittest discover tests)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sharded_index import ShardedIndex  # noqa: E402
+
+DIM = 16
+
+
+def vector(text):
+    return np.random.default_rng(zlib.crc32(text.encode("utf-8"))).random(DIM, dtype=np.float32)
+
+
+class FakeEmbeddings:
+    """Deterministic vectors per text; counts how many texts were embedded"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return vector(text).tolist()
+
+
+class SlowEmbeddings(FakeEmbeddings):
+    """Slow enough that unserialized syncs would all diff against the same empty bot"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        time.sleep(0.05)
+        with self.lock:
+            return super().embed_documents(texts)
+
+
+class ShardedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.index = ShardedIndex(self.root, n_shards=2)
+
+    def chunks(self, bot, n):
+        return [{"text": f"{bot} chunk {i}", "metadata": {"i": i}} for i in range(n)]
+
+    def test_small_bot_matches_flat_index(self):
+        # Neighbours in the same shard must not leak into or reorder a bot's results
+        for bot in ("other-a", "other-b"):
+            self.index.sync(bot, self.chunks(bot, 40), FakeEmbeddings())
+        chunks = self.chunks("bot", 60)
+        self.index.sync("bot", chunks, FakeEmbeddings())
+
+        texts = [c["text"] for c in chunks]
+        flat = faiss.IndexFlatL2(DIM)
+        flat.add(np.vstack([vector(t) for t in texts]))
+        store = self.index.load("bot", FakeEmbeddings())
+        for q in range(20):
+            query = vector(f"query {q}")
+            distances, ids = flat.search(query[None, :], 5)
+            results = store.similarity_search_with_score_by_vector(query.tolist(), k=5)
+            self.assertEqual([doc.page_content for doc, _ in results], [texts[i] for i in ids[0]])
+            np.testing.assert_allclose([score for _, score in results], distances[0], rtol=1e-5)
+
+    def test_concurrent_syncs_of_one_bot_run_one_at_a_time(self):
+        chunks = self.chunks("bot", 50)
+        embeddings = SlowEmbeddings()
+        errors = []
+
+        def sync():
+            try:
+                self.index.sync("bot", chunks, embeddings)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=sync) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        # Later syncs see the first one's rows and have nothing left to embed
+        self.assertEqual(embeddings.embedded, len(chunks))
+        self.assertEqual(sorted(c["text"] for c in self.index.load_chunks("bot")), sorted(c["text"] for c in chunks))
+
+    def test_resync_embeds_only_changed_chunks(self):
+        self.index.sync("bot", self.chunks("bot", 30), FakeEmbeddings())
+        embeddings = FakeEmbeddings()
+        stats = self.index.sync("bot", self.chunks("bot", 30)[5:] + [{"text": "new chunk"}], embeddings)
+        self.assertEqual(stats, {"added": 1, "removed": 5, "kept": 25})
+        self.assertEqual(embeddings.embedded, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# backend/tests/test_streaming.py
+"""AsyncSSEStreamer against the non-streaming answer path.
+
+Run: python -m pytest tests/test_streaming.py (or python -m unittest discover tests)
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import MAX_RESPONSE_CHARS, AsyncSSEStreamer, clip_response  # noqa: E402
+
+
+def streamed(raw, step=7):
+    """Final answer of /api/chat/stream for a model that generates raw in step-sized deltas"""
+    async def run():
+        streamer = AsyncSSEStreamer(asyncio.get_running_loop())
+        for i in range(0, len(raw), step):
+            streamer.push(raw[i:i + step])
+            if streamer.stopped:
+                break
+        streamer.close()
+        sent = "".join([delta async for delta in streamer])
+        response = streamer.text.strip()
+        return sent, response + "..." if streamer.truncated else response
+
+    return asyncio.run(run())
+
+
+def non_streamed(raw):
+    """Final answer of /api/chat for the same generation"""
+    return clip_response(raw.strip())
+
+
+class StreamingTest(unittest.TestCase):
+    def test_matches_non_streaming_around_the_limit(self):
+        for length in (MAX_RESPONSE_CHARS - 1, MAX_RESPONSE_CHARS, MAX_RESPONSE_CHARS + 1, 2 * MAX_RESPONSE_CHARS):
+            # GPT-2 output usually starts with a space
+            raw = " " + ("word " * length)[:length]
+            sent, response = streamed(raw)
+            self.assertEqual(response, non_streamed(raw), length)
+            self.assertEqual(sent.strip(), response.removesuffix("..."), length)
+
+    def test_answer_of_exactly_the_limit_is_not_truncated(self):
+        raw = "x" * MAX_RESPONSE_CHARS
+        _, response = streamed(raw)
+        self.assertEqual(response, raw)
+        self.assertEqual(non_streamed(raw), raw)
+
+    def test_stops_at_prompt_artifacts(self):
+        sent, response = streamed(" The shop opens at nine.\nQuestion: and on Sundays?")
+        self.assertEqual(response, "The shop opens at nine.")
+
+
+if __name__ == "__main__":
+    unittest.main()
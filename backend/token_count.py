@@ -0,0 +1,63 @@
+# backend/token_count.py
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_TOKENIZER_MODEL = os.getenv("DEFAULT_TOKENIZER_MODEL", "gpt2")
+
+# Model name prefixes served by the OpenAI API, counted with tiktoken
+OPENAI_PREFIXES = ("gpt-", "chatgpt", "o1", "o3", "o4", "text-", "davinci", "babbage")
+
+Encoder = Callable[[str], List[int]]
+
+_encoders: Dict[str, Optional[Encoder]] = {}
+_lock = threading.Lock()
+
+
+def is_openai_model(model: str) -> bool:
+    return model.lower().startswith(OPENAI_PREFIXES)
+
+
+def register_tokenizer(model: str, tokenizer) -> None:
+    """Reuse an already loaded Hugging Face tokenizer instead of loading it again"""
+    with _lock:
+        _encoders[model] = lambda text: tokenizer.encode(text, add_special_tokens=False)
+
+
+def _load_encoder(model: str) -> Optional[Encoder]:
+    try:
+        if is_openai_model(model):
+            import tiktoken
+
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            return lambda text: encoding.encode(text, disallowed_special=())
+
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model)
+        return lambda text: tokenizer.encode(text, add_special_tokens=False)
+    except Exception as e:
+        print(f"No tokenizer for {model} ({e}); falling back to ~4 chars per token")
+        return None
+
+
+def get_encoder(model: str = DEFAULT_TOKENIZER_MODEL) -> Optional[Encoder]:
+    """Cached encode function for a model, or None when its tokenizer can't be loaded"""
+    if model not in _encoders:
+        with _lock:
+            if model not in _encoders:
+                _encoders[model] = _load_encoder(model)
+    return _encoders[model]
+
+
+def count_tokens(text: str, model: str = DEFAULT_TOKENIZER_MODEL) -> int:
+    """Exact token count for a model's tokenizer"""
+    if not text:
+        return 0
+    encode = get_encoder(model)
+    if encode is None:
+        return max(1, len(text) // 4)
+    return len(encode(text))
@@ -9,6 +9,8 @@
   const API_URL = 'http://127.0.0.1:8000/api';
   const scriptTag = document.currentScript;
   const chatbotKey = scriptTag.getAttribute('data-chatbot-key');
+  // Conversation memory lasts as long as the browser tab
+  const sessionStorageKey = 'chatbot_session_' + chatbotKey;
   const position = scriptTag.getAttribute('data-position') || 'right'; // right or left
   const theme = scriptTag.getAttribute('data-theme') || 'gradient'; // gradient, blue, purple, dark
   
@@ -329,7 +331,8 @@
         },
         body: JSON.stringify({
           message: message,
-          chatbot_api_key: chatbotKey
+          chatbot_api_key: chatbotKey,
+          session_id: sessionStorage.getItem(sessionStorageKey)
         })
       });
 
@@ -338,6 +341,9 @@
       }
 
       const data = await response.json();
+      if (data.session_id) {
+        sessionStorage.setItem(sessionStorageKey, data.session_id);
+      }
       
       // Remove typing indicator
       typingDiv.remove();